@@ -1,30 +1,191 @@
-import requests
-
-# Token de autorização (deve ser gerado previamente)
-token = "BQB9IMP-Jte5OyNDp7kWV01tqG0c2fqtWWLl1HDw6faQLm7u-T--vuoXh49fCkKWxv1tqPPaBz51rrUbyuFuvBdC0AVS_8LeJADCxsy5M3ABqqhTWgrLvn9rhFRnZ-bYqX9rDAUP7kBRKerz60aQrui7pznBNC5VONZL7XYbkD7qyvGlqQnX803eRBX1V7wYJwulbXwf4k3lmrdNDqsr-i9kvFaFerv7zD7IJzPQneHZyfX1Ao6Lu9wRxR4jNldnK7k-Je-8C8ZwPBKx6OS7i2PzCngVQBY0BwMWaKiur3JXCg"
-
-BASE_URL = "https://api.spotify.com/"
-
-def fetch_web_api(endpoint, method="GET", body=None):
-    url = f"{BASE_URL}{endpoint}"
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json"
-    }
-    response = requests.request(method, url, headers=headers, json=body)
-    response.raise_for_status()  # Lança erro se a requisição falhar
-    return response.json()
-
-def get_top_tracks():
-    # Referência do endpoint: https://developer.spotify.com/documentation/web-api/reference/get-users-top-artists-and-tracks
-    endpoint = "v1/me/top/tracks?time_range=long_term&limit=5"
-    data = fetch_web_api(endpoint)
-    return data.get("items", [])
-
-if __name__ == "__main__":
-    top_tracks = get_top_tracks()
-    print("Suas 5 músicas mais ouvidas:")
-    for i, track in enumerate(top_tracks, start=1):
-        name = track["name"]
-        artists = ", ".join(artist["name"] for artist in track["artists"])
-        print(f"{i}. {name} - {artists}")
\ No newline at end of file
+#!/usr/bin/env python
+"""
+Job em lote: salva um snapshot diário dos top artistas e top faixas
+(short_term, medium_term e long_term) de todos os usuários com Spotify conectado.
+
+A página inicial lê os top artistas desses snapshots em vez de chamar
+`/v1/me/top/artists` a cada visita.
+
+Como usar:
+  python Top5.py                     # snapshot de hoje, 4 usuários em paralelo
+  python Top5.py --workers 8 --rate 20 --limit 20 --keep-days 30
+
+O job pode ser interrompido e rodado de novo no mesmo dia: cada usuário é
+gravado numa única transação e usuários que já têm o snapshot do dia são pulados
+(quem não tem nenhum top no Spotify ganha uma linha marcadora, kind='empty').
+"""
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, timedelta
+
+import requests
+
+from app import app, db, init_db, User, TopItemSnapshot
+from spotify_client import refresh_user_token, get_user_top_artists, get_user_top_tracks
+
+TIME_RANGES = ('short_term', 'medium_term', 'long_term')
+MAX_ATTEMPTS = 5
+# Linha gravada para o usuário sem nenhum item: marca o snapshot do dia como feito
+EMPTY_KIND = 'empty'
+
+
+class RateLimiter:
+    """Spaces out requests from all threads to `per_second`, and pauses everyone
+    when Spotify answers 429 (Retry-After)."""
+
+    def __init__(self, per_second):
+        self.interval = 1.0 / per_second
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def backoff(self, seconds):
+        with self._lock:
+            self._next = max(self._next, time.monotonic() + seconds)
+
+
+def call_spotify(limiter, func, *args, **kwargs):
+    for attempt in range(MAX_ATTEMPTS):
+        limiter.wait()
+        try:
+            return func(*args, **kwargs)
+        except requests.HTTPError as e:
+            resp = e.response
+            if resp is None or attempt == MAX_ATTEMPTS - 1:
+                raise
+            if resp.status_code == 429:
+                limiter.backoff(float(resp.headers.get('Retry-After', 1)))
+            elif resp.status_code >= 500:
+                limiter.backoff(2 ** attempt)
+            else:
+                raise
+        except requests.ConnectionError:
+            if attempt == MAX_ATTEMPTS - 1:
+                raise
+            limiter.backoff(2 ** attempt)
+
+
+def fresh_access_token(user, limiter):
+    """Return a valid access token for `user`, refreshing (and saving) it if it expires soon."""
+    if user.spotify_token_expires and int(user.spotify_token_expires) > int(time.time()) + 60:
+        return user.spotify_access_token
+    if not user.spotify_refresh_token:
+        return user.spotify_access_token
+    newtok = call_spotify(limiter, refresh_user_token, user.spotify_refresh_token)
+    user.spotify_access_token = newtok.get('access_token', user.spotify_access_token)
+    if newtok.get('refresh_token'):
+        user.spotify_refresh_token = newtok['refresh_token']
+    if newtok.get('expires_in'):
+        user.spotify_token_expires = int(time.time()) + int(newtok['expires_in'])
+    return user.spotify_access_token
+
+
+def snapshot_rows(user_id, snapshot_date, kind, time_range, items):
+    rows = []
+    for rank, item in enumerate(items, start=1):
+        row = {
+            'user_id': user_id, 'snapshot_date': snapshot_date, 'kind': kind, 'time_range': time_range,
+            'rank': rank, 'item_id': item.get('id'), 'name': (item.get('name') or '')[:300],
+        }
+        if kind == 'artists':
+            images = item.get('images') or []
+        else:
+            album = item.get('album') or {}
+            images = album.get('images') or []
+            row['album_id'] = album.get('id')
+            row['artists'] = ', '.join(a.get('name') for a in item.get('artists', []))[:500]
+        row['image_url'] = images[0].get('url') if images else None
+        if row['item_id']:
+            rows.append(row)
+    return rows
+
+
+def empty_marker(user_id, snapshot_date):
+    return {'user_id': user_id, 'snapshot_date': snapshot_date, 'kind': EMPTY_KIND, 'time_range': '',
+            'rank': 0, 'item_id': '', 'name': ''}
+
+
+def snapshot_user(user_id, snapshot_date, limiter, limit):
+    """Fetch and store all top lists of one user in a single transaction.
+
+    A refreshed token is committed on its own first: Spotify may rotate the
+    refresh token, and rolling it back after a later failure would leave the
+    user with one that no longer works.
+    """
+    with app.app_context():
+        try:
+            user = db.session.get(User, user_id)
+            access = fresh_access_token(user, limiter)
+            db.session.commit()
+            rows = []
+            for time_range in TIME_RANGES:
+                artists = call_spotify(limiter, get_user_top_artists, access, limit=limit, time_range=time_range)
+                rows += snapshot_rows(user_id, snapshot_date, 'artists', time_range, artists)
+                tracks = call_spotify(limiter, get_user_top_tracks, access, limit=limit, time_range=time_range)
+                rows += snapshot_rows(user_id, snapshot_date, 'tracks', time_range, tracks)
+            db.session.execute(db.insert(TopItemSnapshot), rows or [empty_marker(user_id, snapshot_date)])
+            db.session.commit()
+            return len(rows)
+        except Exception:
+            db.session.rollback()
+            raise
+
+
+def pending_user_ids(snapshot_date):
+    done = db.session.query(TopItemSnapshot.user_id).filter_by(snapshot_date=snapshot_date).distinct()
+    return [uid for (uid,) in db.session.query(User.id).filter(
+        User.spotify_refresh_token.isnot(None), User.id.notin_(done)).order_by(User.id)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4, help='usuários processados em paralelo')
+    parser.add_argument('--rate', type=float, default=10.0, help='máximo de requisições/s ao Spotify')
+    parser.add_argument('--limit', type=int, default=20, help='itens por lista (máx. 50)')
+    parser.add_argument('--keep-days', type=int, default=30, help='apaga snapshots mais antigos que isso (0 = nunca)')
+    opts = parser.parse_args()
+
+    init_db()
+    snapshot_date = date.today()
+    limiter = RateLimiter(opts.rate)
+
+    with app.app_context():
+        user_ids = pending_user_ids(snapshot_date)
+        if opts.keep_days > 0:
+            TopItemSnapshot.query.filter(
+                TopItemSnapshot.snapshot_date < snapshot_date - timedelta(days=opts.keep_days)
+            ).delete(synchronize_session=False)
+            db.session.commit()
+
+    print(f"Snapshot de {snapshot_date}: {len(user_ids)} usuários pendentes")
+    start = time.perf_counter()
+    done = failed = 0
+    with ThreadPoolExecutor(max_workers=opts.workers) as pool:
+        futures = {pool.submit(snapshot_user, uid, snapshot_date, limiter, min(opts.limit, 50)): uid for uid in user_ids}
+        for future in as_completed(futures):
+            try:
+                future.result()
+                done += 1
+            except Exception as e:
+                failed += 1
+                print(f"Usuário {futures[future]} falhou: {e}")
+            if (done + failed) % 50 == 0:
+                elapsed = time.perf_counter() - start
+                print(f"{done + failed}/{len(user_ids)} ({(done + failed) / elapsed:.1f} usuários/s)")
+
+    elapsed = time.perf_counter() - start
+    rate = (done + failed) / elapsed if elapsed else 0.0
+    print(f"Concluído: {done} ok, {failed} com erro em {elapsed:.1f}s ({rate:.1f} usuários/s)")
+
+
+if __name__ == "__main__":
+    main()
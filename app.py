@@ -1,647 +1,1367 @@
-import os
-import time
-import requests  # Para chamadas à API externa de álbuns
-import secrets
-from flask import Flask, render_template, request, redirect, url_for, jsonify, flash, session
-from flask_sqlalchemy import SQLAlchemy
-from flask_login import LoginManager, UserMixin, login_user, logout_user, current_user, login_required
-from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy import text
-from spotify_client import (
-    search_albums, get_album, get_new_releases, get_recommendations, get_artist_top_tracks,
-    build_authorize_url, exchange_code_for_token, refresh_user_token, get_user_profile, get_user_top_artists, get_recommendations_user
-)
-
-# --- 1. CONFIGURAÇÃO INICIAL ---
-
-# Carrega as variáveis de ambiente (do arquivo .env)
-# (Você precisaria instalar 'python-dotenv': pip install python-dotenv)
-from dotenv import load_dotenv, find_dotenv
-# Tenta localizar o .env a partir do diretório do projeto
-DOTENV_PATH = find_dotenv()
-if DOTENV_PATH:
-    load_dotenv(DOTENV_PATH)
-else:
-    # fallback: tenta carregar .env padrão (pode não existir)
-    load_dotenv()
-
-# Inicializa a aplicação Flask
-app = Flask(__name__)
-
-# Configurações do App
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'uma_chave_secreta_muito_forte_padrao')
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///database.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-# Chave da API externa para buscar álbuns (guardada no arquivo .env)
-MUSIC_API_KEY = os.environ.get('MUSIC_API_KEY')
-MUSIC_API_URL = os.environ.get('MUSIC_API_URL', 'https://api.themoviedb.org/3')
-
-# Inicializa o Banco de Dados
-db = SQLAlchemy(app)
-
-# Inicializa o Gerenciador de Login
-login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'  # Redireciona para a rota 'login' se não estiver logado
-login_manager.login_message = 'Por favor, faça login para acessar esta página.'
-
-# --- 2. MODELOS DO BANCO DE DADOS (Exemplo) ---
-# (Idealmente, isso estaria em 'models.py', mas para um exemplo simples, pode ficar aqui)
-
-class User(UserMixin, db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(80), unique=True, nullable=False)
-    email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128))
-    # Spotify integration fields
-    spotify_id = db.Column(db.String(128), unique=False, nullable=True)
-    spotify_access_token = db.Column(db.String(512), nullable=True)
-    spotify_refresh_token = db.Column(db.String(512), nullable=True)
-    spotify_token_expires = db.Column(db.Integer, nullable=True)
-
-    reviews = db.relationship('Review', backref='author', lazy=True)
-
-    def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
-
-    def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
-
-class Review(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    album_id = db.Column(db.String(50), nullable=False) # ID do álbum na API externa
-    album_title = db.Column(db.String(200), nullable=False) # Guardamos o título do álbum para referência rápida
-    rating = db.Column(db.Integer, nullable=False) # Nota de 1 a 5
-    text = db.Column(db.Text, nullable=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-
-# Função para carregar um usuário (necessária para o Flask-Login)
-@login_manager.user_loader
-def load_user(user_id):
-    return User.query.get(int(user_id))
-
-# --- 3. ROTAS QUE SERVEM PÁGINAS HTML (Frontend) ---
-
-@app.route('/')
-def index():
-    """ Página Inicial """
-    # Busca as últimas reviews de todos os usuários
-    recent_reviews = Review.query.order_by(Review.id.desc()).limit(10).all()
-    # Tenta buscar lançamentos novos via Spotify (não quebra se falhar)
-    albums = []
-    most_listened = []
-    try:
-        albums = get_new_releases(limit=8)
-    except Exception as e:
-        app.logger.debug(f"Não foi possível obter 'new releases' do Spotify: {e}")
-
-    # Fallback rápido para desenvolvimento: se não houver lançamentos, usa amostras locais
-    if not albums:
-        albums = [
-            {
-                'id': 'sample1',
-                'name': 'Sample Album One',
-                'artists': [{'name': 'Sample Artist'}],
-                'images': [{'url': 'https://placehold.co/400x400/1A202C/Green?text=Sample+1'}]
-            },
-            {
-                'id': 'sample2',
-                'name': 'Sample Album Two',
-                'artists': [{'name': 'Sample Artist'}],
-                'images': [{'url': 'https://placehold.co/400x400/1A202C/Green?text=Sample+2'}]
-            },
-            {
-                'id': 'sample3',
-                'name': 'Sample Album Three',
-                'artists': [{'name': 'Sample Artist'}],
-                'images': [{'url': 'https://placehold.co/400x400/1A202C/Green?text=Sample+3'}]
-            }
-        ]
-
-    # Normaliza estrutura dos álbuns para um formato simples usado no template
-    def _normalize_album(a):
-        return {
-            'id': a.get('id'),
-            'name': a.get('name') or a.get('album_title') or '—',
-            'artists': [{'name': ar.get('name') if isinstance(ar, dict) else str(ar)} for ar in a.get('artists', [])] if a.get('artists') else [],
-            'images': a.get('images') or []
-        }
-
-    try:
-        albums = [_normalize_album(a) for a in albums]
-    except Exception as e:
-        app.logger.debug(f"Erro ao normalizar albums: {e}")
-
-    # Monta lista de 'Mais Ouvidos' — prioriza recomendações personalizadas do usuário conectado ao Spotify
-    try:
-        rec_tracks = []
-        seed_artists = []
-        user_used_spotify = False
-
-        if current_user.is_authenticated and getattr(current_user, 'spotify_access_token', None):
-            access = current_user.spotify_access_token
-            try:
-                # refresh token se expirado
-                if getattr(current_user, 'spotify_token_expires', None) and int(current_user.spotify_token_expires) < int(time.time()):
-                    if getattr(current_user, 'spotify_refresh_token', None):
-                        newtok = refresh_user_token(current_user.spotify_refresh_token)
-                        access = newtok.get('access_token', access)
-                        if newtok.get('refresh_token'):
-                            current_user.spotify_refresh_token = newtok.get('refresh_token')
-                        if newtok.get('expires_in'):
-                            current_user.spotify_token_expires = int(time.time()) + int(newtok.get('expires_in'))
-                        current_user.spotify_access_token = access
-                        db.session.commit()
-
-                # usa os top-artists do usuário como seeds
-                try:
-                    top_artists = get_user_top_artists(access, limit=5)
-                    seed_artists = [a.get('id') for a in top_artists if a.get('id')][:5]
-                    if seed_artists:
-                        user_used_spotify = True
-                        rec_tracks = get_recommendations_user(access, seed_artists=seed_artists, limit=8)
-                except Exception as e:
-                    app.logger.debug(f"User-scoped Spotify recommendations failed: {e}")
-            except Exception as e:
-                app.logger.debug(f"Spotify token refresh/check failed: {e}")
-
-        # Se não tiver recomendações de usuário, monta seeds a partir dos lançamentos e usa client-credentials
-        if not user_used_spotify:
-            for a in albums:
-                if a.get('artists'):
-                    aid = a['artists'][0].get('id')
-                    if aid and aid not in seed_artists:
-                        seed_artists.append(aid)
-                if len(seed_artists) >= 5:
-                    break
-
-            if seed_artists:
-                try:
-                    rec_tracks = get_recommendations(seed_artists=seed_artists, limit=8)
-                except Exception as e:
-                    app.logger.debug(f"Não foi possível obter recomendações do Spotify (status/erro): {e}")
-                    rec_tracks = []
-
-        # transforma tracks em estrutura conveniente para o template
-        for t in rec_tracks:
-            img = None
-            if t.get('album') and t['album'].get('images'):
-                img = t['album']['images'][0].get('url')
-            artists = ', '.join([ar.get('name') for ar in t.get('artists', [])])
-            most_listened.append({
-                'id': t.get('id'),
-                'name': t.get('name'),
-                'artists': artists,
-                'image': img,
-                'preview_url': t.get('preview_url'),
-                'album_id': t.get('album', {}).get('id')
-            })
-
-        # fallback para top-tracks de artistas seed caso não tenha itens
-        if not most_listened and seed_artists:
-            for aid in seed_artists[:3]:
-                try:
-                    top_tracks = get_artist_top_tracks(aid, country='US')
-                except Exception as e:
-                    app.logger.debug(f"Erro ao obter top-tracks do artista {aid}: {e}")
-                    continue
-                for t in top_tracks:
-                    if len(most_listened) >= 8:
-                        break
-                    img = None
-                    if t.get('album') and t['album'].get('images'):
-                        img = t['album']['images'][0].get('url')
-                    artists = ', '.join([ar.get('name') for ar in t.get('artists', [])])
-                    if not any(x['name'] == t.get('name') for x in most_listened):
-                        most_listened.append({
-                            'id': t.get('id'),
-                            'name': t.get('name'),
-                            'artists': artists,
-                            'image': img,
-                            'preview_url': t.get('preview_url'),
-                            'album_id': t.get('album', {}).get('id')
-                        })
-                if len(most_listened) >= 8:
-                    break
-    except Exception as e:
-        app.logger.debug(f"Erro ao montar seeds para recomendações: {e}")
-
-    # Do not show sample fallback in the 'Mais Ouvidos' carousel.
-    # The carousel should show only user-based recommendations. If none are available,
-    # the frontend will show a CTA to connect Spotify (or prompt to login).
-    most_listened_user = bool(most_listened and current_user.is_authenticated and getattr(current_user, 'spotify_access_token', None))
-
-    return render_template('index.html', reviews=recent_reviews, albums=albums, most_listened=most_listened, most_listened_user=most_listened_user)
-
-@app.route('/perfil/<username>')
-@login_required
-def profile(username):
-    """ Página de Perfil de um Usuário """
-    user = User.query.filter_by(username=username).first_or_404()
-    user_reviews = Review.query.filter_by(user_id=user.id).order_by(Review.id.desc()).all()
-    return render_template('profile.html', user=user, reviews=user_reviews)
-
-
-@app.route('/spotify/connect')
-@login_required
-def spotify_connect():
-    redirect_uri = url_for('spotify_callback', _external=True)
-    state = secrets.token_urlsafe(16)
-    session['spotify_oauth_state'] = state
-    try:
-        auth_url = build_authorize_url(redirect_uri, state=state)
-    except Exception as e:
-        flash('Não é possível iniciar conexão com Spotify: verifique configuração.', 'danger')
-        return redirect(url_for('profile', username=current_user.username))
-    return redirect(auth_url)
-
-
-@app.route('/spotify/callback')
-def spotify_callback():
-    error = request.args.get('error')
-    code = request.args.get('code')
-    state = request.args.get('state')
-    saved = session.pop('spotify_oauth_state', None)
-    if error:
-        flash(f'Spotify: {error}', 'danger')
-        return redirect(url_for('index'))
-    if not code or not state or state != saved:
-        flash('Falha na verificação de segurança do Spotify (state mismatch).', 'danger')
-        return redirect(url_for('index'))
-    if not current_user.is_authenticated:
-        flash('Faça login primeiro para conectar sua conta Spotify.', 'warning')
-        return redirect(url_for('login'))
-
-    redirect_uri = url_for('spotify_callback', _external=True)
-    try:
-        token_data = exchange_code_for_token(code, redirect_uri)
-        access = token_data.get('access_token')
-        refresh = token_data.get('refresh_token')
-        expires_in = token_data.get('expires_in')
-        profile = get_user_profile(access)
-        # store on user
-        current_user.spotify_id = profile.get('id')
-        current_user.spotify_access_token = access
-        current_user.spotify_refresh_token = refresh
-        if expires_in:
-            current_user.spotify_token_expires = int(time.time()) + int(expires_in)
-        db.session.commit()
-        flash('Conta Spotify conectada com sucesso!', 'success')
-    except Exception as e:
-        app.logger.exception('Erro ao completar OAuth Spotify')
-        flash('Erro ao conectar com o Spotify.', 'danger')
-
-    return redirect(url_for('profile', username=current_user.username))
-
-
-@app.route('/spotify/disconnect')
-@login_required
-def spotify_disconnect():
-    current_user.spotify_id = None
-    current_user.spotify_access_token = None
-    current_user.spotify_refresh_token = None
-    current_user.spotify_token_expires = None
-    db.session.commit()
-    flash('Conta Spotify desconectada.', 'info')
-    return redirect(url_for('profile', username=current_user.username))
-
-@app.route('/album/<album_id>')
-def album_details(album_id):
-    """ Página de Detalhes de um Álbum """
-    # 1. Busca dados do álbum na API externa
-    album_data = None
-    # Se houver uma API externa genérica configurada, tenta buscá-la primeiro
-    if MUSIC_API_KEY:
-        try:
-            resp = requests.get(f"{MUSIC_API_URL}/album/{album_id}", params={
-                'api_key': MUSIC_API_KEY,
-                'language': 'pt-BR'
-            })
-            resp.raise_for_status()
-            album_data = resp.json()
-        except requests.RequestException as e:
-            app.logger.error(f"Erro ao buscar álbum {album_id} na API externa: {e}")
-            flash('Erro ao carregar detalhes do álbum da API externa; tentando Spotify...', 'warning')
-        
-    # 2. Busca reviews deste álbum no nosso banco
-    album_reviews = Review.query.filter_by(album_id=album_id).all()
-    
-    # If album_data from external API is not present, try fetching from Spotify
-    if not album_data:
-        try:
-            album_data = get_album(album_id)
-        except Exception as e:
-            app.logger.error(f"Erro ao buscar álbum na API: {e}")
-
-    return render_template('album_details.html', album=album_data, reviews=album_reviews)
-
-@app.route('/login', methods=['GET', 'POST'])
-def login():
-    """ Página de Login """
-    if current_user.is_authenticated:
-        return redirect(url_for('index'))
-    
-    if request.method == 'POST':
-        email = request.form.get('email')
-        password = request.form.get('password')
-        user = User.query.filter_by(email=email).first()
-        
-        if user and user.check_password(password):
-            login_user(user, remember=True)
-            flash('Login bem-sucedido!', 'success')
-            return redirect(url_for('index'))
-        else:
-            flash('Email ou senha inválidos.', 'danger')
-            
-    return render_template('login.html')
-
-@app.route('/logout')
-@login_required
-def logout():
-    """ Rota de Logout """
-    logout_user()
-    flash('Você foi desconectado.', 'info')
-    return redirect(url_for('index'))
-
-@app.route('/registrar', methods=['GET', 'POST'])
-def register():
-    """ Página de Registro """
-    if current_user.is_authenticated:
-        return redirect(url_for('index'))
-
-    if request.method == 'POST':
-        username = request.form.get('username')
-        email = request.form.get('email')
-        password = request.form.get('password')
-
-        # Verifica se email ou usuário já existem
-        if User.query.filter_by(email=email).first():
-            flash('Este email já está em uso.', 'danger')
-        elif User.query.filter_by(username=username).first():
-            flash('Este nome de usuário já está em uso.', 'danger')
-        else:
-            # Cria novo usuário
-            new_user = User(username=username, email=email)
-            new_user.set_password(password)
-            db.session.add(new_user)
-            db.session.commit()
-            
-            flash('Conta criada com sucesso! Faça login.', 'success')
-            return redirect(url_for('login'))
-
-    return render_template('register.html') # Você precisaria criar este template
-
-# --- 4. ROTAS DE API (Backend - Respondem com JSON) ---
-
-@app.route('/api/search_album')
-@login_required
-def api_search_album():
-    """ API para buscar álbuns na API externa """
-    query = (request.args.get('q') or '').strip()
-    if not query:
-        return jsonify({'error': 'Query não fornecida'}), 400
-    try:
-        items = search_albums(query, limit=10)
-        # Simplify response for the frontend
-        results = []
-        for it in items:
-            artists = ', '.join([a.get('name') for a in it.get('artists', [])])
-            img = None
-            if it.get('images'):
-                img = it['images'][0].get('url')
-            results.append({
-                'id': it.get('id'),
-                'name': it.get('name'),
-                'artists': artists,
-                'image': img,
-                'total_tracks': it.get('total_tracks')
-            })
-        return jsonify(results)
-    except RuntimeError as e:
-        # Likely raised by spotify_client when credentials are missing
-        app.logger.warning(f"Spotify client runtime error: {e}")
-        return jsonify({'error': 'Chave da API não configurada', 'message': str(e)}), 400
-    except Exception as e:
-        # Log full traceback
-        app.logger.exception("Erro ao buscar na API Spotify")
-        # If it's an HTTPError from requests, include status and body if available
-        err_payload = {'error': 'Falha ao buscar dados externos'}
-        try:
-            import requests as _req
-            if isinstance(e, _req.HTTPError) and getattr(e, 'response', None) is not None:
-                resp = e.response
-                err_payload['status_code'] = resp.status_code
-                # include response body for debugging (safe in dev)
-                err_payload['response_text'] = resp.text
-        except Exception:
-            pass
-
-        # Also include the exception message (helpful in dev)
-        err_payload['message'] = str(e)
-        return jsonify(err_payload), 502
-
-
-@app.route('/_debug/env')
-def debug_env():
-    """Rota de debug para checar presença de variáveis de ambiente (não expõe valores)."""
-    return jsonify({
-        'SPOTIFY_CLIENT_ID_present': bool(os.environ.get('SPOTIFY_CLIENT_ID')),
-        'SPOTIFY_CLIENT_SECRET_present': bool(os.environ.get('SPOTIFY_CLIENT_SECRET')),
-        'MUSIC_API_KEY_present': bool(os.environ.get('MUSIC_API_KEY'))
-        ,
-        'DOTENV_path': DOTENV_PATH or '',
-        'cwd': os.getcwd()
-    })
-
-
-@app.route('/_debug/font')
-def debug_font():
-    """Rota de debug que verifica se o arquivo de fonte Grinched existe em static/fonts
-    e retorna a URL pública para testar no navegador.
-    """
-    font_path = os.path.join(app.root_path, 'static', 'fonts', 'Grinched-Regular.ttf')
-    exists = os.path.exists(font_path)
-    font_url = None
-    if exists:
-        try:
-            font_url = url_for('static', filename='fonts/Grinched-Regular.ttf', _external=True)
-        except Exception:
-            font_url = url_for('static', filename='fonts/Grinched-Regular.ttf')
-
-    return jsonify({'font_exists': exists, 'font_path': font_path, 'font_url': font_url})
-
-
-@app.route('/_debug/new_releases')
-def debug_new_releases():
-    """Rota de debug para retornar os novos lançamentos do Spotify (JSON).
-    Útil para verificar se a API está retornando álbuns e qual é a estrutura.
-    """
-    try:
-        albums = get_new_releases(limit=12)
-        return jsonify({'ok': True, 'count': len(albums), 'items': albums})
-    except Exception as e:
-        app.logger.exception('Erro ao obter new releases')
-        return jsonify({'ok': False, 'error': str(e)}), 500
-
-
-@app.route('/_debug/most_listened')
-def debug_most_listened():
-    """Recalcula a lista 'most_listened' usada no index e retorna o JSON para debug."""
-    try:
-        albums = get_new_releases(limit=8)
-    except Exception as e:
-        app.logger.debug(f"Não foi possível obter 'new releases' do Spotify (debug route): {e}")
-        albums = []
-
-    # fallback samples
-    if not albums:
-        albums = [
-            {
-                'id': 'sample1',
-                'name': 'Sample Album One',
-                'artists': [{'name': 'Sample Artist'}],
-                'images': [{'url': 'https://placehold.co/400x400/1A202C/Green?text=Sample+1'}]
-            }
-        ]
-
-    # gather seed artists
-    seed_artists = []
-    for a in albums:
-        if a.get('artists'):
-            aid = a['artists'][0].get('id')
-            if aid and aid not in seed_artists:
-                seed_artists.append(aid)
-        if len(seed_artists) >= 5:
-            break
-
-    most_listened = []
-    if seed_artists:
-        try:
-            rec_tracks = get_recommendations(seed_artists=seed_artists, limit=8)
-        except Exception as e:
-            app.logger.debug(f"Debug: recomendações falharam: {e}")
-            rec_tracks = []
-
-        for t in rec_tracks:
-            img = None
-            if t.get('album') and t['album'].get('images'):
-                img = t['album']['images'][0].get('url')
-            artists = ', '.join([ar.get('name') for ar in t.get('artists', [])])
-            most_listened.append({
-                'id': t.get('id'), 'name': t.get('name'), 'artists': artists,
-                'image': img, 'preview_url': t.get('preview_url'), 'album_id': t.get('album', {}).get('id')
-            })
-
-        # fallback to artist top tracks
-        if not most_listened:
-            for aid in seed_artists[:3]:
-                try:
-                    top_tracks = get_artist_top_tracks(aid, country='US')
-                except Exception as e:
-                    app.logger.debug(f"Debug: top-tracks falharam para {aid}: {e}")
-                    continue
-                for t in top_tracks:
-                    if len(most_listened) >= 8:
-                        break
-                    img = None
-                    if t.get('album') and t['album'].get('images'):
-                        img = t['album']['images'][0].get('url')
-                    artists = ', '.join([ar.get('name') for ar in t.get('artists', [])])
-                    if not any(x['name'] == t.get('name') for x in most_listened):
-                        most_listened.append({'id': t.get('id'), 'name': t.get('name'), 'artists': artists, 'image': img, 'preview_url': t.get('preview_url'), 'album_id': t.get('album', {}).get('id')})
-                if len(most_listened) >= 8:
-                    break
-
-    return jsonify({'seed_artists': seed_artists, 'most_listened_count': len(most_listened), 'most_listened': most_listened})
-
-@app.route('/api/review/add', methods=['POST'])
-@login_required
-def api_add_review():
-    """ API para adicionar uma nova review """
-    data = request.get_json(silent=True)
-    if not data:
-        return jsonify({'status': 'error', 'message': 'JSON inválido ou ausente.'}), 400
-
-    album_id = data.get('album_id')
-    title = data.get('album_title')
-    rating_value = data.get('rating')
-    text = data.get('text', '')
-
-    if not album_id or not title or rating_value is None:
-        return jsonify({'status': 'error', 'message': 'Campos obrigatórios ausentes.'}), 400
-
-    try:
-        rating = int(rating_value)
-    except (TypeError, ValueError):
-        return jsonify({'status': 'error', 'message': 'Rating inválido.'}), 400
-
-    if not (1 <= rating <= 5):
-        return jsonify({'status': 'error', 'message': 'Rating deve ser entre 1 e 5.'}), 400
-
-    try:
-        new_review = Review(
-            album_id=album_id,
-            album_title=title,
-            rating=rating,
-            text=text,
-            user_id=current_user.id
-        )
-        db.session.add(new_review)
-        db.session.commit()
-        return jsonify({'status': 'success', 'message': 'Review salva!'}), 201
-    except Exception as e:
-        db.session.rollback()
-        app.logger.error(f"Erro ao salvar review: {e}")
-        return jsonify({'status': 'error', 'message': 'Erro interno ao salvar review.'}), 500
-
-# --- 5. EXECUÇÃO DA APLICAÇÃO ---
-
-if __name__ == '__main__':
-    # Cria as tabelas do banco de dados (se não existirem)
-    with app.app_context():
-        db.create_all()
-        # Verifica se as colunas novas existem e, se não, adiciona-as e popula com valores antigos quando possível.
-        try:
-            # Pega lista de colunas da tabela 'review'
-            res = db.session.execute(text("PRAGMA table_info(review);"))
-            cols = [row[1] for row in res.fetchall()]
-
-            # Adiciona coluna 'album_id' se não existir
-            if 'album_id' not in cols:
-                db.session.execute(text("ALTER TABLE review ADD COLUMN album_id VARCHAR;"))
-                if 'tmdb_movie_id' in cols:
-                    db.session.execute(text("UPDATE review SET album_id = tmdb_movie_id;"))
-
-            # Adiciona coluna 'album_title' se não existir
-            if 'album_title' not in cols:
-                db.session.execute(text("ALTER TABLE review ADD COLUMN album_title VARCHAR;"))
-                if 'movie_title' in cols:
-                    db.session.execute(text("UPDATE review SET album_title = movie_title;"))
-
-            # Pega lista de colunas da tabela 'user' e adiciona colunas do Spotify se necessário
-            try:
-                res_u = db.session.execute(text("PRAGMA table_info(user);"))
-                user_cols = [row[1] for row in res_u.fetchall()]
-                # spotify_id
-                if 'spotify_id' not in user_cols:
-                    db.session.execute(text("ALTER TABLE user ADD COLUMN spotify_id VARCHAR;"))
-                # spotify_access_token
-                if 'spotify_access_token' not in user_cols:
-                    db.session.execute(text("ALTER TABLE user ADD COLUMN spotify_access_token VARCHAR;"))
-                # spotify_refresh_token
-                if 'spotify_refresh_token' not in user_cols:
-                    db.session.execute(text("ALTER TABLE user ADD COLUMN spotify_refresh_token VARCHAR;"))
-                # spotify_token_expires
-                if 'spotify_token_expires' not in user_cols:
-                    db.session.execute(text("ALTER TABLE user ADD COLUMN spotify_token_expires INTEGER;"))
-            except Exception as e:
-                app.logger.debug(f"Erro ao migrar tabela user: {e}")
-
-            db.session.commit()
-        except Exception as e:
-            app.logger.error(f"Erro na migração do esquema do DB: {e}")
-        
-    # Roda o servidor Flask em modo de debug
-    # (Não use debug=True em produção!)
-    app.run(debug=True, port=5000)
\ No newline at end of file
+import os
+import time
+import threading
+import signal
+from datetime import datetime
+import requests  # Para chamadas à API externa de álbuns
+import secrets
+from flask import Flask, render_template, request, redirect, url_for, jsonify, flash, session, g
+from flask_sqlalchemy import SQLAlchemy
+from flask_login import LoginManager, UserMixin, login_user, logout_user, current_user, login_required
+from sqlalchemy import text, inspect, event
+from sqlalchemy.orm import object_session
+from sqlalchemy.exc import IntegrityError
+from spotify_client import (
+    search_albums, get_album, get_new_releases, get_recommendations, get_artist_top_tracks,
+    build_authorize_url, exchange_code_for_token, refresh_user_token, get_user_profile, get_user_top_artists, get_recommendations_user,
+    get_spotify_token
+)
+import click
+import serve
+from database import normalize_database_url, engine_options, install_sqlite_pragmas
+import passwords
+from cache import TTLCache
+from json_provider import FastJSONProvider, stream_json_array
+from domain import Album, AlbumDetails, Artist, Track
+from leaderboards import Leaderboards, TRENDING_WINDOWS
+from upstream import Upstream, CircuitOpen
+import metrics
+import assets
+import template_cache
+from search_index import AlbumIndex, REVIEWS_OVERLAP, start_periodic_snapshot
+from prefetch import Prefetcher
+from jobs import JobQueue
+
+# --- 1. CONFIGURAÇÃO INICIAL ---
+
+# Carrega as variáveis de ambiente (do arquivo .env)
+# (Você precisaria instalar 'python-dotenv': pip install python-dotenv)
+from dotenv import load_dotenv, find_dotenv
+# Tenta localizar o .env a partir do diretório do projeto
+DOTENV_PATH = find_dotenv()
+if DOTENV_PATH:
+    load_dotenv(DOTENV_PATH)
+else:
+    # fallback: tenta carregar .env padrão (pode não existir)
+    load_dotenv()
+
+# Inicializa a aplicação Flask
+app = Flask(__name__)
+
+# Configurações do App
+app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'uma_chave_secreta_muito_forte_padrao')
+app.config['SQLALCHEMY_DATABASE_URI'] = normalize_database_url(os.environ.get('DATABASE_URL', 'sqlite:///database.db'))
+# Perfil do engine escolhido pelo DATABASE_URL (SQLite: WAL/busy_timeout; PostgreSQL: pool e timeouts)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+install_sqlite_pragmas()
+# Algoritmo e custo do hash de senha (ex.: 'scrypt:32768:8:1', 'pbkdf2:sha256:600000').
+# Hashes antigos são refeitos com o método atual no próximo login. Um método inválido impede a inicialização.
+app.config['PASSWORD_HASH_METHOD'] = passwords.validate_method(
+    os.environ.get('PASSWORD_HASH_METHOD') or passwords.DEFAULT_METHOD)
+# Tamanho máximo do corpo das requisições (padrão: 1 MiB); acima disso o Flask responde 413
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', 1024 * 1024))
+
+# Chave da API externa para buscar álbuns (guardada no arquivo .env)
+MUSIC_API_KEY = os.environ.get('MUSIC_API_KEY')
+MUSIC_API_URL = os.environ.get('MUSIC_API_URL', 'https://api.themoviedb.org/3')
+
+# Tempo (s) que o snapshot do usuário logado fica em cache em cada processo
+USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 30))
+
+# Rankings: peso do prior da média bayesiana, intervalo (s) da reconstrução completa e
+# de quanto em quanto tempo (s) cada processo relê a média global usada no prior
+LEADERBOARD_PRIOR_WEIGHT = int(os.environ.get('LEADERBOARD_PRIOR_WEIGHT', 5))
+LEADERBOARD_REBUILD_INTERVAL = int(os.environ.get('LEADERBOARD_REBUILD_INTERVAL', 600))
+LEADERBOARD_MEAN_TTL = int(os.environ.get('LEADERBOARD_MEAN_TTL', 300))
+
+# Máximo de reviews aceitas por requisição em /api/review/bulk
+REVIEW_BULK_MAX = int(os.environ.get('REVIEW_BULK_MAX', 500))
+
+# Disjuntor do Spotify: falhas seguidas até abrir e tempo (s) aberto antes de testar de novo
+SPOTIFY_BREAKER_THRESHOLD = int(os.environ.get('SPOTIFY_BREAKER_THRESHOLD', 5))
+SPOTIFY_BREAKER_RESET = float(os.environ.get('SPOTIFY_BREAKER_RESET', 30))
+# Respostas salvas do Spotify (fallback): idade máxima (s), máximo de linhas e intervalo (s) da limpeza
+UPSTREAM_CACHE_MAX_AGE = int(os.environ.get('UPSTREAM_CACHE_MAX_AGE', 7 * 24 * 3600))
+UPSTREAM_CACHE_MAX_ROWS = int(os.environ.get('UPSTREAM_CACHE_MAX_ROWS', 50000))
+UPSTREAM_CACHE_PURGE_INTERVAL = int(os.environ.get('UPSTREAM_CACHE_PURGE_INTERVAL', 3600))
+
+# Respostas HTML/JSON a partir deste tamanho (bytes) são comprimidas com gzip/brotli
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+
+# Cache de fragmentos de template ({% cache %}): validade padrão (s) e máximo de fragmentos por processo
+FRAGMENT_CACHE_TTL = int(os.environ.get('FRAGMENT_CACHE_TTL', 300))
+FRAGMENT_CACHE_SIZE = int(os.environ.get('FRAGMENT_CACHE_SIZE', 5000))
+
+# Busca local de álbuns: arquivo do snapshot, intervalo (s) entre snapshots e quantos resultados
+# locais fortes (pontuação >= SEARCH_LOCAL_STRONG) dispensam a chamada ao Spotify
+ALBUM_INDEX_PATH = os.environ.get('ALBUM_INDEX_PATH') or os.path.join(app.instance_path, 'album_index.pickle')
+ALBUM_INDEX_SNAPSHOT_INTERVAL = int(os.environ.get('ALBUM_INDEX_SNAPSHOT_INTERVAL', 300))
+SEARCH_LOCAL_MIN = int(os.environ.get('SEARCH_LOCAL_MIN', 5))
+SEARCH_LOCAL_STRONG = float(os.environ.get('SEARCH_LOCAL_STRONG', 0.6))
+
+# Cache de álbuns do Spotify (página de detalhes) e pré-carregamento em segundo plano dos álbuns exibidos:
+# validade (s), tamanho, threads, buscas/s, buscas/min por processo e quantos resultados da busca pré-carregar
+ALBUM_CACHE_TTL = int(os.environ.get('ALBUM_CACHE_TTL', 600))
+ALBUM_CACHE_SIZE = int(os.environ.get('ALBUM_CACHE_SIZE', 2000))
+PREFETCH_WORKERS = int(os.environ.get('PREFETCH_WORKERS', 2))
+PREFETCH_RATE = float(os.environ.get('PREFETCH_RATE', 2))
+PREFETCH_BUDGET = int(os.environ.get('PREFETCH_BUDGET', 120))
+PREFETCH_SEARCH_RESULTS = int(os.environ.get('PREFETCH_SEARCH_RESULTS', 3))
+
+# Fila de jobs (`flask worker`): threads por processo e intervalo (s) entre buscas quando a fila está vazia
+JOB_WORKER_THREADS = int(os.environ.get('JOB_WORKER_THREADS', 4))
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1))
+# Sem nenhum `flask worker` ativo, os processos do `serve` executam os jobs vencidos a cada tantos
+# segundos (0 desliga)
+JOB_FALLBACK_INTERVAL = float(os.environ.get('JOB_FALLBACK_INTERVAL', 60))
+# Tokens de usuário que expiram em menos que isso (s) são renovados em segundo plano
+SPOTIFY_TOKEN_REFRESH_AHEAD = int(os.environ.get('SPOTIFY_TOKEN_REFRESH_AHEAD', 300))
+
+# Serialização JSON com orjson (se instalado) para jsonify e request.get_json
+app.json = FastJSONProvider(app)
+
+# Arquivos estáticos com hash/pré-comprimidos (gerados por `flask build-assets`) e compressão das respostas
+assets.init_app(app, compress_min_size=COMPRESS_MIN_SIZE)
+
+# Fragmentos renderizados em cache por processo; bytecode dos templates compilados compartilhado em instance/
+template_cache.init_app(app, TTLCache(ttl=FRAGMENT_CACHE_TTL, maxsize=FRAGMENT_CACHE_SIZE),
+                        bytecode_dir=os.path.join(app.instance_path, 'jinja-bytecode'))
+
+# Inicializa o Banco de Dados
+db = SQLAlchemy(app)
+
+# Inicializa o Gerenciador de Login
+login_manager = LoginManager()
+login_manager.init_app(app)
+login_manager.login_view = 'login'  # Redireciona para a rota 'login' se não estiver logado
+login_manager.login_message = 'Por favor, faça login para acessar esta página.'
+
+# --- 2. MODELOS DO BANCO DE DADOS (Exemplo) ---
+# (Idealmente, isso estaria em 'models.py', mas para um exemplo simples, pode ficar aqui)
+
+class User(UserMixin, db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(80), unique=True, nullable=False)
+    email = db.Column(db.String(120), unique=True, nullable=False)
+    password_hash = db.Column(db.String(256))
+    # Spotify integration fields
+    spotify_id = db.Column(db.String(128), unique=False, nullable=True)
+    spotify_access_token = db.Column(db.String(512), nullable=True)
+    spotify_refresh_token = db.Column(db.String(512), nullable=True)
+    spotify_token_expires = db.Column(db.Integer, nullable=True)
+
+    reviews = db.relationship('Review', backref='author', lazy=True)
+
+    def set_password(self, password):
+        self.password_hash = passwords.hash_password(password, app.config['PASSWORD_HASH_METHOD'])
+
+    def check_password(self, password):
+        return passwords.verify_password(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return passwords.needs_rehash(self.password_hash, app.config['PASSWORD_HASH_METHOD'])
+
+class Review(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    album_id = db.Column(db.String(50), nullable=False) # ID do álbum na API externa
+    album_title = db.Column(db.String(200), nullable=False) # Guardamos o título do álbum para referência rápida
+    rating = db.Column(db.Integer, nullable=False) # Nota de 1 a 5
+    text = db.Column(db.Text, nullable=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # Chave opcional enviada pelo cliente para tornar o envio em lote idempotente
+    client_key = db.Column(db.String(64), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow, index=True)
+    # Muda a cada edição: faz parte da chave do fragmento em cache do card da review
+    updated_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+    __table_args__ = (
+        db.Index('ix_review_user_client_key', 'user_id', 'client_key', unique=True),
+    )
+
+# Tabelas de rankings pré-calculados (mantidas por leaderboards.Leaderboards)
+class AlbumStat(db.Model):
+    album_id = db.Column(db.String(50), primary_key=True)
+    album_title = db.Column(db.String(200), nullable=False)
+    review_count = db.Column(db.Integer, nullable=False, default=0, index=True)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+    score = db.Column(db.Float, nullable=False, default=0.0, index=True)  # média bayesiana
+    updated_at = db.Column(db.DateTime, nullable=True)
+
+    @property
+    def average(self):
+        return self.rating_sum / self.review_count if self.review_count else 0.0
+
+class AlbumTrend(db.Model):
+    period = db.Column(db.String(8), primary_key=True)  # chave de leaderboards.TRENDING_WINDOWS
+    album_id = db.Column(db.String(50), primary_key=True)
+    review_count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_album_trend_period_count', 'period', 'review_count'),
+    )
+
+# Snapshots diários dos top artistas/faixas de cada usuário conectado ao Spotify (gerados por Top5.py)
+class TopItemSnapshot(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    snapshot_date = db.Column(db.Date, nullable=False)
+    kind = db.Column(db.String(8), nullable=False)  # 'artists' ou 'tracks'
+    time_range = db.Column(db.String(16), nullable=False)  # short_term, medium_term, long_term
+    rank = db.Column(db.Integer, nullable=False)
+    item_id = db.Column(db.String(64), nullable=False)
+    name = db.Column(db.String(300), nullable=False)
+    artists = db.Column(db.String(500), nullable=True)  # faixas: nomes dos artistas
+    album_id = db.Column(db.String(64), nullable=True)
+    image_url = db.Column(db.String(500), nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_top_snapshot_lookup', 'user_id', 'kind', 'time_range', 'snapshot_date', 'rank'),
+        db.Index('ix_top_snapshot_date', 'snapshot_date'),
+    )
+
+# Estado dos disjuntores por endpoint do Spotify, compartilhado entre os workers (mantido por upstream.Upstream)
+class BreakerState(db.Model):
+    endpoint = db.Column(db.String(64), primary_key=True)
+    state = db.Column(db.String(16), nullable=False, default='closed')  # closed, open ou half_open
+    failures = db.Column(db.Integer, nullable=False, default=0)  # falhas seguidas
+    opened_at = db.Column(db.Float, nullable=True)  # epoch da abertura (ou do início do teste)
+    updated_at = db.Column(db.Float, nullable=True)
+
+# Última resposta boa de cada chamada ao Spotify, servida (como dado antigo) quando ele falha
+class UpstreamCache(db.Model):
+    key = db.Column(db.String(40), primary_key=True)  # sha1 do endpoint + argumentos
+    endpoint = db.Column(db.String(64), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # JSON (forma compacta to_dict() dos objetos de domínio)
+    fetched_at = db.Column(db.Float, nullable=False, index=True)
+    source = db.Column(db.String(16), nullable=True)  # 'prefetch' até a resposta ser usada (upstream.claim)
+
+# Fila de jobs em segundo plano (mantida por jobs.JobQueue); jobs concluídos são apagados
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64), nullable=False)  # tarefa registrada com @job_queue.task
+    payload = db.Column(db.Text, nullable=False)  # JSON com os argumentos da tarefa
+    priority = db.Column(db.Integer, nullable=False, default=0)  # maior sai primeiro
+    status = db.Column(db.String(16), nullable=False, default='queued')  # queued, running ou failed
+    dedup_key = db.Column(db.String(128), nullable=True, unique=True)  # liberada quando o job termina
+    run_at = db.Column(db.Float, nullable=False)  # epoch a partir do qual pode rodar
+    enqueued_at = db.Column(db.Float, nullable=False)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    locked_by = db.Column(db.String(32), nullable=True)  # token da posse atual
+    locked_until = db.Column(db.Float, nullable=True)  # fim do timeout de visibilidade
+    last_error = db.Column(db.Text, nullable=True)
+    updated_at = db.Column(db.Float, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_job_ready', 'status', 'priority', 'run_at'),
+    )
+
+# Latências acumuladas dos jobs por tarefa, somadas por todos os workers (jobs.JobQueue.flush_stats)
+class JobStat(db.Model):
+    task = db.Column(db.String(64), primary_key=True)
+    runs = db.Column(db.Integer, nullable=False, default=0)
+    errors = db.Column(db.Integer, nullable=False, default=0)  # execuções que terminaram em exceção
+    wait_sum = db.Column(db.Float, nullable=False, default=0.0)  # s entre poder rodar e começar
+    wait_max = db.Column(db.Float, nullable=False, default=0.0)
+    run_sum = db.Column(db.Float, nullable=False, default=0.0)  # s de execução
+    run_max = db.Column(db.Float, nullable=False, default=0.0)
+    updated_at = db.Column(db.Float, nullable=True)
+
+# Processos do `flask worker` ativos (heartbeat); sem nenhum, o `serve` executa os jobs (JOB_FALLBACK_INTERVAL)
+class JobWorker(db.Model):
+    id = db.Column(db.String(64), primary_key=True)  # host:pid
+    started_at = db.Column(db.Float, nullable=False)
+    seen_at = db.Column(db.Float, nullable=False)
+
+leaderboards = Leaderboards(db, Review, AlbumStat, AlbumTrend, prior_weight=LEADERBOARD_PRIOR_WEIGHT,
+                            mean_ttl=LEADERBOARD_MEAN_TTL)
+upstream = Upstream(db, BreakerState, UpstreamCache, failure_threshold=SPOTIFY_BREAKER_THRESHOLD,
+                    reset_timeout=SPOTIFY_BREAKER_RESET, logger=app.logger)
+job_queue = JobQueue(db, Job, JobStat, JobWorker, logger=app.logger)
+
+# Índice em memória dos álbuns conhecidos (reviews + tudo que veio do Spotify) para a busca local
+album_index = AlbumIndex()
+_album_index_lock = threading.Lock()
+
+
+# Álbuns (domain.AlbumDetails) já buscados no Spotify, por id; alimentado pela página e pelo prefetch
+album_cache = TTLCache(ttl=ALBUM_CACHE_TTL, maxsize=ALBUM_CACHE_SIZE)
+
+
+def _shared_album(album_id):
+    """ Álbum salvo há menos de ALBUM_CACHE_TTL por qualquer worker (tabela upstream_cache), ou None """
+    return upstream.fresh('album', album_id, max_age=ALBUM_CACHE_TTL, model=AlbumDetails)
+
+
+def _fetch_album(album_id):
+    """ Busca um álbum para o prefetch no Spotify (pelo disjuntor), marcando a resposta salva como
+    pré-carregada; None se só houver dado antigo """
+    album, stale = upstream.call('album', get_album, album_id, model=AlbumDetails, source='prefetch')
+    if stale or not album:
+        return None
+    if album_index.loaded:
+        album_index.add_album(album)
+    return album
+
+
+def _claim_prefetched_album(album_id):
+    """ True se o álbum salvo veio de um prefetch ainda não usado (de qualquer worker); tira a marca """
+    return upstream.claim('album', album_id, source='prefetch')
+
+
+prefetcher = Prefetcher(app, _fetch_album, album_cache, workers=PREFETCH_WORKERS, rate=PREFETCH_RATE,
+                        budget=PREFETCH_BUDGET, allow=lambda: upstream.is_closed('album'),
+                        shared=_shared_album, claim=_claim_prefetched_album)
+
+
+def _index_reviews():
+    """ Adiciona ao índice os álbuns das reviews ainda não contadas (todas, se o índice está vazio),
+    somando as reviews novas à contagem de cada álbum; chame com _album_index_lock """
+    added = 0
+    if album_index.reviews_cutoff is None:
+        # Índice vazio: conta as reviews antigas agrupadas por álbum; as dos últimos minutos
+        # (que ainda podem estar chegando fora de ordem) vão uma a uma abaixo
+        split = datetime.utcnow() - REVIEWS_OVERLAP
+        rows = db.session.query(
+            Review.album_id, db.func.max(Review.album_title), db.func.count(Review.id)
+        ).filter(Review.album_id.isnot(None), db.or_(Review.created_at < split, Review.created_at.is_(None))
+                 ).group_by(Review.album_id).all()
+        for album_id, title, count in rows:
+            album_index.count_reviews(album_id, title, count)
+            added += count
+        album_index.reviews_cutoff = split
+    rows = db.session.query(
+        Review.id, Review.album_id, Review.album_title, Review.created_at, Review.updated_at
+    ).filter(Review.updated_at >= album_index.reviews_cutoff, Review.album_id.isnot(None)).all()
+    return added + album_index.add_reviews(rows)
+
+
+def _sync_album_index():
+    """ Conta no índice as reviews gravadas desde a última vez (por qualquer worker) """
+    if not album_index.loaded:
+        return 0
+    with _album_index_lock:
+        return _index_reviews()
+
+
+def _load_album_index():
+    """ Carrega o snapshot do índice (se houver) e completa com as reviews mais novas; uma vez por processo """
+    with _album_index_lock:
+        if album_index.loaded:
+            return
+        started = time.perf_counter()
+        warm = album_index.load(ALBUM_INDEX_PATH)
+        added = _index_reviews()
+        album_index.loaded = True
+        app.logger.info(f"Índice de busca: {len(album_index)} álbuns ({'snapshot' if warm else 'do zero'}, "
+                        f"+{added} das reviews) em {time.perf_counter() - started:.3f}s")
+
+# --- Cache do usuário logado ---
+# O Flask-Login chama o user_loader em toda requisição autenticada. Em vez de uma
+# consulta por requisição, guardamos um snapshot leve (só as colunas abaixo) por
+# processo; o objeto ORM completo só é carregado se a rota precisar dele.
+
+_USER_SNAPSHOT_FIELDS = (
+    'id', 'username', 'email', 'spotify_id',
+    'spotify_access_token', 'spotify_refresh_token', 'spotify_token_expires',
+)
+_user_cache = TTLCache(ttl=USER_CACHE_TTL, maxsize=10000)
+
+
+class CachedUser(UserMixin):
+    """ Usuário autenticado montado a partir do snapshot em cache.
+
+    Leituras das colunas do snapshot não tocam o banco; qualquer outro atributo
+    (ex.: `reviews`) ou escrita carrega o `User` da sessão atual e é repassado a ele.
+    """
+
+    def __init__(self, snapshot, user=None):
+        object.__setattr__(self, '_snapshot', snapshot)
+        object.__setattr__(self, '_user', user)
+
+    def _load(self):
+        if self._user is None:
+            object.__setattr__(self, '_user', db.session.get(User, self._snapshot['id']))
+        return self._user
+
+    def __getattr__(self, name):
+        # Só é chamado para atributos que não existem na classe (ex.: colunas)
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if self._user is None and name in self._snapshot:
+            return self._snapshot[name]
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+
+def _user_snapshot(user):
+    return {field: getattr(user, field) for field in _USER_SNAPSHOT_FIELDS}
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _mark_user_changed(mapper, connection, target):
+    _user_cache.delete(target.id)
+    # Invalida de novo após o commit, caso outra requisição tenha lido a linha antiga nesse meio-tempo
+    object_session(target).info.setdefault('changed_user_ids', set()).add(target.id)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_changed_users(session):
+    for user_id in session.info.pop('changed_user_ids', ()):
+        _user_cache.delete(user_id)
+
+
+# Função para carregar um usuário (necessária para o Flask-Login)
+@login_manager.user_loader
+def load_user(user_id):
+    user_id = int(user_id)
+    snapshot = _user_cache.get(user_id)
+    if snapshot is not None:
+        return CachedUser(snapshot)
+    user = db.session.get(User, user_id)
+    if user is None:
+        return None
+    _user_cache.set(user_id, _user_snapshot(user))
+    return CachedUser(_user_snapshot(user), user)
+
+def _snapshot_top_artist_ids(user_id, limit=5, time_range='medium_term'):
+    """ IDs dos top artistas do snapshot mais recente do usuário (lista vazia se não houver) """
+    latest = db.session.query(db.func.max(TopItemSnapshot.snapshot_date)).filter_by(
+        user_id=user_id, kind='artists', time_range=time_range).scalar()
+    if latest is None:
+        return []
+    rows = db.session.query(TopItemSnapshot.item_id).filter_by(
+        user_id=user_id, kind='artists', time_range=time_range, snapshot_date=latest
+    ).order_by(TopItemSnapshot.rank).limit(limit)
+    return [item_id for (item_id,) in rows]
+
+def _spotify(endpoint, func, *args, **kwargs):
+    """ Chama o Spotify pelo disjuntor de `endpoint`; se vier a última resposta salva, marca g.spotify_stale """
+    value, stale = upstream.call(endpoint, func, *args, **kwargs)
+    if stale:
+        g.spotify_stale = True
+    return value
+
+
+@app.after_request
+def _mark_stale_response(response):
+    if g.get('spotify_stale'):
+        response.headers['X-Upstream-Stale'] = '1'
+    return response
+
+# Álbuns de exemplo exibidos quando o Spotify não responde e não há resposta salva (desenvolvimento)
+SAMPLE_ALBUMS = tuple(
+    Album(f'sample{i}', f'Sample Album {name}', (Artist(None, 'Sample Artist'),),
+          f'https://placehold.co/400x400/1A202C/Green?text=Sample+{i}')
+    for i, name in ((1, 'One'), (2, 'Two'), (3, 'Three'))
+)
+
+
+def _seed_artists_from_albums(albums, seed_artists=None, limit=5):
+    """ Primeiro artista de cada álbum (sem repetir), até `limit` seeds """
+    seed_artists = list(seed_artists or [])
+    for album in albums:
+        if len(seed_artists) >= limit:
+            break
+        if album.artists:
+            aid = album.artists[0].id
+            if aid and aid not in seed_artists:
+                seed_artists.append(aid)
+    return seed_artists
+
+
+def _artist_top_tracks(seed_artists, limit=8):
+    """ Fallback de 'Mais Ouvidos': top-tracks dos 3 primeiros artistas seed, sem repetir nomes """
+    tracks = []
+    for aid in seed_artists[:3]:
+        try:
+            top_tracks = _spotify('artist_top_tracks', get_artist_top_tracks, aid, country='US', model=Track)
+        except Exception as e:
+            app.logger.debug(f"Erro ao obter top-tracks do artista {aid}: {e}")
+            continue
+        for t in top_tracks:
+            if len(tracks) >= limit:
+                break
+            if not any(x.name == t.name for x in tracks):
+                tracks.append(t)
+        if len(tracks) >= limit:
+            break
+    return tracks
+
+def _refresh_spotify_token(user):
+    """ Renova o token de acesso do usuário no Spotify e atualiza as colunas (sem commit); retorna o novo token """
+    newtok = _spotify('accounts_token', refresh_user_token, user.spotify_refresh_token, cache=False)
+    access = newtok.get('access_token', user.spotify_access_token)
+    if newtok.get('refresh_token'):
+        user.spotify_refresh_token = newtok.get('refresh_token')
+    if newtok.get('expires_in'):
+        user.spotify_token_expires = int(time.time()) + int(newtok.get('expires_in'))
+    user.spotify_access_token = access
+    return access
+
+# --- Jobs em segundo plano (executados por `flask worker`) ---
+# Sem worker rodando, os processos do `serve` os executam a cada JOB_FALLBACK_INTERVAL segundos.
+# Os handlers podem rodar mais de uma vez (retentativas, worker que morreu): devem ser idempotentes.
+
+@job_queue.task('spotify.refresh_token', max_attempts=3, backoff=30.0, priority=10)
+def _refresh_spotify_token_job(user_id):
+    """ Renova antes de expirar o token de um usuário, para a página inicial não esperar pelo Spotify """
+    user = db.session.get(User, user_id)
+    if user is None or not user.spotify_refresh_token:
+        return
+    if user.spotify_token_expires and int(user.spotify_token_expires) > int(time.time()) + SPOTIFY_TOKEN_REFRESH_AHEAD:
+        return  # já foi renovado
+    _refresh_spotify_token(user)
+    db.session.commit()
+
+
+@job_queue.task('album.cache', max_attempts=3, backoff=60.0, priority=-10)
+def _cache_album_job(album_id):
+    """ Busca o álbum avaliado pelo disjuntor: a resposta fica salva e a página dele funciona com o Spotify fora """
+    upstream.call('album', get_album, album_id, model=AlbumDetails)
+
+
+@job_queue.task('upstream.purge', max_attempts=3, every=UPSTREAM_CACHE_PURGE_INTERVAL)
+def _purge_upstream_cache_job():
+    """ Apaga respostas salvas antigas (ou além do limite de linhas) para a tabela não crescer sem fim """
+    upstream.purge(UPSTREAM_CACHE_MAX_AGE, max_rows=UPSTREAM_CACHE_MAX_ROWS)
+
+
+@job_queue.task('leaderboards.rebuild', max_attempts=3, timeout=900, every=LEADERBOARD_REBUILD_INTERVAL)
+def _rebuild_leaderboards_job():
+    """ Reconstrução periódica dos rankings (envelhece as janelas de "em alta"); um worker por vez """
+    leaderboards.rebuild()
+
+# --- 3. ROTAS QUE SERVEM PÁGINAS HTML (Frontend) ---
+
+@app.route('/')
+def index():
+    """ Página Inicial """
+    # Busca as últimas reviews de todos os usuários
+    recent_reviews = Review.query.order_by(Review.id.desc()).limit(10).all()
+    # Tenta buscar lançamentos novos via Spotify (não quebra se falhar)
+    albums = []
+    most_listened = []
+    try:
+        albums = list(_spotify('new_releases', get_new_releases, limit=8, model=Album))
+    except Exception as e:
+        app.logger.debug(f"Não foi possível obter 'new releases' do Spotify: {e}")
+
+    # Fallback para desenvolvimento: sem lançamentos (nem resposta salva), usa amostras locais
+    if not albums:
+        albums = list(SAMPLE_ALBUMS)
+
+    # Monta lista de 'Mais Ouvidos' — prioriza recomendações personalizadas do usuário conectado ao Spotify
+    try:
+        rec_tracks = []
+        seed_artists = []
+        user_used_spotify = False
+
+        if current_user.is_authenticated and getattr(current_user, 'spotify_access_token', None):
+            access = current_user.spotify_access_token
+            try:
+                # refresh token se expirado; se só estiver perto de expirar, renova em segundo plano
+                expires = getattr(current_user, 'spotify_token_expires', None)
+                if expires and getattr(current_user, 'spotify_refresh_token', None):
+                    if int(expires) < int(time.time()):
+                        access = _refresh_spotify_token(current_user)
+                        db.session.commit()
+                    elif int(expires) < int(time.time()) + SPOTIFY_TOKEN_REFRESH_AHEAD:
+                        try:
+                            job_queue.enqueue('spotify.refresh_token', {'user_id': current_user.id},
+                                              dedup_key=f'spotify-token:{current_user.id}')
+                        except Exception as e:
+                            app.logger.debug(f"Não foi possível agendar a renovação do token: {e}")
+
+                # usa os top-artists do usuário como seeds (do snapshot diário, se houver)
+                try:
+                    seed_artists = _snapshot_top_artist_ids(current_user.id, limit=5)
+                    if not seed_artists:
+                        top_artists = _spotify('user_top_artists', get_user_top_artists, access, limit=5, cache=False)
+                        seed_artists = [a.get('id') for a in top_artists if a.get('id')][:5]
+                    if seed_artists:
+                        user_used_spotify = True
+                        rec_tracks = _spotify('recommendations', get_recommendations_user, access, seed_artists=seed_artists, limit=8,
+                                              cache=False, model=Track)
+                except Exception as e:
+                    app.logger.debug(f"User-scoped Spotify recommendations failed: {e}")
+            except Exception as e:
+                app.logger.debug(f"Spotify token refresh/check failed: {e}")
+
+        # Se não tiver recomendações de usuário, monta seeds a partir dos lançamentos e usa client-credentials
+        if not user_used_spotify:
+            seed_artists = _seed_artists_from_albums(albums, seed_artists)
+
+            if seed_artists:
+                try:
+                    rec_tracks = _spotify('recommendations', get_recommendations, seed_artists=seed_artists, limit=8, model=Track)
+                except Exception as e:
+                    app.logger.debug(f"Não foi possível obter recomendações do Spotify (status/erro): {e}")
+                    rec_tracks = []
+
+        most_listened = list(rec_tracks)
+
+        # fallback para top-tracks de artistas seed caso não tenha itens
+        if not most_listened and seed_artists:
+            most_listened = _artist_top_tracks(seed_artists)
+    except Exception as e:
+        app.logger.debug(f"Erro ao montar seeds para recomendações: {e}")
+
+    # Do not show sample fallback in the 'Mais Ouvidos' carousel.
+    # The carousel should show only user-based recommendations. If none are available,
+    # the frontend will show a CTA to connect Spotify (or prompt to login).
+    most_listened_user = bool(most_listened and current_user.is_authenticated and getattr(current_user, 'spotify_access_token', None))
+
+    # Pré-carrega os álbuns dos cards exibidos: o clique abre a página sem esperar o Spotify
+    prefetcher.schedule([a.id for a in albums if a not in SAMPLE_ALBUMS] +
+                        ([t.album_id for t in most_listened] if most_listened_user else []))
+
+    return render_template('index.html', reviews=recent_reviews, albums=albums, most_listened=most_listened,
+                           most_listened_user=most_listened_user, stale=g.get('spotify_stale', False))
+
+@app.route('/perfil/<username>')
+@login_required
+def profile(username):
+    """ Página de Perfil de um Usuário """
+    user = User.query.filter_by(username=username).first_or_404()
+    user_reviews = Review.query.filter_by(user_id=user.id).order_by(Review.id.desc()).all()
+    return render_template('profile.html', user=user, reviews=user_reviews)
+
+
+@app.route('/rankings')
+def leaderboards_page():
+    """ Página de Rankings: melhores avaliados, mais avaliados e em alta """
+    window = request.args.get('window', '7d')
+    if window not in TRENDING_WINDOWS:
+        window = '7d'
+    return render_template('leaderboards.html',
+                           top_rated=leaderboards.top_rated(limit=20),
+                           most_reviewed=leaderboards.most_reviewed(limit=20),
+                           trending=leaderboards.trending(window, limit=20),
+                           window=window, windows=list(TRENDING_WINDOWS))
+
+
+@app.route('/spotify/connect')
+@login_required
+def spotify_connect():
+    redirect_uri = url_for('spotify_callback', _external=True)
+    state = secrets.token_urlsafe(16)
+    session['spotify_oauth_state'] = state
+    try:
+        auth_url = build_authorize_url(redirect_uri, state=state)
+    except Exception as e:
+        flash('Não é possível iniciar conexão com Spotify: verifique configuração.', 'danger')
+        return redirect(url_for('profile', username=current_user.username))
+    return redirect(auth_url)
+
+
+@app.route('/spotify/callback')
+def spotify_callback():
+    error = request.args.get('error')
+    code = request.args.get('code')
+    state = request.args.get('state')
+    saved = session.pop('spotify_oauth_state', None)
+    if error:
+        flash(f'Spotify: {error}', 'danger')
+        return redirect(url_for('index'))
+    if not code or not state or state != saved:
+        flash('Falha na verificação de segurança do Spotify (state mismatch).', 'danger')
+        return redirect(url_for('index'))
+    if not current_user.is_authenticated:
+        flash('Faça login primeiro para conectar sua conta Spotify.', 'warning')
+        return redirect(url_for('login'))
+
+    redirect_uri = url_for('spotify_callback', _external=True)
+    try:
+        token_data = exchange_code_for_token(code, redirect_uri)
+        access = token_data.get('access_token')
+        refresh = token_data.get('refresh_token')
+        expires_in = token_data.get('expires_in')
+        profile = get_user_profile(access)
+        # store on user
+        current_user.spotify_id = profile.get('id')
+        current_user.spotify_access_token = access
+        current_user.spotify_refresh_token = refresh
+        if expires_in:
+            current_user.spotify_token_expires = int(time.time()) + int(expires_in)
+        db.session.commit()
+        flash('Conta Spotify conectada com sucesso!', 'success')
+    except Exception as e:
+        app.logger.exception('Erro ao completar OAuth Spotify')
+        flash('Erro ao conectar com o Spotify.', 'danger')
+
+    return redirect(url_for('profile', username=current_user.username))
+
+
+@app.route('/spotify/disconnect')
+@login_required
+def spotify_disconnect():
+    current_user.spotify_id = None
+    current_user.spotify_access_token = None
+    current_user.spotify_refresh_token = None
+    current_user.spotify_token_expires = None
+    db.session.commit()
+    flash('Conta Spotify desconectada.', 'info')
+    return redirect(url_for('profile', username=current_user.username))
+
+@app.route('/album/<album_id>')
+def album_details(album_id):
+    """ Página de Detalhes de um Álbum """
+    # 1. Busca dados do álbum na API externa
+    album_data = None
+    # Se houver uma API externa genérica configurada, tenta buscá-la primeiro
+    if MUSIC_API_KEY:
+        try:
+            resp = requests.get(f"{MUSIC_API_URL}/album/{album_id}", params={
+                'api_key': MUSIC_API_KEY,
+                'language': 'pt-BR'
+            })
+            resp.raise_for_status()
+            album_data = resp.json()
+        except requests.RequestException as e:
+            app.logger.error(f"Erro ao buscar álbum {album_id} na API externa: {e}")
+            flash('Erro ao carregar detalhes do álbum da API externa; tentando Spotify...', 'warning')
+        
+    # 2. Busca reviews deste álbum no nosso banco
+    album_reviews = Review.query.filter_by(album_id=album_id).all()
+    
+    # If album_data from external API is not present, try the album cache (filled by prefetch), the
+    # responses saved by any worker (the prefetch may have run in another process) and then Spotify
+    album = AlbumDetails.from_external(album_data) if album_data else album_cache.get(album_id)
+    if album is not None and not album_data:
+        metrics.incr('album_cache', result='hit')
+        prefetcher.mark_used(album_id)
+    elif album is None:
+        album = _shared_album(album_id)
+        if album is not None:
+            metrics.incr('album_cache', result='shared')
+            album_cache.set(album_id, album)
+            prefetcher.mark_used(album_id, shared=True)
+        else:
+            metrics.incr('album_cache', result='miss')
+            try:
+                album = _spotify('album', get_album, album_id, model=AlbumDetails)
+            except Exception as e:
+                app.logger.error(f"Erro ao buscar álbum na API: {e}")
+            if album and not g.get('spotify_stale'):
+                album_cache.set(album_id, album)
+                album_index.add_album(album)
+    return render_template('album_details.html', album=album, reviews=album_reviews, stale=g.get('spotify_stale', False))
+
+@app.route('/login', methods=['GET', 'POST'])
+def login():
+    """ Página de Login """
+    if current_user.is_authenticated:
+        return redirect(url_for('index'))
+    
+    if request.method == 'POST':
+        email = request.form.get('email')
+        password = request.form.get('password')
+        user = User.query.filter_by(email=email).first()
+        
+        if user and user.check_password(password):
+            # Refaz o hash se foi gerado com algoritmo/custo diferente do configurado
+            if user.password_needs_rehash():
+                try:
+                    user.set_password(password)
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    app.logger.warning(f"Falha ao atualizar hash de senha do usuário {user.id}: {e}")
+            login_user(user, remember=True)
+            flash('Login bem-sucedido!', 'success')
+            return redirect(url_for('index'))
+        else:
+            flash('Email ou senha inválidos.', 'danger')
+            
+    return render_template('login.html')
+
+@app.route('/logout')
+@login_required
+def logout():
+    """ Rota de Logout """
+    logout_user()
+    flash('Você foi desconectado.', 'info')
+    return redirect(url_for('index'))
+
+@app.route('/registrar', methods=['GET', 'POST'])
+def register():
+    """ Página de Registro """
+    if current_user.is_authenticated:
+        return redirect(url_for('index'))
+
+    if request.method == 'POST':
+        username = request.form.get('username')
+        email = request.form.get('email')
+        password = request.form.get('password')
+
+        # Verifica se email ou usuário já existem
+        if User.query.filter_by(email=email).first():
+            flash('Este email já está em uso.', 'danger')
+        elif User.query.filter_by(username=username).first():
+            flash('Este nome de usuário já está em uso.', 'danger')
+        else:
+            # Cria novo usuário
+            new_user = User(username=username, email=email)
+            new_user.set_password(password)
+            db.session.add(new_user)
+            db.session.commit()
+            
+            flash('Conta criada com sucesso! Faça login.', 'success')
+            return redirect(url_for('login'))
+
+    return render_template('register.html') # Você precisaria criar este template
+
+# --- 4. ROTAS DE API (Backend - Respondem com JSON) ---
+
+@app.route('/api/search_album')
+@login_required
+def api_search_album():
+    """ API para buscar álbuns: primeiro no índice local; o Spotify só é chamado se a busca local achar pouco """
+    query = (request.args.get('q') or '').strip()
+    if not query:
+        return jsonify({'error': 'Query não fornecida'}), 400
+    _load_album_index()
+    local = album_index.search(query, limit=10)
+    hits = [summary for _, summary in local]
+    if sum(1 for score, _ in local if score >= SEARCH_LOCAL_STRONG) >= SEARCH_LOCAL_MIN:
+        metrics.incr('album_search', source='local')
+        prefetcher.schedule(hit['id'] for hit in hits[:PREFETCH_SEARCH_RESULTS])
+        return stream_json_array(hits)
+    try:
+        items = _spotify('search', search_albums, query, limit=10, cache=False)
+    except Exception as e:
+        if hits:
+            # Spotify fora do ar (ou sem credenciais): respondemos só com o que o índice local achou
+            app.logger.debug(f"Busca no Spotify falhou, usando só resultados locais: {e}")
+            metrics.incr('album_search', source='local_fallback')
+            return stream_json_array(hits)
+        return _search_error(e)
+    remote = [Album.from_spotify(it) for it in items]
+    for album in remote:
+        album_index.add_album(album)
+    prefetcher.schedule(a.id for a in remote[:PREFETCH_SEARCH_RESULTS])
+    seen = {hit['id'] for hit in hits}
+    metrics.incr('album_search', source='merged' if hits else 'spotify')
+    # Resultados locais primeiro, completados pelos do Spotify
+    return stream_json_array((hits + [a.summary() for a in remote if a.id not in seen])[:10])
+
+
+def _search_error(e):
+    """ Resposta de erro da busca quando o Spotify falha e não há resultados locais """
+    if isinstance(e, CircuitOpen):
+        return jsonify({'error': 'Spotify indisponível no momento, tente novamente em instantes'}), 503
+    if isinstance(e, RuntimeError):
+        # Likely raised by spotify_client when credentials are missing
+        app.logger.warning(f"Spotify client runtime error: {e}")
+        return jsonify({'error': 'Chave da API não configurada', 'message': str(e)}), 400
+    # Log full traceback
+    app.logger.error("Erro ao buscar na API Spotify", exc_info=e)
+    # If it's an HTTPError from requests, include status and body if available
+    err_payload = {'error': 'Falha ao buscar dados externos'}
+    try:
+        import requests as _req
+        if isinstance(e, _req.HTTPError) and getattr(e, 'response', None) is not None:
+            resp = e.response
+            err_payload['status_code'] = resp.status_code
+            # include response body for debugging (safe in dev)
+            err_payload['response_text'] = resp.text
+    except Exception:
+        pass
+
+    # Also include the exception message (helpful in dev)
+    err_payload['message'] = str(e)
+    return jsonify(err_payload), 502
+
+
+@app.route('/api/leaderboards/<kind>')
+def api_leaderboard(kind):
+    """ API dos rankings: top-rated, most-reviewed ou trending (?window=24h|7d) """
+    try:
+        limit = max(1, min(int(request.args.get('limit', 20)), 100))
+    except ValueError:
+        return jsonify({'error': 'limit inválido'}), 400
+
+    def _stat_dict(stat):
+        return {
+            'album_id': stat.album_id,
+            'album_title': stat.album_title,
+            'review_count': stat.review_count,
+            'average': round(stat.average, 2),
+            'score': round(stat.score, 3),
+        }
+
+    if kind == 'top-rated':
+        items = (_stat_dict(s) for s in leaderboards.top_rated(limit))
+    elif kind == 'most-reviewed':
+        items = (_stat_dict(s) for s in leaderboards.most_reviewed(limit))
+    elif kind == 'trending':
+        window = request.args.get('window', '7d')
+        if window not in TRENDING_WINDOWS:
+            return jsonify({'error': f"window deve ser um de: {', '.join(TRENDING_WINDOWS)}"}), 400
+        items = (dict(_stat_dict(s), recent_reviews=count) for s, count in leaderboards.trending(window, limit))
+    else:
+        return jsonify({'error': 'Ranking desconhecido'}), 404
+    return stream_json_array(items, envelope={'kind': kind})
+
+
+@app.route('/api/review/export')
+@login_required
+def api_export_reviews():
+    """ API que exporta todas as reviews do usuário logado (stream: memória constante) """
+    query = db.session.query(
+        Review.id, Review.album_id, Review.album_title, Review.rating, Review.text, Review.client_key, Review.created_at
+    ).filter(Review.user_id == current_user.id).order_by(Review.id).execution_options(yield_per=500)
+    return stream_json_array({
+        'id': r.id, 'album_id': r.album_id, 'album_title': r.album_title, 'rating': r.rating,
+        'text': r.text, 'client_key': r.client_key, 'created_at': r.created_at,
+    } for r in query)
+
+
+@app.route('/_debug/env')
+def debug_env():
+    """Rota de debug para checar presença de variáveis de ambiente (não expõe valores)."""
+    return jsonify({
+        'SPOTIFY_CLIENT_ID_present': bool(os.environ.get('SPOTIFY_CLIENT_ID')),
+        'SPOTIFY_CLIENT_SECRET_present': bool(os.environ.get('SPOTIFY_CLIENT_SECRET')),
+        'MUSIC_API_KEY_present': bool(os.environ.get('MUSIC_API_KEY'))
+        ,
+        'DOTENV_path': DOTENV_PATH or '',
+        'cwd': os.getcwd()
+    })
+
+
+@app.route('/_debug/font')
+def debug_font():
+    """Rota de debug que verifica se o arquivo de fonte Grinched existe em static/fonts
+    e retorna a URL pública para testar no navegador.
+    """
+    font_path = os.path.join(app.root_path, 'static', 'fonts', 'Grinched-Regular.ttf')
+    exists = os.path.exists(font_path)
+    font_url = None
+    if exists:
+        try:
+            font_url = url_for('static', filename='fonts/Grinched-Regular.ttf', _external=True)
+        except Exception:
+            font_url = url_for('static', filename='fonts/Grinched-Regular.ttf')
+
+    return jsonify({'font_exists': exists, 'font_path': font_path, 'font_url': font_url})
+
+
+@app.route('/_debug/new_releases')
+def debug_new_releases():
+    """Rota de debug para retornar os novos lançamentos do Spotify (JSON).
+    Útil para verificar se a API está retornando álbuns e qual é a estrutura.
+    """
+    try:
+        albums = _spotify('new_releases', get_new_releases, limit=12, cache=False)
+        return stream_json_array(albums, envelope={'ok': True, 'count': len(albums)})
+    except Exception as e:
+        app.logger.exception('Erro ao obter new releases')
+        return jsonify({'ok': False, 'error': str(e)}), 500
+
+
+@app.route('/_debug/most_listened')
+def debug_most_listened():
+    """Recalcula a lista 'most_listened' usada no index e retorna o JSON para debug."""
+    try:
+        albums = list(_spotify('new_releases', get_new_releases, limit=8, model=Album))
+    except Exception as e:
+        app.logger.debug(f"Não foi possível obter 'new releases' do Spotify (debug route): {e}")
+        albums = []
+
+    # fallback samples
+    if not albums:
+        albums = list(SAMPLE_ALBUMS[:1])
+
+    seed_artists = _seed_artists_from_albums(albums)
+
+    most_listened = []
+    if seed_artists:
+        try:
+            rec_tracks = _spotify('recommendations', get_recommendations, seed_artists=seed_artists, limit=8, model=Track)
+        except Exception as e:
+            app.logger.debug(f"Debug: recomendações falharam: {e}")
+            rec_tracks = []
+        most_listened = list(rec_tracks)
+
+        # fallback to artist top tracks
+        if not most_listened:
+            most_listened = _artist_top_tracks(seed_artists)
+
+    return jsonify({'seed_artists': seed_artists, 'most_listened_count': len(most_listened), 'most_listened': most_listened})
+
+
+@app.route('/_debug/metrics')
+def debug_metrics():
+    """Métricas deste processo (chamadas ao Spotify, transições dos disjuntores), o estado atual dos disjuntores
+    e a fila de jobs: profundidade e latências por tarefa, gravadas no banco pelos processos do `flask worker`."""
+    return jsonify({'pid': os.getpid(), 'breakers': upstream.states(), 'prefetch': prefetcher.stats(),
+                    'jobs': {'workers': job_queue.workers_alive(), 'queue': job_queue.stats(),
+                             'timings': job_queue.timings()},
+                    'metrics': metrics.snapshot()})
+
+def _parse_review(data):
+    """ Valida o payload de uma review. Retorna (campos, None) ou (None, mensagem de erro) """
+    if not isinstance(data, dict):
+        return None, 'Review deve ser um objeto JSON.'
+
+    album_id = data.get('album_id')
+    title = data.get('album_title')
+    rating_value = data.get('rating')
+
+    if not album_id or not title or rating_value is None:
+        return None, 'Campos obrigatórios ausentes.'
+
+    # Tipos e tamanhos das colunas de Review: um item inválido não pode derrubar o lote inteiro
+    if not isinstance(album_id, str) or len(album_id) > 50:
+        return None, 'album_id deve ser um texto de até 50 caracteres.'
+    if not isinstance(title, str) or len(title) > 200:
+        return None, 'album_title deve ser um texto de até 200 caracteres.'
+    text_value = data.get('text', '')
+    if text_value is None:
+        text_value = ''
+    if not isinstance(text_value, str):
+        return None, 'text deve ser um texto.'
+    if isinstance(rating_value, bool):
+        return None, 'Rating inválido.'
+
+    try:
+        rating = int(rating_value)
+    except (TypeError, ValueError):
+        return None, 'Rating inválido.'
+
+    if not (1 <= rating <= 5):
+        return None, 'Rating deve ser entre 1 e 5.'
+
+    return {'album_id': album_id, 'album_title': title, 'rating': rating, 'text': text_value}, None
+
+
+def _save_reviews(rows):
+    """ Insere as reviews (lista de dicts com as colunas de Review) numa única transação,
+    atualizando os dados derivados (rankings) uma vez por lote """
+    now = datetime.utcnow()
+    for row in rows:
+        row.setdefault('created_at', now)
+        row.setdefault('updated_at', now)
+    if len(rows) == 1:
+        db.session.add(Review(**rows[0]))
+    else:
+        # executemany: um único INSERT preparado para o lote inteiro
+        db.session.execute(db.insert(Review), rows)
+    leaderboards.record(rows, now=now)
+    db.session.commit()
+    # Coloca o álbum na busca e atualiza a contagem de reviews (inclusive as gravadas por outros workers)
+    try:
+        _sync_album_index()
+    except Exception as e:
+        app.logger.warning(f"Falha ao atualizar o índice de busca: {e}")
+
+
+def _enqueue_album_cache(album_ids):
+    """ Agenda o job album.cache dos álbuns avaliados (a review já está salva; a resposta não espera) """
+    album_ids = list(dict.fromkeys(album_ids))
+    try:
+        job_queue.enqueue_many('album.cache', [({'album_id': a}, f'album-cache:{a}') for a in album_ids])
+    except Exception as e:
+        app.logger.warning(f"Não foi possível agendar o cache de {len(album_ids)} álbuns: {e}")
+
+
+@app.route('/api/review/add', methods=['POST'])
+@login_required
+def api_add_review():
+    """ API para adicionar uma nova review """
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({'status': 'error', 'message': 'JSON inválido ou ausente.'}), 400
+
+    fields, error = _parse_review(data)
+    if error:
+        return jsonify({'status': 'error', 'message': error}), 400
+
+    try:
+        _save_reviews([dict(fields, user_id=current_user.id)])
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Erro ao salvar review: {e}")
+        return jsonify({'status': 'error', 'message': 'Erro interno ao salvar review.'}), 500
+
+    _enqueue_album_cache([fields['album_id']])
+    return jsonify({'status': 'success', 'message': 'Review salva!'}), 201
+
+
+@app.route('/api/review/bulk', methods=['POST'])
+@login_required
+def api_add_reviews_bulk():
+    """ API para adicionar várias reviews de uma vez (importadores, sincronização offline).
+
+    Aceita {"reviews": [...]} (ou a lista diretamente). Cada item pode trazer um
+    `client_key`: itens cuja chave já foi registrada por este usuário são
+    ignorados, o que torna o reenvio de um lote seguro. Os itens válidos são
+    gravados numa única transação; a resposta traz o resultado de cada item.
+    """
+    data = request.get_json(silent=True)
+    items = data.get('reviews') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return jsonify({'status': 'error', 'message': 'JSON inválido ou lista de reviews vazia.'}), 400
+    if len(items) > REVIEW_BULK_MAX:
+        return jsonify({'status': 'error', 'message': f'Máximo de {REVIEW_BULK_MAX} reviews por requisição.'}), 413
+
+    results = []
+    rows = []
+    keys = {}
+    for index, item in enumerate(items):
+        fields, error = _parse_review(item)
+        if not error:
+            client_key = item.get('client_key')
+            if client_key is not None:
+                client_key = str(client_key)
+                if len(client_key) > 64:
+                    error = 'client_key deve ter no máximo 64 caracteres.'
+                elif client_key in keys:
+                    results.append({'index': index, 'status': 'duplicate'})
+                    continue
+                else:
+                    keys[client_key] = index
+        if error:
+            results.append({'index': index, 'status': 'error', 'message': error})
+            continue
+        rows.append(dict(fields, user_id=current_user.id, client_key=client_key))
+        results.append({'index': index, 'status': 'created'})
+
+    # Idempotência: descarta itens cujas chaves já foram gravadas em envios anteriores
+    if keys:
+        existing = set()
+        key_list = list(keys)
+        for i in range(0, len(key_list), 500):
+            chunk = key_list[i:i + 500]
+            existing.update(k for (k,) in db.session.query(Review.client_key).filter(
+                Review.user_id == current_user.id, Review.client_key.in_(chunk)))
+        if existing:
+            duplicated = {keys[k] for k in existing}
+            rows = [r for r in rows if r['client_key'] not in existing]
+            for result in results:
+                if result['index'] in duplicated:
+                    result['status'] = 'duplicate'
+
+    if rows:
+        try:
+            _save_reviews(rows)
+        except IntegrityError:
+            # Outro envio com as mesmas chaves foi gravado ao mesmo tempo; o cliente pode reenviar
+            db.session.rollback()
+            return jsonify({'status': 'error', 'message': 'Conflito de client_key; reenvie o lote.'}), 409
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Erro ao salvar lote de reviews: {e}")
+            return jsonify({'status': 'error', 'message': 'Erro interno ao salvar reviews.'}), 500
+        _enqueue_album_cache(row['album_id'] for row in rows)
+
+    counts = {status: sum(1 for r in results if r['status'] == status) for status in ('created', 'duplicate', 'error')}
+    if counts['error'] == len(results):
+        return jsonify({'status': 'error', 'counts': counts, 'results': results}), 400
+    status = 'partial' if counts['error'] else 'success'
+    return jsonify({'status': status, 'counts': counts, 'results': results}), 201 if rows else 200
+
+# --- 5. EXECUÇÃO DA APLICAÇÃO ---
+
+def init_db():
+    """ Cria as tabelas e aplica as migrações simples do esquema (idempotente) """
+    with app.app_context():
+        db.create_all()
+        # Verifica se as colunas novas existem e, se não, adiciona-as e popula com valores antigos quando possível.
+        # (Usa o inspector do SQLAlchemy em vez de PRAGMA para funcionar também no PostgreSQL.)
+        try:
+            inspector = inspect(db.engine)
+            cols = [c['name'] for c in inspector.get_columns('review')]
+
+            # Adiciona coluna 'album_id' se não existir
+            if 'album_id' not in cols:
+                db.session.execute(text("ALTER TABLE review ADD COLUMN album_id VARCHAR;"))
+                if 'tmdb_movie_id' in cols:
+                    db.session.execute(text("UPDATE review SET album_id = tmdb_movie_id;"))
+
+            # Adiciona coluna 'album_title' se não existir
+            if 'album_title' not in cols:
+                db.session.execute(text("ALTER TABLE review ADD COLUMN album_title VARCHAR;"))
+                if 'movie_title' in cols:
+                    db.session.execute(text("UPDATE review SET album_title = movie_title;"))
+
+            # Adiciona coluna 'client_key' (idempotência do envio em lote) se não existir
+            if 'client_key' not in cols:
+                db.session.execute(text("ALTER TABLE review ADD COLUMN client_key VARCHAR(64);"))
+
+            # Adiciona coluna 'created_at' (janelas do ranking "em alta"); reviews antigas ficam sem data
+            if 'created_at' not in cols:
+                db.session.execute(text("ALTER TABLE review ADD COLUMN created_at TIMESTAMP;"))
+
+            # Adiciona coluna 'updated_at' (chave do cache de fragmentos); reviews antigas usam a data de criação
+            if 'updated_at' not in cols:
+                db.session.execute(text("ALTER TABLE review ADD COLUMN updated_at TIMESTAMP;"))
+                db.session.execute(text("UPDATE review SET updated_at = created_at;"))
+
+            # Adiciona coluna 'source' (respostas pré-carregadas ainda não usadas) em upstream_cache
+            if 'source' not in [c['name'] for c in inspector.get_columns('upstream_cache')]:
+                db.session.execute(text("ALTER TABLE upstream_cache ADD COLUMN source VARCHAR(16);"))
+
+            # Pega lista de colunas da tabela 'user' e adiciona colunas do Spotify se necessário
+            # ('user' é palavra reservada no PostgreSQL, por isso vai entre aspas)
+            try:
+                user_columns = inspector.get_columns('user')
+                user_cols = [c['name'] for c in user_columns]
+                for col, col_type in (('spotify_id', 'VARCHAR'), ('spotify_access_token', 'VARCHAR'),
+                                      ('spotify_refresh_token', 'VARCHAR'), ('spotify_token_expires', 'INTEGER')):
+                    if col not in user_cols:
+                        db.session.execute(text(f'ALTER TABLE "user" ADD COLUMN {col} {col_type};'))
+                # password_hash passou de 128 para 256 caracteres (o SQLite não impõe o tamanho da coluna)
+                if db.engine.dialect.name == 'postgresql':
+                    hash_col = next((c for c in user_columns if c['name'] == 'password_hash'), None)
+                    if hash_col is not None and (getattr(hash_col['type'], 'length', None) or 256) < 256:
+                        db.session.execute(text('ALTER TABLE "user" ALTER COLUMN password_hash TYPE VARCHAR(256);'))
+            except Exception as e:
+                app.logger.debug(f"Erro ao migrar tabela user: {e}")
+
+            db.session.commit()
+
+            # create_all não cria índices novos em tabelas que já existiam
+            for table in db.metadata.sorted_tables:
+                for index in table.indexes:
+                    index.create(bind=db.engine, checkfirst=True)
+        except Exception as e:
+            app.logger.error(f"Erro na migração do esquema do DB: {e}")
+
+
+@serve.on_worker_start
+def _reset_db_pool():
+    # Com preload, o pool de conexões criado no master é herdado pelo fork;
+    # cada worker descarta as conexões herdadas (sem fechá-las) e abre as suas.
+    db.engine.dispose(close=False)
+
+
+@serve.on_worker_start
+def _warm_spotify_token():
+    # Obtém o token client-credentials antes do worker aceitar tráfego
+    if os.environ.get('SPOTIFY_CLIENT_ID') and os.environ.get('SPOTIFY_CLIENT_SECRET'):
+        get_spotify_token()
+
+
+@serve.on_worker_start
+def _start_job_fallback():
+    # Sem `flask worker` ativo, este processo executa os jobs vencidos (rankings, cache de álbuns...)
+    if JOB_FALLBACK_INTERVAL > 0:
+        job_queue.start_fallback(app, JOB_FALLBACK_INTERVAL)
+
+
+@serve.on_worker_start
+def _warm_album_index():
+    _load_album_index()
+    if ALBUM_INDEX_SNAPSHOT_INTERVAL > 0:
+        start_periodic_snapshot(app, album_index, ALBUM_INDEX_PATH, ALBUM_INDEX_SNAPSHOT_INTERVAL,
+                                sync=_sync_album_index)
+
+
+@app.cli.command('rebuild-leaderboards')
+def rebuild_leaderboards_command():
+    """ Reconstrói as tabelas de rankings a partir de todas as reviews """
+    init_db()
+    result = leaderboards.rebuild()
+    click.echo(f"Rankings reconstruídos: {result['albums']} álbuns, {result['reviews']} reviews em {result['seconds']:.2f}s")
+
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """ Recria do zero o índice de busca local a partir das reviews e salva o snapshot """
+    init_db()
+    started = time.perf_counter()
+    with app.app_context():
+        _index_reviews()
+    size = album_index.save(ALBUM_INDEX_PATH)
+    click.echo(f"Índice de busca: {len(album_index)} álbuns, {size} bytes em {ALBUM_INDEX_PATH} "
+               f"({time.perf_counter() - started:.2f}s)")
+
+
+@app.cli.command('build-assets')
+@click.option('--font-text', default='', help='Caracteres extras a manter no subset da fonte do logo.')
+def build_assets_command(font_text):
+    """ Gera static/dist: arquivos com hash no nome, versões .gz/.br e a fonte do logo em WOFF2 """
+    assets.build(app.static_folder, os.path.join(app.root_path, app.template_folder),
+                 extra_font_text=font_text, log=click.echo)
+    click.echo('Reinicie o servidor para usar o novo manifesto.')
+
+
+@app.cli.command('worker')
+@click.option('--threads', '-t', type=int, default=None, help='Jobs executados em paralelo (padrão: JOB_WORKER_THREADS ou 4).')
+@click.option('--burst', is_flag=True, help='Sai quando não houver mais jobs prontos (útil em cron e testes).')
+def worker_command(threads, burst):
+    """ Executa os jobs em segundo plano da fila no banco (rode um ou mais processos ao lado do `serve`) """
+    init_db()
+    stop = threading.Event()
+
+    def request_stop(signum, frame):
+        click.echo('Encerrando: aguardando os jobs em andamento...')
+        stop.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    job_queue.work(app, threads=threads or JOB_WORKER_THREADS, poll_interval=JOB_POLL_INTERVAL, burst=burst, stop=stop)
+
+
+@app.cli.command('jobs')
+@click.option('--retry-failed', is_flag=True, help='Recoloca na fila os jobs que esgotaram as tentativas.')
+@click.option('--task', default=None, help='Com --retry-failed, só os jobs desta tarefa.')
+def jobs_command(retry_failed, task):
+    """ Mostra a fila de jobs por tarefa e estado (quantidade, prontos e atraso do mais antigo) e as latências """
+    init_db()
+    with app.app_context():
+        if retry_failed:
+            click.echo(f"{job_queue.retry_failed(task)} jobs recolocados na fila")
+        rows = job_queue.stats()
+        timings = job_queue.timings()
+        workers = job_queue.workers_alive()
+    click.echo(f"Workers ativos: {workers}" if workers else
+               "Nenhum `flask worker` ativo: os jobs rodam nos processos do `serve` (JOB_FALLBACK_INTERVAL).")
+    if not rows:
+        click.echo('Fila vazia.')
+    for row in rows:
+        lag = f", mais antigo pronto há {row['lag']}s" if row['lag'] is not None else ''
+        click.echo(f"{row['task']:<24} {row['status']:<8} {row['count']:>6} ({row['due']} prontos{lag})")
+    if timings:
+        click.echo(f"\n{'tarefa':<24} {'execuções':>9} {'erros':>6} {'espera média/máx':>20} {'execução média/máx':>20}")
+    for t in timings:
+        click.echo(f"{t['task']:<24} {t['runs']:>9} {t['errors']:>6} {t['wait_avg']:>10.3f}s/{t['wait_max']:>7.3f}s "
+                   f"{t['run_avg']:>10.3f}s/{t['run_max']:>7.3f}s")
+
+
+@app.cli.command('serve')
+@click.option('--bind', '-b', default=None, help='Endereço host:porta (padrão: SERVE_BIND ou 0.0.0.0:8000).')
+@click.option('--workers', '-w', type=int, default=None, help='Número de processos (padrão: núcleos + 1).')
+@click.option('--threads', '-t', type=int, default=None, help='Threads por processo (padrão: 8).')
+@click.option('--reload', is_flag=True, help='Recarrega ao alterar o código (somente desenvolvimento).')
+def serve_command(bind, workers, threads, reload):
+    """ Serve a aplicação em produção com gunicorn (multi-processo, multi-thread).
+
+    Rode também `flask --app app worker` (jobs em segundo plano: rankings, cache dos álbuns avaliados,
+    renovação de tokens, limpeza do cache do Spotify). Sem ele, os processos web executam os jobs
+    a cada JOB_FALLBACK_INTERVAL segundos.
+    """
+    init_db()
+    with app.app_context():
+        workers_alive = job_queue.workers_alive()
+    if not workers_alive:
+        if JOB_FALLBACK_INTERVAL > 0:
+            click.echo(f"Aviso: nenhum `flask worker` ativo; os jobs rodarão nos processos web a cada "
+                       f"{JOB_FALLBACK_INTERVAL:g}s. Em produção rode `flask --app app worker`.", err=True)
+        else:
+            click.echo("Aviso: nenhum `flask worker` ativo e JOB_FALLBACK_INTERVAL=0: rankings e jobs da fila "
+                       "não serão processados. Rode `flask --app app worker`.", err=True)
+    serve.run(app, bind=bind, workers=workers, threads=threads, reload=reload or None)
+
+
+if __name__ == '__main__':
+    init_db()
+    # Roda o servidor Flask em modo de debug
+    # (Não use debug=True em produção! Para produção use `flask --app app serve`)
+    app.run(debug=True, port=5000)
@@ -0,0 +1,254 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+import zlib
+
+from flask import request, send_from_directory, url_for
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # brotli é opcional; sem ele só geramos/servimos gzip
+    brotli = None
+
+# Arquivos gerados por `flask build-assets` ficam em static/dist (nomes com hash do conteúdo)
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+# Um ano: os nomes mudam quando o conteúdo muda, então o navegador nunca precisa revalidar
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Tipos que valem a pena comprimir (woff2, png, jpg já são comprimidos)
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.json', '.txt', '.html', '.ttf', '.otf', '.ico', '.map'}
+COMPRESSIBLE_MIMETYPES = {'text/html', 'text/css', 'text/plain', 'application/json', 'application/javascript',
+                          'text/javascript', 'image/svg+xml'}
+SKIP_FILES = {'README.md'}
+
+# Fonte do logo e as classes que a usam: o subset só mantém os caracteres escritos com ela
+DISPLAY_FONT = 'fonts/Grinched-Regular.ttf'
+DISPLAY_FONT_CLASS = 'font-grinched'
+
+
+# --- Build ---
+
+def _fingerprint(name, data):
+    root, ext = os.path.splitext(name)
+    return f"{root}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def display_font_text(template_folder, css_class=DISPLAY_FONT_CLASS):
+    """Characters written with `css_class` in the templates (text of elements that carry the class)."""
+    pattern = re.compile(r'class="[^"]*\b' + re.escape(css_class) + r'\b[^"]*"[^>]*>([^<]*)<')
+    chars = set()
+    for dirpath, _, filenames in os.walk(template_folder):
+        for filename in filenames:
+            if filename.endswith('.html'):
+                with open(os.path.join(dirpath, filename), encoding='utf-8') as f:
+                    for text in pattern.findall(f.read()):
+                        chars.update(text)
+    return ''.join(sorted(chars))
+
+
+def subset_font(src, text):
+    """Subset `src` to the glyphs of `text` and return it as WOFF2 bytes (None without fontTools/brotli)."""
+    try:
+        from fontTools import subset
+    except ImportError:
+        return None
+    if brotli is None:
+        return None
+    options = subset.Options()
+    options.flavor = 'woff2'
+    options.layout_features = ['*']
+    options.name_IDs = ['*']
+    font = subset.load_font(src, options)
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(text=text)
+    subsetter.subset(font)
+    out = src + '.subset.tmp'
+    try:
+        subset.save_font(font, out, options)
+        with open(out, 'rb') as f:
+            return f.read()
+    finally:
+        if os.path.exists(out):
+            os.remove(out)
+
+
+def build(static_folder, template_folder, extra_font_text='', log=print):
+    """Fingerprint and precompress every static file into `static/dist` and write the manifest.
+
+    The display font is also subset to the characters used with
+    `.font-grinched` (plus `extra_font_text`) and converted to WOFF2 when
+    fontTools and brotli are installed. Returns the manifest dict.
+    """
+    dist = os.path.join(static_folder, DIST_DIR)
+    if os.path.isdir(dist):
+        shutil.rmtree(dist)
+
+    sources = {}
+    for dirpath, dirnames, filenames in os.walk(static_folder):
+        dirnames[:] = [d for d in dirnames if os.path.join(dirpath, d) != dist]
+        for filename in filenames:
+            if filename in SKIP_FILES or filename.startswith('.'):
+                continue
+            path = os.path.join(dirpath, filename)
+            name = os.path.relpath(path, static_folder).replace(os.sep, '/')
+            with open(path, 'rb') as f:
+                sources[name] = f.read()
+
+    font_path = os.path.join(static_folder, DISPLAY_FONT)
+    if os.path.exists(font_path):
+        text = display_font_text(template_folder) + extra_font_text
+        woff2 = subset_font(font_path, text)
+        if woff2 is None:
+            log('fontTools/brotli não instalados: fonte servida em TTF (pip install fonttools brotli)')
+        else:
+            sources[os.path.splitext(DISPLAY_FONT)[0] + '.woff2'] = woff2
+
+    manifest = {}
+    total = {'raw': 0, 'wire': 0}
+    for name, data in sorted(sources.items()):
+        hashed = _fingerprint(name, data)
+        target = os.path.join(dist, hashed)
+        _write(target, data)
+        manifest[name] = hashed
+        sizes = [f"{len(data):>9} B"]
+        wire = len(data)
+        if os.path.splitext(name)[1].lower() in COMPRESSIBLE_EXTENSIONS:
+            gz = gzip.compress(data, compresslevel=9, mtime=0)
+            _write(target + '.gz', gz)
+            sizes.append(f"gzip {len(gz):>8} B")
+            wire = len(gz)
+            if brotli is not None:
+                br = brotli.compress(data, quality=11)
+                _write(target + '.br', br)
+                sizes.append(f"br {len(br):>8} B")
+                wire = min(wire, len(br))
+        total['raw'] += len(data)
+        total['wire'] += wire
+        log(f"{name:<40} -> {DIST_DIR}/{hashed}  {'  '.join(sizes)}")
+
+    _write(os.path.join(dist, MANIFEST_NAME), json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    log(f"{len(manifest)} arquivos; {total['raw']} B originais, {total['wire']} B na rede (melhor variante)")
+    return manifest
+
+
+# --- Runtime ---
+
+def _load_manifest(static_folder):
+    try:
+        with open(os.path.join(static_folder, DIST_DIR, MANIFEST_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _accepts(encoding):
+    return request.accept_encodings[encoding] > 0
+
+
+def init_app(app, compress_min_size=1024, compress_level=6):
+    """Serve built assets with long caching and precompressed variants, and compress dynamic responses.
+
+    - `asset_url(name)` in templates returns the fingerprinted URL when the
+      asset was built (otherwise the plain static URL); `asset_exists(name)`
+      says whether it is available at all.
+    - The static view serves `file.br`/`file.gz` when the client accepts it,
+      and files under `dist/` as `immutable` for a year.
+    - HTML/JSON responses of at least `compress_min_size` bytes are
+      compressed on the fly (brotli if installed, else gzip); streamed ones
+      (e.g. `stream_json_array`) chunk by chunk, whatever their size. Files
+      (`direct_passthrough`) and Range requests are left alone.
+    """
+    manifest = _load_manifest(app.static_folder)
+    app.extensions['assets_manifest'] = manifest
+
+    def asset_url(name):
+        hashed = manifest.get(name)
+        if hashed:
+            return url_for('static', filename=f'{DIST_DIR}/{hashed}')
+        return url_for('static', filename=name)
+
+    def asset_exists(name):
+        return name in manifest or os.path.exists(os.path.join(app.static_folder, name))
+
+    app.jinja_env.globals.update(asset_url=asset_url, asset_exists=asset_exists)
+
+    def static_view(filename):
+        immutable = filename.startswith(DIST_DIR + '/')
+        max_age = IMMUTABLE_MAX_AGE if immutable else None
+        path = safe_join(app.static_folder, filename)
+        response = None
+        if path is not None:
+            for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+                if _accepts(encoding) and os.path.isfile(path + suffix):
+                    response = send_from_directory(app.static_folder, filename + suffix, max_age=max_age,
+                                                   mimetype=mimetypes.guess_type(filename)[0])
+                    response.headers['Content-Encoding'] = encoding
+                    break
+        if response is None:
+            response = send_from_directory(app.static_folder, filename, max_age=max_age)
+        response.vary.add('Accept-Encoding')
+        if immutable:
+            response.cache_control.public = True
+            response.cache_control.immutable = True
+        return response
+
+    app.view_functions['static'] = static_view
+
+    @app.after_request
+    def compress_response(response):
+        if (response.direct_passthrough or response.status_code < 200
+                or response.status_code in (204, 206, 304) or 'Range' in request.headers
+                or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+        response.vary.add('Accept-Encoding')
+        if not response.is_streamed and (response.content_length or 0) < compress_min_size:
+            return response
+        if brotli is not None and _accepts('br'):
+            encoding = 'br'
+        elif _accepts('gzip'):
+            encoding = 'gzip'
+        else:
+            return response
+        if response.is_streamed:
+            # Tamanho desconhecido: comprime cada pedaço e já o envia (flush), sem juntar o corpo
+            response.response = _compress_stream(response.iter_encoded(), response.response, encoding, compress_level)
+            response.headers.pop('Content-Length', None)
+        elif encoding == 'br':
+            response.set_data(brotli.compress(response.get_data(), quality=4))
+        else:
+            response.set_data(gzip.compress(response.get_data(), compresslevel=compress_level))
+        response.headers['Content-Encoding'] = encoding
+        # ETag fraco: o corpo comprimido não é byte a byte o mesmo da representação original
+        if response.get_etag()[0]:
+            response.set_etag(response.get_etag()[0], weak=True)
+        return response
+
+
+def _compress_stream(chunks, source, encoding, level):
+    """Compress `chunks` (bytes) as they come, flushing after each one; closes `source` at the end."""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=4)
+        compress, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # formato gzip
+        compress, flush, finish = compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+    try:
+        for chunk in chunks:
+            if chunk:
+                yield compress(chunk) + flush()
+        yield finish()
+    finally:
+        if hasattr(source, 'close'):
+            source.close()
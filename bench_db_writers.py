@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""
+Benchmark: N processos escrevendo reviews em paralelo no mesmo banco.
+Mede a vazão de escrita (commits/s), a latência dos commits e quantos
+commits falharam com `database is locked` ou esperaram pelo lock.
+
+Como usar:
+  python bench_db_writers.py                      # SQLite temporário, perfil tunado (WAL)
+  python bench_db_writers.py --baseline           # SQLite temporário, opções padrão do SQLAlchemy
+  python bench_db_writers.py --writers 8 --writes 500
+  DATABASE_URL=postgresql://... python bench_db_writers.py
+
+Compare a saída com e sem `--baseline` para ver o efeito do perfil.
+"""
+import argparse
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from database import normalize_database_url, engine_options, install_sqlite_pragmas
+
+# Commits acima deste tempo são contados como "esperaram pelo lock"
+LOCK_WAIT_THRESHOLD = 0.05
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bench_review (
+    id {pk},
+    album_id VARCHAR(50) NOT NULL,
+    rating INTEGER NOT NULL,
+    text TEXT,
+    user_id INTEGER NOT NULL
+)
+"""
+
+
+def make_engine(url, baseline):
+    if baseline:
+        return create_engine(url)
+    install_sqlite_pragmas()
+    return create_engine(url, **engine_options(url))
+
+
+def writer(args):
+    url, baseline, worker_id, writes = args
+    engine = make_engine(url, baseline)
+    latencies = []
+    locked = 0
+    for i in range(writes):
+        start = time.perf_counter()
+        try:
+            with engine.begin() as conn:
+                conn.execute(text("INSERT INTO bench_review (album_id, rating, text, user_id) VALUES (:a, :r, :t, :u)"),
+                             {'a': f'album{i % 50}', 'r': i % 5 + 1, 't': 'x' * 200, 'u': worker_id})
+        except OperationalError as e:
+            if 'locked' in str(e) or 'busy' in str(e):
+                locked += 1
+                continue
+            raise
+        latencies.append(time.perf_counter() - start)
+    engine.dispose()
+    return latencies, locked
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--writes', type=int, default=300, help='commits por processo')
+    parser.add_argument('--baseline', action='store_true', help='usa as opções padrão do engine (sem perfil)')
+    opts = parser.parse_args()
+
+    url = os.environ.get('DATABASE_URL')
+    if not url:
+        url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    url = normalize_database_url(url)
+
+    engine = make_engine(url, opts.baseline)
+    schema = SCHEMA.format(pk='SERIAL PRIMARY KEY' if url.startswith('postgresql') else 'INTEGER PRIMARY KEY')
+    with engine.begin() as conn:
+        conn.execute(text(schema))
+        conn.execute(text("DELETE FROM bench_review"))
+    engine.dispose()
+
+    print(f"Banco: {url} | perfil: {'padrão' if opts.baseline else 'tunado'} | {opts.writers} writers x {opts.writes} commits")
+    jobs = [(url, opts.baseline, w, opts.writes) for w in range(opts.writers)]
+    start = time.perf_counter()
+    with multiprocessing.Pool(opts.writers) as pool:
+        results = pool.map(writer, jobs)
+    elapsed = time.perf_counter() - start
+
+    latencies = [lat for lats, _ in results for lat in lats]
+    locked = sum(n for _, n in results)
+    total = opts.writers * opts.writes
+    waited = sum(1 for lat in latencies if lat > LOCK_WAIT_THRESHOLD)
+    latencies.sort()
+    print(f"Commits ok: {len(latencies)}/{total} em {elapsed:.2f}s -> {len(latencies) / elapsed:.0f} commits/s")
+    print(f"'database is locked': {locked} ({100.0 * locked / total:.1f}%)")
+    print(f"Esperaram > {LOCK_WAIT_THRESHOLD * 1000:.0f}ms pelo lock: {waited} ({100.0 * waited / total:.1f}%)")
+    if latencies:
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(f"Latência do commit: p50={statistics.median(latencies) * 1000:.1f}ms p99={p99 * 1000:.1f}ms max={latencies[-1] * 1000:.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
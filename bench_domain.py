@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""
+Benchmark: memória por objeto e vazão de parsing dos objetos de domínio
+(domain.Album / domain.AlbumDetails / domain.Track) comparados aos dicts
+montados antes no index().
+
+Usa payloads sintéticos no formato da API do Spotify (sem rede).
+
+Como usar:
+  python bench_domain.py
+  python bench_domain.py --count 20000
+"""
+import argparse
+import time
+import tracemalloc
+
+from domain import Album, AlbumDetails, Track
+
+MARKETS = ['AD', 'AE', 'AR', 'AT', 'AU', 'BE', 'BR', 'CA', 'CH', 'CL', 'CO', 'DE', 'DK', 'ES', 'FI', 'FR',
+           'GB', 'IE', 'IT', 'JP', 'MX', 'NL', 'NO', 'NZ', 'PT', 'SE', 'US', 'UY'] * 6
+
+
+def spotify_album(i):
+    artist = {'id': f'artist{i}', 'name': f'Artist {i}', 'type': 'artist', 'uri': f'spotify:artist:artist{i}',
+              'href': f'https://api.spotify.com/v1/artists/artist{i}',
+              'external_urls': {'spotify': f'https://open.spotify.com/artist/artist{i}'}}
+    return {
+        'album_type': 'album', 'id': f'album{i}', 'name': f'Album {i}', 'artists': [artist],
+        'images': [{'url': f'https://i.scdn.co/image/{i}-{w}', 'width': w, 'height': w} for w in (640, 300, 64)],
+        'available_markets': list(MARKETS), 'release_date': '2024-05-17', 'release_date_precision': 'day',
+        'total_tracks': 12, 'type': 'album', 'uri': f'spotify:album:album{i}',
+        'href': f'https://api.spotify.com/v1/albums/album{i}',
+        'external_urls': {'spotify': f'https://open.spotify.com/album/album{i}'},
+    }
+
+
+def spotify_track(i):
+    return {'id': f'track{i}', 'name': f'Track {i}', 'artists': spotify_album(i)['artists'], 'album': spotify_album(i),
+            'preview_url': None, 'duration_ms': 201000, 'popularity': 61, 'explicit': False,
+            'available_markets': list(MARKETS), 'track_number': 3, 'disc_number': 1}
+
+
+# Formatos usados antes dos objetos de domínio (index() / debug_most_listened)
+def dict_album(a):
+    return {
+        'id': a.get('id'),
+        'name': a.get('name') or a.get('album_title') or '—',
+        'artists': [{'name': ar.get('name') if isinstance(ar, dict) else str(ar)} for ar in a.get('artists', [])] if a.get('artists') else [],
+        'images': a.get('images') or []
+    }
+
+
+def dict_track(t):
+    img = None
+    if t.get('album') and t['album'].get('images'):
+        img = t['album']['images'][0].get('url')
+    return {'id': t.get('id'), 'name': t.get('name'), 'artists': ', '.join([ar.get('name') for ar in t.get('artists', [])]),
+            'image': img, 'preview_url': t.get('preview_url'), 'album_id': t.get('album', {}).get('id')}
+
+
+def measure(label, make, count, parse):
+    # Memória retida: cada objeto sai de um payload novo, descartado em seguida; o que o
+    # resultado ainda referencia do payload (ex.: a lista 'images' do dict) entra na conta
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    objs = [parse(make(i)) for i in range(count)]
+    size = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    # Tempo só do parsing, sem o overhead do tracemalloc
+    payloads = [make(i) for i in range(count)]
+    start = time.perf_counter()
+    [parse(p) for p in payloads]
+    elapsed = time.perf_counter() - start
+    print(f"{label:<42} {size / count:>10.0f} B/obj {count / elapsed:>12.0f} obj/s")
+    return objs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=5000)
+    opts = parser.parse_args()
+
+    n = opts.count
+    print(f"{n} itens por caso (memória retida após o parsing, incluindo o que sobra do payload)\n")
+    measure('álbum: payload bruto do Spotify', spotify_album, n, lambda a: a)
+    measure('álbum: dict normalizado (_normalize_album)', spotify_album, n, dict_album)
+    measure('álbum: domain.Album (listas, busca)', spotify_album, n, Album.from_spotify)
+    measure('álbum: domain.AlbumDetails (página)', spotify_album, n, AlbumDetails.from_spotify)
+    print()
+    measure('faixa: payload bruto do Spotify', spotify_track, n, lambda t: t)
+    measure('faixa: dict do carrossel', spotify_track, n, dict_track)
+    measure('faixa: domain.Track', spotify_track, n, Track.from_spotify)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+"""
+Benchmark: logins por segundo por núcleo para cada método de hash de senha.
+Cada login verifica um hash (check_password_hash), então o custo do hash
+limita a vazão de login/registro de cada núcleo.
+
+Como usar:
+  python bench_password_hash.py
+  python bench_password_hash.py --seconds 3 scrypt:16384:8:1 pbkdf2:sha256:600000
+
+Escolha o método com PASSWORD_HASH_METHOD (veja passwords.py); usuários com
+hash antigo são migrados no próximo login.
+"""
+import argparse
+import time
+
+from passwords import DEFAULT_METHOD, canonical_method, hash_password, verify_password
+
+METHODS = [
+    'scrypt:16384:8:1',
+    'scrypt:32768:8:1',
+    'scrypt:65536:8:1',
+    'pbkdf2:sha256:260000',
+    'pbkdf2:sha256:600000',
+    'pbkdf2:sha256:1000000',
+]
+
+
+def logins_per_second(method, seconds):
+    stored = hash_password('senha-de-teste', method)
+    count = 0
+    start = time.perf_counter()
+    while True:
+        verify_password(stored, 'senha-de-teste')
+        count += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            return count / elapsed, len(stored)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('methods', nargs='*', default=METHODS)
+    parser.add_argument('--seconds', type=float, default=1.0, help='tempo de medição por método')
+    opts = parser.parse_args()
+
+    print(f"{'método':<28} {'logins/s/núcleo':>16} {'ms/login':>10} {'tam. hash':>10}")
+    for method in opts.methods:
+        rate, length = logins_per_second(method, opts.seconds)
+        marker = '  <- padrão' if canonical_method(method) == canonical_method(DEFAULT_METHOD) else ''
+        print(f"{canonical_method(method):<28} {rate:>16.1f} {1000.0 / rate:>10.1f} {length:>10}{marker}")
+
+
+if __name__ == '__main__':
+    main()
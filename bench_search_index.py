@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+Benchmark: índice local de busca de álbuns (search_index.AlbumIndex).
+Mede o tempo de montagem, a latência das buscas (prefixos sendo digitados e
+buscas com erro de digitação) e o tamanho/tempo do snapshot em disco.
+
+Como usar:
+  python bench_search_index.py
+  python bench_search_index.py --albums 100000 --queries 5000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from search_index import AlbumIndex
+
+WORDS = ('love', 'night', 'blue', 'dream', 'fire', 'city', 'heart', 'gold', 'road', 'summer', 'ghost', 'river',
+         'saudade', 'coração', 'noite', 'estrela', 'mar', 'sertão', 'samba', 'rock', 'electric', 'wild', 'young',
+         'midnight', 'paradise', 'revolution', 'silence', 'echoes', 'horizon', 'velvet', 'neon', 'thunder')
+ARTISTS = ('Banda', 'The', 'Los', 'MC', 'DJ', 'Orquestra', 'Trio', 'Quarteto')
+
+
+SYLLABLES = ('ba', 'ca', 'da', 'lo', 'ma', 'ne', 'ri', 'so', 'ta', 'vi', 'ze', 'ko', 'lu', 'pa', 'ra', 'te', 'mi', 'no')
+
+
+def fake_catalog(n, rng, vocabulary=4000):
+    # Palavras comuns no topo e uma cauda longa de palavras inventadas, com frequência de Zipf
+    words = list(WORDS) + [''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(vocabulary)]
+    weights = [1 / rank for rank in range(1, len(words) + 1)]
+    for i in range(n):
+        title = ' '.join(rng.choices(words, weights, k=rng.randint(1, 4))).title()
+        artist = f"{rng.choice(ARTISTS)} {rng.choices(words, weights)[0].title()}"
+        yield f'album{i}', title, artist
+
+
+def typo(word, rng):
+    if len(word) < 4:
+        return word
+    i = rng.randrange(1, len(word) - 1)
+    return word[:i] + word[i + 1:]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--albums', type=int, default=20000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=42)
+    opts = parser.parse_args()
+    rng = random.Random(opts.seed)
+
+    catalog = list(fake_catalog(opts.albums, rng))
+    index = AlbumIndex()
+    start = time.perf_counter()
+    for album_id, name, artist in catalog:
+        index.add(album_id, name, artist, reviews=rng.randint(0, 20))
+    print(f"Montagem: {len(index)} álbuns em {time.perf_counter() - start:.2f}s")
+
+    cases = {'prefixo': [], 'erro de digitação': []}
+    for _ in range(opts.queries):
+        album_id, name, _ = rng.choice(catalog)
+        words = name.lower().split()
+        cases['prefixo'].append((' '.join(words[:-1] + [words[-1][:rng.randint(1, len(words[-1]))]]), name))
+        cases['erro de digitação'].append((' '.join(typo(w, rng) for w in words), name))
+
+    # 'no top 10': um álbum com o título de onde a busca foi tirada aparece entre os 10 resultados
+    # (prefixos curtos como "lo" casam com centenas de títulos, então ficar de fora nem sempre é erro)
+    print(f"\n{'busca':<20} {'p50':>9} {'p99':>9} {'máx':>9} {'no top 10':>10}")
+    for label, queries in cases.items():
+        times, found = [], 0
+        for q, name in queries:
+            start = time.perf_counter()
+            hits = index.search(q, limit=10)
+            times.append((time.perf_counter() - start) * 1000)
+            found += any(hit['name'] == name for _, hit in hits)
+        print(f"{label:<20} {percentile(times, 0.5):>7.3f}ms {percentile(times, 0.99):>7.3f}ms "
+              f"{max(times):>7.3f}ms {found / len(queries):>9.0%}")
+
+    path = os.path.join(tempfile.mkdtemp(prefix='album-index-'), 'album_index.pickle')
+    start = time.perf_counter()
+    size = index.save(path)
+    saved = time.perf_counter() - start
+    start = time.perf_counter()
+    AlbumIndex().load(path)
+    loaded = time.perf_counter() - start
+    os.remove(path)
+    print(f"\nSnapshot: {size / 1024 / 1024:.1f} MiB, salvo em {saved:.2f}s, carregado em {loaded:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
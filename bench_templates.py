@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""
+Benchmark: tempo de renderização da página inicial e do perfil com 10, 100 e
+1000 reviews, sem cache de fragmentos, com o cache frio (primeira visita) e
+quente ({% cache %} já preenchido), e o tempo de carregar todos os templates
+num processo novo com e sem o cache de bytecode.
+
+Como usar:
+  python bench_templates.py
+  python bench_templates.py --repeat 20 10 100 1000 5000
+"""
+import argparse
+import shutil
+import tempfile
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+from flask import render_template
+from jinja2 import Environment, FileSystemBytecodeCache
+
+from app import app
+from cache import TTLCache
+
+
+def fake_reviews(n):
+    now = datetime.utcnow()
+    return [SimpleNamespace(
+        id=i, album_id=f'album{i % 50}', album_title=f'Álbum {i % 50}', rating=i % 5 + 1,
+        text=('Ótimo disco, produção impecável e letras marcantes. ' * 3) if i % 3 else '',
+        author=SimpleNamespace(username=f'user{i % 20}'), updated_at=now,
+    ) for i in range(n)]
+
+
+def render_ms(template, context, repeat, before_each=None):
+    best = float('inf')
+    for _ in range(repeat):
+        if before_each:
+            before_each()
+        start = time.perf_counter()
+        render_template(template, **context)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def bench_render(sizes, repeat):
+    cache = app.jinja_env.fragment_cache
+    user = SimpleNamespace(username='user0', email='user0@example.com', spotify_id=None)
+    print(f"{'página':<10} {'reviews':>8} {'sem cache':>12} {'cache frio':>12} {'cache quente':>13} {'ganho':>7}")
+    for template, extra in (('index.html', {'albums': [], 'most_listened': [], 'most_listened_user': False}),
+                            ('profile.html', {'user': user})):
+        for n in sizes:
+            context = dict(extra, reviews=fake_reviews(n))
+            with app.test_request_context('/'):
+                app.jinja_env.fragment_cache = None
+                plain = render_ms(template, context, repeat)
+                app.jinja_env.fragment_cache = cache
+                cold = render_ms(template, context, repeat, before_each=cache.clear)
+                warm = render_ms(template, context, repeat)
+            print(f"{template:<10} {n:>8} {plain:>10.2f}ms {cold:>10.2f}ms {warm:>11.2f}ms {plain / warm:>6.1f}x")
+
+
+def bench_compile(repeat):
+    names = [n for n in app.jinja_env.list_templates() if n.endswith('.html')]
+    directory = tempfile.mkdtemp(prefix='jinja-bytecode-')
+
+    def load_all(bytecode_cache):
+        env = Environment(loader=app.jinja_env.loader, extensions=list(app.jinja_env.extensions),
+                          bytecode_cache=bytecode_cache, autoescape=True)
+        env.filters.update(app.jinja_env.filters)
+        start = time.perf_counter()
+        for name in names:
+            env.get_template(name)
+        return time.perf_counter() - start
+
+    try:
+        load_all(FileSystemBytecodeCache(directory))  # preenche o cache, como o primeiro worker
+        source = min(load_all(None) for _ in range(repeat)) * 1000
+        cached = min(load_all(FileSystemBytecodeCache(directory)) for _ in range(repeat)) * 1000
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    print(f"\nCarregar {len(names)} templates num processo novo: "
+          f"{source:.1f}ms compilando, {cached:.1f}ms com bytecode em cache ({source / cached:.1f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('sizes', nargs='*', type=int, default=[10, 100, 1000])
+    parser.add_argument('--repeat', type=int, default=10, help='renderizações por caso (vale a melhor)')
+    opts = parser.parse_args()
+
+    app.debug = False
+    if app.jinja_env.fragment_cache is None:
+        app.jinja_env.fragment_cache = TTLCache(ttl=300, maxsize=max(opts.sizes) * 2)
+    bench_render(opts.sizes, opts.repeat)
+    bench_compile(opts.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""Fixtures dos testes automatizados (pytest).
+
+Os testes rodam contra um banco SQLite temporário, recriado a cada teste; as
+variáveis de ambiente abaixo são definidas antes de o app ser importado, então
+também valem para os subprocessos que os testes abrem (outros "workers").
+"""
+import os
+import subprocess
+import sys
+import tempfile
+
+import pytest
+
+import metrics
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+_TMP = tempfile.mkdtemp(prefix='mycdrecords-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_TMP, 'test.db')
+os.environ['ALBUM_INDEX_PATH'] = os.path.join(_TMP, 'album_index.pickle')
+
+
+@pytest.fixture
+def app_module():
+    """O módulo `app` com o banco vazio e sem estado em memória de testes anteriores."""
+    import app as module
+    with module.app.app_context():
+        module.db.drop_all()
+    module.init_db()
+    module.upstream._states.clear()
+    module.upstream._stale.clear()
+    module.upstream._recent_writes.clear()
+    module.leaderboards._global_mean = None
+    metrics.reset()
+    yield module
+    with module.app.app_context():
+        module.db.session.remove()
+
+
+@pytest.fixture
+def counter():
+    """Valor de um contador de `metrics` (somando os que têm os labels pedidos)."""
+    def value(name, **labels):
+        return sum(m['value'] for m in metrics.snapshot()
+                   if m['name'] == name and 'value' in m
+                   and all(m['labels'].get(k) == v for k, v in labels.items()))
+    return value
+
+
+@pytest.fixture
+def other_process():
+    """Roda `code` num processo Python separado (outro worker), com `import app as m` já feito."""
+    def run(code):
+        subprocess.run([sys.executable, '-c', 'import app as m\n' + code], cwd=ROOT, check=True,
+                       capture_output=True, timeout=60)
+    return run
@@ -0,0 +1,148 @@
+import os
+import sqlite3
+from types import SimpleNamespace
+
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import IntegrityError
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def normalize_database_url(url):
+    """Accept the legacy `postgres://` scheme (Heroku, Render...) used in DATABASE_URL."""
+    if url.startswith('postgres://'):
+        return 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def sqlite_pragmas():
+    """PRAGMAs applied to every new SQLite connection.
+
+    WAL lets readers proceed while a writer commits, and busy_timeout makes a
+    second writer wait for the lock instead of failing at once with
+    `database is locked`. synchronous=NORMAL is durable under WAL except for
+    the last transactions on power loss, and mmap avoids read() copies.
+    """
+    return [
+        ('journal_mode', 'WAL'),
+        ('busy_timeout', _env_int('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+        ('synchronous', 'NORMAL'),
+        ('mmap_size', _env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+        ('temp_store', 'MEMORY'),
+    ]
+
+
+def engine_options(url):
+    """Return SQLALCHEMY_ENGINE_OPTIONS for the backend selected by `url`."""
+    backend = make_url(url).get_backend_name()
+    if backend == 'sqlite':
+        return {
+            # Timeout do driver (segundos) coerente com o busy_timeout
+            'connect_args': {'timeout': _env_int('SQLITE_BUSY_TIMEOUT_MS', 5000) / 1000.0},
+        }
+    if backend == 'postgresql':
+        statement_timeout = _env_int('DB_STATEMENT_TIMEOUT_MS', 5000)
+        return {
+            'pool_size': _env_int('DB_POOL_SIZE', 5),
+            'max_overflow': _env_int('DB_MAX_OVERFLOW', 10),
+            'pool_timeout': _env_int('DB_POOL_TIMEOUT', 10),
+            # Recicla conexões antes que o servidor/proxy as derrube por inatividade
+            'pool_recycle': _env_int('DB_POOL_RECYCLE', 1800),
+            'pool_pre_ping': True,
+            'connect_args': {'options': f'-c statement_timeout={statement_timeout}'},
+        }
+    return {'pool_pre_ping': True}
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in sqlite_pragmas():
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
+
+
+def install_sqlite_pragmas():
+    """Apply `sqlite_pragmas()` on connect for every SQLite engine (idempotent)."""
+    if not event.contains(Engine, 'connect', _set_sqlite_pragmas):
+        event.listen(Engine, 'connect', _set_sqlite_pragmas)
+
+
+def _on_conflict_insert(conn):
+    """The dialect's insert() with ON CONFLICT support (SQLite, PostgreSQL), or None for other databases."""
+    dialect = conn.dialect.name if hasattr(conn, 'dialect') else conn.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert
+
+
+def insert_ignore(conn, table, row):
+    """INSERT that does nothing if a unique key already exists (another writer won the race).
+
+    `conn` is a Connection or a Session. Returns True if the row was inserted.
+    Databases without ON CONFLICT (e.g. MySQL) run a plain INSERT in a
+    savepoint and ignore the key violation.
+    """
+    dialect_insert = _on_conflict_insert(conn)
+    if dialect_insert is None:
+        try:
+            with conn.begin_nested():
+                conn.execute(insert(table).values(**row))
+        except IntegrityError:
+            return False
+        return True
+    return conn.execute(dialect_insert(table).values(**row).on_conflict_do_nothing()).rowcount == 1
+
+
+def upsert(conn, table, rows, index_elements, set_):
+    """INSERT ... ON CONFLICT DO UPDATE of `rows` (a list of dicts) keyed by `index_elements`.
+
+    `set_` maps column names to a function of (current, excluded) returning
+    the new value, so counters are incremented in the database. Databases
+    without ON CONFLICT (e.g. MySQL) go through `_upsert_locked`.
+    """
+    dialect_insert = _on_conflict_insert(conn)
+    if dialect_insert is None:
+        _upsert_locked(conn, table, rows, index_elements, set_)
+        return
+    stmt = dialect_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={name: value(table.c, stmt.excluded) for name, value in set_.items()},
+    )
+    conn.execute(stmt, rows)
+
+
+def _upsert_locked(conn, table, rows, index_elements, set_):
+    """Portable upsert, one row at a time: SELECT ... FOR UPDATE, then UPDATE with the values
+    computed in Python by the same `set_` functions, or INSERT if the row does not exist.
+
+    Slower than ON CONFLICT, but the row lock keeps the counters correct under
+    concurrent writers (MySQL's ON DUPLICATE KEY UPDATE would evaluate later
+    columns after earlier ones had already been updated).
+    """
+    for row in rows:
+        key = [table.c[name] == row[name] for name in index_elements]
+        for attempt in range(2):
+            current = conn.execute(select(table).where(*key).with_for_update()).first()
+            if current is not None:
+                excluded = SimpleNamespace(**row)
+                conn.execute(update(table).where(*key).values(
+                    {name: value(current, excluded) for name, value in set_.items()}))
+                break
+            if insert_ignore(conn, table, row):
+                break
+            # Outra transação inseriu a linha nesse meio-tempo: na segunda volta ela é atualizada
+            if attempt:
+                raise IntegrityError(f'upsert em {table.name}', row, None)
@@ -0,0 +1,217 @@
+"""Compact album/track/artist objects parsed once from Spotify payloads.
+
+Spotify items carry many fields we never render (available_markets alone is
+~180 strings per album). These classes keep only what the templates and the
+API use, with __slots__ so each instance has no per-object __dict__, and
+round-trip through `to_dict`/`from_dict` for caching. Albums in lists and
+search results (`Album`) keep a single cover URL; every resolution, the
+tracks and the label only live on the album page object (`AlbumDetails`).
+"""
+
+# Largura (px) desejada para capas em miniatura (cards e carrosséis)
+THUMB_SIZE = 300
+
+
+class Image:
+    __slots__ = ('url', 'width', 'height')
+
+    def __init__(self, url, width=None, height=None):
+        self.url = url
+        self.width = width
+        self.height = height
+
+    @classmethod
+    def from_spotify(cls, data):
+        return cls(data.get('url'), data.get('width'), data.get('height'))
+
+    def to_dict(self):
+        return {'url': self.url, 'width': self.width, 'height': self.height}
+
+
+def pick_image(images, target=THUMB_SIZE):
+    """Return the URL of the smallest image at least `target` px wide (else the largest).
+
+    `images` are the raw Spotify dicts (`url`, `width`, `height`), so list
+    entries get their cover without building an Image per resolution.
+    """
+    big_enough = largest = None
+    for img in images or ():
+        url = img.get('url') if isinstance(img, dict) else None
+        if not url:
+            continue
+        width = img.get('width') or 0
+        # Em empate (ex.: sem largura informada) fica a primeira: o Spotify lista da maior para a menor
+        if width >= target and (big_enough is None or width < big_enough[0]):
+            big_enough = (width, url)
+        if largest is None or width > largest[0]:
+            largest = (width, url)
+    return (big_enough or largest or (None, None))[1]
+
+
+def _artists(items):
+    return tuple(Artist.from_spotify(a) for a in items or () if a)
+
+
+class Artist:
+    __slots__ = ('id', 'name')
+
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+
+    @classmethod
+    def from_spotify(cls, data):
+        if isinstance(data, dict):
+            return cls(data.get('id'), data.get('name'))
+        return cls(None, str(data))
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get('id'), data.get('name'))
+
+    def to_dict(self):
+        return {'id': self.id, 'name': self.name}
+
+
+class Track:
+    __slots__ = ('id', 'name', 'artists', 'album_id', 'image', 'preview_url', 'duration_ms', 'track_number')
+
+    def __init__(self, id, name, artists=(), album_id=None, image=None, preview_url=None,
+                 duration_ms=None, track_number=None):
+        self.id = id
+        self.name = name
+        self.artists = artists
+        self.album_id = album_id
+        self.image = image
+        self.preview_url = preview_url
+        self.duration_ms = duration_ms
+        self.track_number = track_number
+
+    @classmethod
+    def from_spotify(cls, data, album_id=None):
+        """Parse a track item. Tracks inside an album payload have no 'album' key: pass `album_id`."""
+        album = data.get('album') or {}
+        return cls(
+            data.get('id'), data.get('name'), _artists(data.get('artists')),
+            album.get('id') or album_id, pick_image(album.get('images')), data.get('preview_url'),
+            data.get('duration_ms'), data.get('track_number'),
+        )
+
+    @property
+    def artist_names(self):
+        return ', '.join(a.name for a in self.artists if a.name)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**dict(data, artists=tuple(Artist.from_dict(a) for a in data.get('artists', ()))))
+
+    def to_dict(self):
+        return {
+            'id': self.id, 'name': self.name, 'artists': [a.to_dict() for a in self.artists],
+            'album_id': self.album_id, 'image': self.image, 'preview_url': self.preview_url,
+            'duration_ms': self.duration_ms, 'track_number': self.track_number,
+        }
+
+
+class Album:
+    """An album in a list or search result: only what a card shows."""
+
+    __slots__ = ('id', 'name', 'artists', 'image', 'total_tracks')
+
+    def __init__(self, id, name, artists=(), image=None, total_tracks=None):
+        self.id = id
+        self.name = name
+        self.artists = artists
+        self.image = image  # miniatura escolhida por pick_image
+        self.total_tracks = total_tracks
+
+    @classmethod
+    def from_spotify(cls, data):
+        return cls(data.get('id'), _album_name(data), _artists(data.get('artists')),
+                   pick_image(data.get('images')), data.get('total_tracks'))
+
+    @classmethod
+    def from_external(cls, data):
+        """Parse an album from the generic MUSIC_API source.
+
+        Besides the Spotify field names it accepts a single `artist` (string or
+        object) instead of `artists`, `title`/`album_title` for the name, an
+        `image`/`cover` URL and `tracks` as a plain list.
+        """
+        data = dict(data)
+        if not data.get('artists') and data.get('artist'):
+            data['artists'] = [data['artist']]
+        if not data.get('name'):
+            data['name'] = data.get('title') or data.get('album_title')
+        cover = data.get('image') or data.get('cover')
+        if not data.get('images') and isinstance(cover, str):
+            data['images'] = [{'url': cover}]
+        if isinstance(data.get('tracks'), list):
+            data['tracks'] = {'items': [t for t in data['tracks'] if isinstance(t, dict)]}
+        return cls.from_spotify(data)
+
+    @property
+    def artist_names(self):
+        return ', '.join(a.name for a in self.artists if a.name)
+
+    def summary(self):
+        """Flat dict used by the search API and the frontend typeahead."""
+        return {'id': self.id, 'name': self.name, 'artists': self.artist_names,
+                'image': self.image, 'total_tracks': self.total_tracks}
+
+    @classmethod
+    def from_dict(cls, data):
+        # Só os campos do card: aceita também respostas salvas como AlbumDetails
+        return cls(data.get('id'), data.get('name'), tuple(Artist.from_dict(a) for a in data.get('artists', ())),
+                   data.get('image'), data.get('total_tracks'))
+
+    def to_dict(self):
+        return {'id': self.id, 'name': self.name, 'artists': [a.to_dict() for a in self.artists],
+                'image': self.image, 'total_tracks': self.total_tracks}
+
+
+class AlbumDetails(Album):
+    """The album page (GET /albums/{id}): every cover resolution, tracks, label and links."""
+
+    __slots__ = ('images', 'release_date', 'label', 'spotify_url', 'tracks')
+
+    def __init__(self, id, name, artists=(), image=None, total_tracks=None, images=(), release_date=None,
+                 label=None, spotify_url=None, tracks=None):
+        super().__init__(id, name, artists, image, total_tracks)
+        self.images = images  # todas as resoluções
+        self.release_date = release_date
+        self.label = label
+        self.spotify_url = spotify_url
+        self.tracks = tracks  # tupla de Track ou None
+
+    @classmethod
+    def from_spotify(cls, data):
+        tracks = None
+        if isinstance(data.get('tracks'), dict):
+            tracks = tuple(Track.from_spotify(t, album_id=data.get('id')) for t in data['tracks'].get('items') or ())
+        return cls(
+            data.get('id'), _album_name(data), _artists(data.get('artists')), pick_image(data.get('images')),
+            data.get('total_tracks'), tuple(Image.from_spotify(i) for i in data.get('images') or ()),
+            data.get('release_date'), data.get('label'), (data.get('external_urls') or {}).get('spotify'), tracks,
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        tracks = data.get('tracks')
+        return cls(
+            data.get('id'), data.get('name'), tuple(Artist.from_dict(a) for a in data.get('artists', ())),
+            data.get('image'), data.get('total_tracks'), tuple(Image(**i) for i in data.get('images', ())),
+            data.get('release_date'), data.get('label'), data.get('spotify_url'),
+            tuple(Track.from_dict(t) for t in tracks) if tracks is not None else None,
+        )
+
+    def to_dict(self):
+        return dict(
+            super().to_dict(), images=[i.to_dict() for i in self.images], release_date=self.release_date,
+            label=self.label, spotify_url=self.spotify_url,
+            tracks=[t.to_dict() for t in self.tracks] if self.tracks is not None else None,
+        )
+
+
+def _album_name(data):
+    return data.get('name') or data.get('album_title') or '—'
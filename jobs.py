@@ -0,0 +1,440 @@
+import json
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from sqlalchemy import and_, case, delete, func, or_, select, update
+
+import metrics
+from database import insert_ignore, upsert
+from json_provider import dumps_bytes
+
+QUEUED = 'queued'
+RUNNING = 'running'
+FAILED = 'failed'
+
+# Com que frequência o worker confere se cada tarefa periódica tem sua linha na fila
+PERIODIC_CHECK_INTERVAL = 60.0
+# Com que frequência (s) o worker grava no banco as latências acumuladas desde a última gravação
+STATS_FLUSH_INTERVAL = 10.0
+# Com que frequência (s) o worker avisa que está vivo; sem aviso há 3 intervalos ele é dado como parado
+HEARTBEAT_INTERVAL = 10.0
+
+
+class Task:
+    __slots__ = ('name', 'func', 'max_attempts', 'timeout', 'priority', 'backoff', 'max_backoff', 'every')
+
+    def __init__(self, name, func, max_attempts, timeout, priority, backoff, max_backoff, every):
+        self.name = name
+        self.func = func
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.priority = priority
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.every = every
+
+    def retry_delay(self, attempts):
+        """Exponential backoff with jitter: about backoff, 2*backoff, 4*backoff... up to max_backoff."""
+        delay = min(self.max_backoff, self.backoff * 2 ** max(0, attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+
+class JobQueue:
+    """Durable background jobs stored in `job_model`'s table (no external broker).
+
+    Handlers are registered with `@queue.task(name)` and called as
+    `func(**payload)` inside an app context by `work()` (the `flask worker`
+    command), which runs a thread pool. Request handlers call `enqueue()` and
+    return immediately.
+
+    - Priority: higher `priority` runs first, then the oldest `run_at`.
+    - Scheduling: `delay`/`run_at` postpone a job; tasks with `every=seconds`
+      are periodic (one row per task, rescheduled after each run, shared by
+      all workers).
+    - Dedup: while a job with the same `dedup_key` is queued or running,
+      `enqueue()` does nothing.
+    - Visibility timeout: a claimed job is locked for the task's `timeout`;
+      if the worker dies it becomes claimable again after that.
+    - Retries: a failing job runs again after an exponential backoff, up to
+      `max_attempts`; then it stays in the table as `failed` (see
+      `retry_failed()`).
+
+    Claims are conditional UPDATEs, so several worker processes can share the
+    table on SQLite and PostgreSQL. Jobs may run more than once (a worker
+    dying mid-job), so handlers must be idempotent. Successful one-off jobs
+    are deleted.
+
+    Each worker adds up wait (due -> started) and run times per task and
+    flushes them every `STATS_FLUSH_INTERVAL` seconds into `stat_model`'s
+    table, so `timings()` shows them from any process while workers run.
+
+    Workers also write a heartbeat into `worker_model`'s table every
+    `HEARTBEAT_INTERVAL` seconds. `start_fallback()` uses it so that, in a
+    deployment without `flask worker`, the web processes run due jobs
+    themselves instead of letting them pile up.
+    """
+
+    def __init__(self, db, job_model, stat_model, worker_model, logger=None):
+        self.db = db
+        self.Job = job_model
+        self.Stat = stat_model
+        self.Worker = worker_model
+        self.logger = logger
+        self._tasks = {}
+        # tarefa -> [execuções, erros, soma da espera, maior espera, soma da execução, maior execução]
+        self._pending_stats = {}
+        self._stats_lock = threading.Lock()
+
+    # --- Registro e enfileiramento ---
+
+    def task(self, name, max_attempts=5, timeout=300, priority=0, backoff=10.0, max_backoff=3600.0, every=None):
+        """Register the decorated function as the handler of `name`. `every` (seconds) makes it periodic."""
+        def decorator(func):
+            self._tasks[name] = Task(name, func, max_attempts, timeout, priority, backoff, max_backoff, every or None)
+            return func
+        return decorator
+
+    def enqueue(self, name, payload=None, dedup_key=None, delay=0, run_at=None, priority=None):
+        """Queue `name` with `payload` (a JSON-serializable dict). Returns False if deduplicated."""
+        return self.enqueue_many(name, [(payload, dedup_key)], delay=delay, run_at=run_at, priority=priority) == 1
+
+    def enqueue_many(self, name, items, delay=0, run_at=None, priority=None):
+        """Queue one `name` job per `(payload, dedup_key)` in `items`, in a single transaction.
+
+        Returns how many were queued (the rest were deduplicated).
+        """
+        task = self._tasks[name]
+        table = self.Job.__table__
+        now = time.time()
+        queued = 0
+        with self.db.engine.begin() as conn:
+            for payload, dedup_key in items:
+                row = {
+                    'name': name, 'payload': dumps_bytes(payload or {}).decode('utf-8'),
+                    'priority': task.priority if priority is None else priority, 'status': QUEUED,
+                    'dedup_key': dedup_key, 'run_at': run_at if run_at is not None else now + delay,
+                    'enqueued_at': now, 'attempts': 0, 'updated_at': now,
+                }
+                if dedup_key is None:
+                    conn.execute(table.insert().values(**row))
+                    queued += 1
+                else:
+                    queued += insert_ignore(conn, table, row)
+        metrics.incr('jobs_enqueued', queued, task=name)
+        if len(items) > queued:
+            metrics.incr('jobs_deduplicated', len(items) - queued, task=name)
+        return queued
+
+    def schedule_periodic(self):
+        """Make sure every periodic task has its row in the queue (runs right away the first time)."""
+        for task in self._tasks.values():
+            if task.every:
+                self.enqueue(task.name, dedup_key=f'periodic:{task.name}')
+
+    # --- Consumo ---
+
+    def claim(self, limit):
+        """Lock up to `limit` due jobs for this worker; returns them as dicts."""
+        if limit <= 0 or not self._tasks:
+            return []
+        table = self.Job.__table__
+        now = time.time()
+        due = or_(and_(table.c.status == QUEUED, table.c.run_at <= now),
+                  and_(table.c.status == RUNNING, table.c.locked_until <= now))
+        with self.db.engine.connect() as conn:
+            rows = conn.execute(
+                select(table.c.id, table.c.name, table.c.payload, table.c.status, table.c.attempts, table.c.run_at)
+                .where(due, table.c.name.in_(list(self._tasks)))
+                .order_by(table.c.priority.desc(), table.c.run_at, table.c.id)
+                .limit(limit)
+            ).all()
+
+        claimed = []
+        for row in rows:
+            task = self._tasks[row.name]
+            if row.status == RUNNING and row.attempts >= task.max_attempts:
+                # O worker morreu (ou estourou o timeout) na última tentativa
+                self._give_up(row, task, f'Timeout de visibilidade ({task.timeout}s) esgotado')
+                continue
+            token = uuid.uuid4().hex
+            with self.db.engine.begin() as conn:
+                # `attempts` muda a cada posse: se outro worker pegou o job antes, não casa
+                won = conn.execute(update(table).where(
+                    table.c.id == row.id, table.c.status == row.status, table.c.attempts == row.attempts,
+                ).values(status=RUNNING, locked_by=token, locked_until=now + task.timeout,
+                         attempts=row.attempts + 1, updated_at=now)).rowcount == 1
+            if won:
+                claimed.append({'id': row.id, 'name': row.name, 'payload': json.loads(row.payload),
+                                'attempts': row.attempts + 1, 'run_at': row.run_at, 'token': token})
+        return claimed
+
+    def run(self, app, job):
+        """Execute one claimed job and record the outcome (in an app context of its own)."""
+        with app.app_context():
+            self._run(job)
+
+    def _run(self, job):
+        task = self._tasks[job['name']]
+        started = time.time()
+        waited = max(0.0, started - job['run_at'])
+        metrics.observe('job_wait_seconds', waited, task=task.name)
+        try:
+            task.func(**job['payload'])
+        except Exception as e:
+            error = e
+        else:
+            error = None
+        elapsed = time.time() - started
+        metrics.observe('job_run_seconds', elapsed, task=task.name)
+        self._add_stats(task.name, waited, elapsed, error is not None)
+        try:
+            if error is None:
+                self._succeeded(job, task)
+            else:
+                self._failed(job, task, error)
+        except Exception as e:
+            # Sem registrar o resultado o job volta à fila quando o timeout de visibilidade vencer
+            self._log(f"Falha ao registrar o resultado do job {job['id']} ({task.name}): {e}", level='error')
+
+    def work(self, app, threads=4, poll_interval=1.0, burst=False, stop=None, heartbeat=True):
+        """Claim and run jobs with `threads` threads until `stop` is set (or, with `burst`, the queue is empty).
+
+        On stop, no new jobs are claimed and the ones in progress finish.
+        With `heartbeat=False` (the fallback) this process does not count as
+        a running worker.
+        """
+        stop = stop or threading.Event()
+        running = set()
+        next_check = 0.0
+        next_flush = time.monotonic() + STATS_FLUSH_INTERVAL
+        next_beat = 0.0
+        worker_id = f'{socket.gethostname()}:{os.getpid()}'[:64]
+        with app.app_context(), ThreadPoolExecutor(max_workers=threads, thread_name_prefix='job') as pool:
+            self._log(f'Worker {worker_id} com {threads} threads, tarefas: {", ".join(sorted(self._tasks))}',
+                      level='info' if heartbeat else 'debug')
+            while not stop.is_set():
+                if heartbeat and time.monotonic() >= next_beat:
+                    self._beat(worker_id)
+                    next_beat = time.monotonic() + HEARTBEAT_INTERVAL
+                if time.monotonic() >= next_check:
+                    try:
+                        self.schedule_periodic()
+                    except Exception as e:
+                        self._log(f'Falha ao agendar tarefas periódicas: {e}', level='warning')
+                    next_check = time.monotonic() + PERIODIC_CHECK_INTERVAL
+                try:
+                    jobs = self.claim(threads - len(running))
+                except Exception as e:
+                    self._log(f'Falha ao buscar jobs: {e}', level='warning')
+                    jobs = []
+                for job in jobs:
+                    running.add(pool.submit(self.run, app, job))
+                if burst and not jobs and not running:
+                    break
+                if len(running) >= threads:
+                    wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                elif not jobs:
+                    stop.wait(poll_interval)
+                running = {f for f in running if not f.done()}
+                if time.monotonic() >= next_flush:
+                    self.flush_stats()
+                    next_flush = time.monotonic() + STATS_FLUSH_INTERVAL
+        with app.app_context():
+            self.flush_stats()  # o pool já terminou os jobs em andamento
+            if heartbeat:
+                self._beat(worker_id, stopping=True)
+
+    def start_fallback(self, app, interval, threads=1):
+        """Every `interval` seconds, run the due jobs in this process if no worker has sent a heartbeat lately.
+
+        For deployments that only run the web server: periodic tasks and
+        queued jobs still run, in a daemon thread of each web process (claims
+        are conditional, so several processes can share the work).
+        """
+        def loop():
+            while True:
+                time.sleep(interval * random.uniform(0.8, 1.2))
+                try:
+                    self.run_if_no_worker(app, threads=threads)
+                except Exception as e:
+                    self._log(f'Falha ao executar os jobs no processo web: {e}', level='warning')
+
+        thread = threading.Thread(target=loop, name='job-fallback', daemon=True)
+        thread.start()
+        return thread
+
+    def run_if_no_worker(self, app, threads=1):
+        """Run the due jobs here (like `work(burst=True)`) unless a worker is alive. Returns True if it ran."""
+        with app.app_context():
+            if self.workers_alive():
+                return False
+        metrics.incr('jobs_fallback_runs')
+        self.work(app, threads=threads, burst=True, heartbeat=False)
+        return True
+
+    # --- Workers ativos ---
+
+    def _beat(self, worker_id, stopping=False):
+        table = self.Worker.__table__
+        now = time.time()
+        try:
+            with self.db.engine.begin() as conn:
+                if stopping:
+                    conn.execute(delete(table).where(table.c.id == worker_id))
+                    return
+                upsert(conn, table, [{'id': worker_id, 'started_at': now, 'seen_at': now}], ['id'],
+                       {'seen_at': lambda t, ex: ex.seen_at})
+                # Linhas de workers que morreram sem se despedir
+                conn.execute(delete(table).where(table.c.seen_at < now - 100 * HEARTBEAT_INTERVAL))
+        except Exception as e:
+            self._log(f'Falha ao registrar o worker {worker_id}: {e}', level='warning')
+
+    def workers_alive(self):
+        """How many `work()` processes sent a heartbeat in the last 3 * HEARTBEAT_INTERVAL seconds."""
+        table = self.Worker.__table__
+        return self.db.session.execute(select(func.count()).select_from(table).where(
+            table.c.seen_at >= time.time() - 3 * HEARTBEAT_INTERVAL)).scalar()
+
+    # --- Latências ---
+
+    def _add_stats(self, name, waited, elapsed, error):
+        with self._stats_lock:
+            stats = self._pending_stats.setdefault(name, [0, 0, 0.0, 0.0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += error
+            stats[2] += waited
+            stats[3] = max(stats[3], waited)
+            stats[4] += elapsed
+            stats[5] = max(stats[5], elapsed)
+
+    def flush_stats(self):
+        """Add the latencies gathered since the last flush to the shared per-task totals."""
+        with self._stats_lock:
+            pending, self._pending_stats = self._pending_stats, {}
+        table = self.Stat.__table__
+        now = time.time()
+        for name, (runs, errors, wait_sum, wait_max, run_sum, run_max) in pending.items():
+            values = {
+                'runs': table.c.runs + runs, 'errors': table.c.errors + errors,
+                'wait_sum': table.c.wait_sum + wait_sum, 'run_sum': table.c.run_sum + run_sum,
+                'wait_max': case((table.c.wait_max < wait_max, wait_max), else_=table.c.wait_max),
+                'run_max': case((table.c.run_max < run_max, run_max), else_=table.c.run_max),
+                'updated_at': now,
+            }
+            try:
+                with self.db.engine.begin() as conn:
+                    if conn.execute(update(table).where(table.c.task == name).values(**values)).rowcount == 0:
+                        insert_ignore(conn, table, {'task': name, 'runs': 0, 'errors': 0, 'wait_sum': 0.0,
+                                                     'wait_max': 0.0, 'run_sum': 0.0, 'run_max': 0.0})
+                        conn.execute(update(table).where(table.c.task == name).values(**values))
+            except Exception as e:
+                self._log(f'Falha ao gravar as latências de {name}: {e}', level='warning')
+
+    def timings(self):
+        """Per-task totals flushed by all workers: runs, errors, mean and max wait and run time."""
+        rows = self.db.session.execute(select(self.Stat.__table__).order_by(self.Stat.task)).all()
+        return [{
+            'task': r.task, 'runs': r.runs, 'errors': r.errors,
+            'wait_avg': round(r.wait_sum / r.runs, 3) if r.runs else None, 'wait_max': round(r.wait_max, 3),
+            'run_avg': round(r.run_sum / r.runs, 3) if r.runs else None, 'run_max': round(r.run_max, 3),
+            'updated_at': r.updated_at,
+        } for r in rows]
+
+    # --- Resultado ---
+
+    def _succeeded(self, job, task):
+        table = self.Job.__table__
+        mine = and_(table.c.id == job['id'], table.c.locked_by == job['token'])
+        now = time.time()
+        with self.db.engine.begin() as conn:
+            if task.every:
+                result = conn.execute(update(table).where(mine).values(
+                    status=QUEUED, run_at=now + task.every, attempts=0, locked_by=None, locked_until=None,
+                    last_error=None, updated_at=now))
+            else:
+                result = conn.execute(delete(table).where(mine))
+        if result.rowcount != 1:
+            self._lost(job)
+            return
+        metrics.incr('jobs_processed', task=task.name, result='success')
+
+    def _failed(self, job, task, error):
+        table = self.Job.__table__
+        mine = and_(table.c.id == job['id'], table.c.locked_by == job['token'])
+        now = time.time()
+        message = f'{type(error).__name__}: {error}'[:2000]
+        if job['attempts'] < task.max_attempts:
+            values = {'status': QUEUED, 'run_at': now + task.retry_delay(job['attempts'])}
+            result_label = 'retry'
+        elif task.every:
+            # Tarefas periódicas não morrem: desistem desta rodada e voltam no próximo intervalo
+            values = {'status': QUEUED, 'run_at': now + task.every, 'attempts': 0}
+            result_label = 'failed'
+        else:
+            values = {'status': FAILED, 'dedup_key': None}
+            result_label = 'failed'
+        with self.db.engine.begin() as conn:
+            result = conn.execute(update(table).where(mine).values(
+                locked_by=None, locked_until=None, last_error=message, updated_at=now, **values))
+        if result.rowcount != 1:
+            self._lost(job)
+            return
+        metrics.incr('jobs_processed', task=task.name, result=result_label)
+        level = 'warning' if result_label == 'failed' else 'info'
+        self._log(f"Job {job['id']} ({task.name}) falhou na tentativa {job['attempts']}/{task.max_attempts}: {message}",
+                  level=level)
+
+    def _give_up(self, row, task, message):
+        table = self.Job.__table__
+        now = time.time()
+        if task.every:
+            values = {'status': QUEUED, 'run_at': now + task.every, 'attempts': 0}
+        else:
+            values = {'status': FAILED, 'dedup_key': None}
+        with self.db.engine.begin() as conn:
+            conn.execute(update(table).where(
+                table.c.id == row.id, table.c.status == RUNNING, table.c.attempts == row.attempts,
+            ).values(locked_by=None, locked_until=None, last_error=message, updated_at=now, **values))
+        metrics.incr('jobs_processed', task=task.name, result='failed')
+        self._log(f'Job {row.id} ({task.name}): {message}', level='warning')
+
+    def _lost(self, job):
+        # O job demorou mais que o timeout e outro worker o pegou; o resultado deste é descartado
+        metrics.incr('jobs_lost', task=job['name'])
+        self._log(f"Job {job['id']} ({job['name']}) perdeu a posse antes de terminar", level='warning')
+
+    # --- Observabilidade e manutenção ---
+
+    def stats(self):
+        """Queue depth per task and status, and how long the oldest due job has been waiting."""
+        table = self.Job.__table__
+        now = time.time()
+        rows = self.db.session.execute(
+            select(table.c.name, table.c.status, func.count(),
+                   func.sum(case((table.c.run_at <= now, 1), else_=0)), func.min(table.c.run_at))
+            .group_by(table.c.name, table.c.status)
+            .order_by(table.c.name, table.c.status)
+        ).all()
+        return [{
+            'task': name, 'status': status, 'count': count, 'due': int(due or 0) if status == QUEUED else 0,
+            'lag': round(now - oldest, 1) if status == QUEUED and oldest is not None and oldest <= now else None,
+        } for name, status, count, due, oldest in rows]
+
+    def retry_failed(self, name=None):
+        """Put failed jobs back in the queue (all, or only those of task `name`). Returns how many."""
+        table = self.Job.__table__
+        query = update(table).where(table.c.status == FAILED)
+        if name:
+            query = query.where(table.c.name == name)
+        now = time.time()
+        with self.db.engine.begin() as conn:
+            return conn.execute(query.values(status=QUEUED, run_at=now, attempts=0, updated_at=now)).rowcount
+
+    def _log(self, message, level='debug'):
+        if self.logger is not None:
+            getattr(self.logger, level)(message)
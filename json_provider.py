@@ -0,0 +1,99 @@
+import json
+
+from flask import current_app, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # orjson é opcional; sem ele usamos o json da biblioteca padrão
+    orjson = None
+
+# Tamanho aproximado (bytes) de cada pedaço enviado por stream_json_array
+STREAM_CHUNK_SIZE = 16 * 1024
+
+
+def _default(obj):
+    # Objetos de domínio (domain.Album, Track...) sabem se converter em dict
+    if hasattr(obj, 'to_dict'):
+        return obj.to_dict()
+    return DefaultJSONProvider.default(obj)
+
+
+def dumps_bytes(obj, sort_keys=False, indent=False):
+    """Serialize `obj` to UTF-8 JSON bytes, with orjson when it is installed.
+
+    Objects with `to_dict()` are serialized through it; dates, decimals, UUIDs
+    and objects with `__html__` go through Flask's default handler, so the
+    output matches `jsonify` either way.
+    """
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=_default, option=option)
+    return json.dumps(obj, default=_default, sort_keys=sort_keys, ensure_ascii=False,
+                      indent=2 if indent else None, separators=None if indent else (',', ':')).encode('utf-8')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson (falls back to the stdlib encoder).
+
+    Install it with `app.json = FastJSONProvider(app)`; `jsonify` and
+    `request.get_json` then go through it.
+    """
+
+    sort_keys = False
+    ensure_ascii = False
+    default = staticmethod(_default)
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            kwargs.setdefault('sort_keys', self.sort_keys)
+            kwargs.setdefault('ensure_ascii', self.ensure_ascii)
+            return super().dumps(obj, **kwargs)
+        return dumps_bytes(obj, sort_keys=self.sort_keys).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        body = dumps_bytes(obj, sort_keys=self.sort_keys, indent=indent)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def stream_json_array(items, envelope=None, key='items'):
+    """Stream `items` (any iterable, e.g. a generator or a `yield_per` query) as a JSON array.
+
+    Items are serialized one by one and sent in ~16 KiB chunks, so memory use
+    does not grow with the result size and the first bytes leave right away.
+    With `envelope` (a dict), the array is emitted as `envelope[key]`:
+    `{"ok": true, "items": [...]}`.
+    """
+    if envelope:
+        head = dumps_bytes(envelope)[:-1] + b',' + dumps_bytes(key) + b':['
+        tail = b']}'
+    else:
+        head, tail = b'[', b']'
+
+    def generate():
+        buffer = [head]
+        size = len(head)
+        separator = b''
+        for item in items:
+            chunk = separator + dumps_bytes(item)
+            separator = b','
+            buffer.append(chunk)
+            size += len(chunk)
+            if size >= STREAM_CHUNK_SIZE:
+                yield b''.join(buffer)
+                buffer, size = [], 0
+        buffer.append(tail)
+        yield b''.join(buffer)
+
+    return current_app.response_class(stream_with_context(generate()), mimetype='application/json')
@@ -0,0 +1,155 @@
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+from database import upsert
+
+# Janelas do ranking "em alta": nome -> duração
+TRENDING_WINDOWS = {
+    '24h': timedelta(hours=24),
+    '7d': timedelta(days=7),
+}
+
+
+class Leaderboards:
+    """Album rankings kept in precomputed tables.
+
+    `record()` folds new reviews into the tables inside the caller's
+    transaction, and `rebuild()` recomputes everything from the reviews (run it
+    periodically: it also ages reviews out of the trending windows and
+    recomputes every score). Reading a ranking is an indexed scan over the
+    precomputed table.
+
+    Top-rated uses a Bayesian average, (C * m + sum) / (C + n), where m is the
+    mean rating across all reviews and C is `prior_weight`: an album with few
+    reviews starts near the global mean instead of at its first rating. Each
+    process re-reads m from the stats table every `mean_ttl` seconds, since
+    `rebuild()` usually runs in another process (the job worker).
+    """
+
+    def __init__(self, db, review_model, stat_model, trend_model, prior_weight=5, mean_ttl=300):
+        self.db = db
+        self.Review = review_model
+        self.AlbumStat = stat_model
+        self.AlbumTrend = trend_model
+        self.prior_weight = prior_weight
+        self.mean_ttl = mean_ttl
+        self._global_mean = None  # (média, monotonic da leitura)
+        self._lock = threading.Lock()
+
+    # --- Escrita ---
+
+    def global_mean(self):
+        """Mean rating across all reviews (from the stats table, cached for `mean_ttl` seconds)."""
+        cached = self._global_mean
+        if cached is None or time.monotonic() - cached[1] >= self.mean_ttl:
+            count, total = self.db.session.query(
+                func.coalesce(func.sum(self.AlbumStat.review_count), 0),
+                func.coalesce(func.sum(self.AlbumStat.rating_sum), 0),
+            ).one()
+            cached = (float(total) / count if count else 3.0, time.monotonic())
+            self._global_mean = cached
+        return cached[0]
+
+    def record(self, rows, now=None):
+        """Add a batch of reviews (dicts with album_id, album_title, rating) to the rankings.
+
+        Does not commit: call it inside the transaction that inserts the reviews.
+        """
+        if not rows:
+            return
+        now = now or datetime.utcnow()
+        per_album = defaultdict(lambda: {'review_count': 0, 'rating_sum': 0})
+        for row in rows:
+            agg = per_album[row['album_id']]
+            agg['album_title'] = row['album_title']
+            agg['review_count'] += 1
+            agg['rating_sum'] += int(row['rating'])
+
+        c = float(self.prior_weight)
+        prior = c * self.global_mean()
+        stats = [
+            dict(agg, album_id=album_id, score=(prior + agg['rating_sum']) / (c + agg['review_count']), updated_at=now)
+            for album_id, agg in per_album.items()
+        ]
+        upsert(self.db.session, self.AlbumStat.__table__, stats, ['album_id'], {
+            'album_title': lambda t, ex: ex.album_title,
+            'review_count': lambda t, ex: t.review_count + ex.review_count,
+            'rating_sum': lambda t, ex: t.rating_sum + ex.rating_sum,
+            'score': lambda t, ex: (prior + t.rating_sum + ex.rating_sum) / (c + t.review_count + ex.review_count),
+            'updated_at': lambda t, ex: ex.updated_at,
+        })
+
+        trends = [
+            {'period': window, 'album_id': album_id, 'review_count': agg['review_count']}
+            for window in TRENDING_WINDOWS
+            for album_id, agg in per_album.items()
+        ]
+        upsert(self.db.session, self.AlbumTrend.__table__, trends, ['period', 'album_id'], {
+            'review_count': lambda t, ex: t.review_count + ex.review_count,
+        })
+
+    def rebuild(self, now=None):
+        """Recompute every ranking from the Review table in one transaction."""
+        with self._lock:
+            now = now or datetime.utcnow()
+            session = self.db.session
+            Review = self.Review
+            started = time.perf_counter()
+
+            stats = session.query(
+                Review.album_id,
+                func.max(Review.album_title),
+                func.count(Review.id),
+                func.sum(Review.rating),
+            ).filter(Review.album_id.isnot(None)).group_by(Review.album_id).all()
+            total_count = sum(row[2] for row in stats)
+            total_sum = sum(row[3] for row in stats)
+            mean = float(total_sum) / total_count if total_count else 3.0
+            c = float(self.prior_weight)
+
+            session.query(self.AlbumStat).delete(synchronize_session=False)
+            if stats:
+                session.execute(self.db.insert(self.AlbumStat), [
+                    {'album_id': album_id, 'album_title': title, 'review_count': count, 'rating_sum': total,
+                     'score': (c * mean + total) / (c + count), 'updated_at': now}
+                    for album_id, title, count, total in stats
+                ])
+
+            session.query(self.AlbumTrend).delete(synchronize_session=False)
+            for window, span in TRENDING_WINDOWS.items():
+                counts = session.query(Review.album_id, func.count(Review.id)).filter(
+                    Review.album_id.isnot(None), Review.created_at >= now - span).group_by(Review.album_id).all()
+                if counts:
+                    session.execute(self.db.insert(self.AlbumTrend), [
+                        {'period': window, 'album_id': album_id, 'review_count': count}
+                        for album_id, count in counts
+                    ])
+
+            session.commit()
+            self._global_mean = (mean, time.monotonic())
+            return {'albums': len(stats), 'reviews': total_count, 'seconds': time.perf_counter() - started}
+
+    # --- Leitura ---
+
+    def top_rated(self, limit=20):
+        return self.AlbumStat.query.order_by(
+            self.AlbumStat.score.desc(), self.AlbumStat.review_count.desc()).limit(limit).all()
+
+    def most_reviewed(self, limit=20):
+        return self.AlbumStat.query.order_by(
+            self.AlbumStat.review_count.desc(), self.AlbumStat.score.desc()).limit(limit).all()
+
+    def trending(self, window='7d', limit=20):
+        if window not in TRENDING_WINDOWS:
+            raise ValueError(f'Janela inválida: {window}')
+        rows = self.db.session.query(self.AlbumTrend, self.AlbumStat).join(
+            self.AlbumStat, self.AlbumStat.album_id == self.AlbumTrend.album_id
+        ).filter(self.AlbumTrend.period == window).order_by(
+            self.AlbumTrend.review_count.desc(), self.AlbumStat.score.desc()
+        ).limit(limit).all()
+        return [(stat, trend.review_count) for trend, stat in rows]
+
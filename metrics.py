@@ -0,0 +1,46 @@
+import threading
+from collections import defaultdict
+
+# Contadores e durações deste processo. Com vários workers cada um tem os seus:
+# some os valores de todos os processos para ter o total do servidor.
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_timings = {}
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+def incr(name, value=1, **labels):
+    """Add `value` to the counter `name` with the given labels."""
+    with _lock:
+        _counters[_key(name, labels)] += value
+
+
+def observe(name, seconds, **labels):
+    """Record one duration (count, sum and max) under `name`."""
+    key = _key(name, labels)
+    with _lock:
+        count, total, peak = _timings.get(key, (0, 0.0, 0.0))
+        _timings[key] = (count + 1, total + seconds, max(peak, seconds))
+
+
+def snapshot():
+    """Return every metric as a list of JSON-friendly dicts."""
+    with _lock:
+        counters = list(_counters.items())
+        timings = list(_timings.items())
+    out = [{'name': name, 'labels': dict(labels), 'value': value} for (name, labels), value in counters]
+    out += [
+        {'name': name, 'labels': dict(labels), 'count': count, 'sum': round(total, 6), 'max': round(peak, 6)}
+        for (name, labels), (count, total, peak) in timings
+    ]
+    out.sort(key=lambda m: (m['name'], sorted(m['labels'].items())))
+    return out
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _timings.clear()
@@ -0,0 +1,49 @@
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Fixamos o método e o custo explicitamente: o padrão do Werkzeug muda entre versões,
+# e com ele o tempo de CPU de cada login. Formato: 'scrypt:N:r:p' ou 'pbkdf2:sha256:iterações'.
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+
+_canonical_methods = {}
+
+
+def canonical_method(method):
+    """Return `method` with the parameters Werkzeug fills in by default.
+
+    'pbkdf2' becomes e.g. 'pbkdf2:sha256:1000000', so it can be compared with
+    the prefix stored in a hash. The result is computed once per method.
+    """
+    if method not in _canonical_methods:
+        _canonical_methods[method] = generate_password_hash('', method=method).split('$', 1)[0]
+    return _canonical_methods[method]
+
+
+def validate_method(method):
+    """Return `method` if Werkzeug can hash with it, else raise ValueError (checked once, at startup).
+
+    Without this, a typo in PASSWORD_HASH_METHOD only shows up at the first
+    login or registration, as a 500.
+    """
+    try:
+        canonical_method(method)
+    except (ValueError, TypeError, AttributeError) as e:
+        raise ValueError(f"PASSWORD_HASH_METHOD inválido: {method!r} ({e}); "
+                         f"use por exemplo {DEFAULT_METHOD!r} ou 'pbkdf2:sha256:600000'") from None
+    return method
+
+
+def hash_password(password, method=DEFAULT_METHOD):
+    return generate_password_hash(password, method=method)
+
+
+def verify_password(stored_hash, password):
+    if not stored_hash:
+        return False
+    return check_password_hash(stored_hash, password)
+
+
+def needs_rehash(stored_hash, method=DEFAULT_METHOD):
+    """True if `stored_hash` was not produced with `method` (algorithm or cost changed)."""
+    if not stored_hash or '$' not in stored_hash:
+        return True
+    return stored_hash.split('$', 1)[0] != canonical_method(method)
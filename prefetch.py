@@ -0,0 +1,175 @@
+import queue
+import threading
+import time
+
+import metrics
+from cache import TTLCache
+
+
+class Prefetcher:
+    """Background fetches that warm a cache with items the user is likely to open next.
+
+    `schedule(keys)` is cheap and never blocks the request: keys already in
+    `cache`, already queued or in flight, or over budget are skipped, and the
+    rest go to a bounded queue. A few daemon threads (started on first use, so
+    each worker process gets its own after fork) drain the queue at most
+    `rate` fetches per second, calling `fetch(key)` inside an app context and
+    storing non-None results in `cache`.
+
+    Budget: at most `budget` fetches per minute per process (token bucket);
+    `allow()` (optional, also called inside the app context) can veto
+    fetches, e.g. while the upstream breaker is open.
+
+    With several processes, `shared(key)` (optional) returns an item another
+    process already fetched (it goes into `cache` without a fetch), and
+    `claim(key)` clears the shared "prefetched, not used yet" mark, returning
+    True for the one process that cleared it. `mark_used(key)` records that a
+    prefetched item was actually served, once across processes when `claim`
+    is given, so the `prefetch_used` / `prefetch_fetched` metrics show how
+    many prefetches paid off.
+    """
+
+    def __init__(self, app, fetch, cache, workers=2, rate=2.0, budget=120, max_queue=500, allow=None,
+                 shared=None, claim=None):
+        self.app = app
+        self.fetch = fetch
+        self.cache = cache
+        self.workers = workers
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.budget = budget
+        self.allow = allow
+        self.shared = shared
+        self.claim = claim
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._pending = set()  # na fila ou sendo buscados
+        self._lock = threading.Lock()
+        self._tokens = float(budget)
+        self._refilled = time.monotonic()
+        self._next_fetch = time.monotonic()
+        self._threads = []
+        # Itens pré-carregados ainda não usados (expiram junto com o cache)
+        self._unused = TTLCache(ttl=cache.ttl, maxsize=cache.maxsize)
+        # Itens que vieram de `shared` (talvez do prefetch de outro processo)
+        self._loaded = TTLCache(ttl=cache.ttl, maxsize=cache.maxsize)
+
+    # --- Na requisição ---
+
+    def schedule(self, keys):
+        """Queue background fetches for `keys` (duplicates and cached items are skipped)."""
+        if self.budget <= 0:
+            return 0
+        queued = 0
+        for key in dict.fromkeys(k for k in keys if k):
+            if key in self.cache:
+                metrics.incr('prefetch_skipped', reason='cached')
+                continue
+            with self._lock:
+                if key in self._pending:
+                    metrics.incr('prefetch_skipped', reason='duplicate')
+                    continue
+                if not self._take_token():
+                    metrics.incr('prefetch_skipped', reason='budget')
+                    continue
+                self._pending.add(key)
+            try:
+                self._queue.put_nowait(key)
+            except queue.Full:
+                with self._lock:
+                    self._pending.discard(key)
+                metrics.incr('prefetch_skipped', reason='queue_full')
+                continue
+            queued += 1
+        if queued:
+            metrics.incr('prefetch_scheduled', queued)
+            self._ensure_started()
+        return queued
+
+    def mark_used(self, key, shared=False):
+        """Call when `key` is served; counts it once if it came from a prefetch.
+
+        Pass `shared=True` when the item was read from the storage shared by
+        the processes (another process may have prefetched it).
+        """
+        local = key in self._unused
+        loaded = key in self._loaded
+        if not (local or loaded or shared):
+            return
+        self._unused.delete(key)
+        self._loaded.delete(key)
+        used = local
+        if self.claim is not None:
+            try:
+                used = self.claim(key) or local
+            except Exception as e:
+                self.app.logger.debug(f"Falha ao marcar o prefetch de {key} como usado: {e}")
+        if used:
+            metrics.incr('prefetch_used')
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+        return {'queued': self._queue.qsize(), 'pending': pending, 'unused': len(self._unused),
+                'tokens': int(self._tokens), 'threads': sum(t.is_alive() for t in self._threads)}
+
+    def _take_token(self):
+        now = time.monotonic()
+        self._tokens = min(self.budget, self._tokens + (now - self._refilled) * self.budget / 60.0)
+        self._refilled = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    # --- Em segundo plano ---
+
+    def _ensure_started(self):
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            for i in range(len(self._threads), self.workers):
+                thread = threading.Thread(target=self._run, name=f'prefetch-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _wait_turn(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_fetch)
+            self._next_fetch = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def _run(self):
+        while True:
+            key = self._queue.get()
+            try:
+                if key in self.cache:
+                    metrics.incr('prefetch_skipped', reason='cached')
+                    continue
+                # shared(), allow() e fetch() leem o banco (respostas e disjuntor compartilhados): precisam do app context
+                with self.app.app_context():
+                    value = self.shared(key) if self.shared is not None else None
+                    if value is not None:
+                        self.cache.set(key, value)
+                        self._loaded.set(key, True)
+                        metrics.incr('prefetch_shared')
+                        continue
+                    if self.allow is not None and not self.allow():
+                        metrics.incr('prefetch_skipped', reason='upstream')
+                        continue
+                    self._wait_turn()
+                    started = time.monotonic()
+                    value = self.fetch(key)
+                metrics.observe('prefetch_fetch_seconds', time.monotonic() - started)
+                if value is None:
+                    metrics.incr('prefetch_failed')
+                    continue
+                self.cache.set(key, value)
+                self._unused.set(key, True)
+                metrics.incr('prefetch_fetched')
+            except Exception as e:
+                metrics.incr('prefetch_failed')
+                self.app.logger.debug(f"Prefetch de {key} falhou: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(key)
+                self._queue.task_done()
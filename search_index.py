@@ -0,0 +1,429 @@
+import bisect
+import heapq
+import math
+import os
+import pickle
+import re
+import tempfile
+import threading
+import time
+import unicodedata
+from collections import Counter
+from datetime import timedelta
+from itertools import islice
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem flock, cada processo grava o próprio snapshot (só desenvolvimento)
+    fcntl = None
+
+# Versão do formato do snapshot em disco; snapshots de outra versão são ignorados
+SNAPSHOT_VERSION = 2
+# Limites de trabalho por busca (mantêm o p99 abaixo de 1 ms; ver bench_search_index.py):
+# álbuns percorridos para gerar candidatos, candidatos pontuados, palavras do vocabulário
+# tentadas para a palavra sendo digitada e para uma palavra com erro de digitação
+MAX_SCAN = 1000
+MAX_CANDIDATES = 30
+MAX_PREFIX_WORDS = 20
+MAX_SIMILAR_WORDS = 3
+# Palavras com pelo menos este tamanho são encontradas com uma letra a menos, a mais ou trocada
+MIN_TYPO_LENGTH = 4
+# Pontuação mínima para um álbum aparecer no resultado
+MIN_SCORE = 0.3
+# Reviews gravadas até este tempo antes da mais nova já vista ainda podem aparecer no banco
+# (transações que terminam fora de ordem, relógios dos processos levemente diferentes)
+REVIEWS_OVERLAP = timedelta(minutes=5)
+
+_NON_WORD = re.compile(r'[^0-9a-z]+')
+
+
+def normalize(text):
+    """Lowercase, strip accents and punctuation: 'Beyoncé - Renaissance!' -> 'beyonce renaissance'."""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    return _NON_WORD.sub(' ', text).strip()
+
+
+def trigrams(tokens):
+    """Trigrams of each token padded with spaces, so short words and word starts count too."""
+    grams = set()
+    for token in tokens:
+        padded = f'  {token} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def _deletions(word):
+    """The word with each letter removed: 'love' -> {'ove', 'lve', 'loe', 'lov'}."""
+    return {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+class AlbumIndex:
+    """In-memory typeahead index over the albums we know about (title + artists).
+
+    Three structures answer a query without touching the database or Spotify:
+    the vocabulary (each indexed word -> albums containing it, kept sorted for
+    prefix lookups, plus every word with one letter removed, for typos),
+    trigram posting lists (each word is padded, so "  re" also finds words
+    *starting* with "re") and the tokens of each album. Each query word
+    becomes a few vocabulary words (itself, the words it is a prefix of, or
+    the closest ones with one letter off); candidates are the albums in all
+    of them, with a fixed work budget, ranked by the share of the query's
+    trigrams they contain, how well the whole title matches, word/prefix hits
+    and a small boost for albums with more reviews.
+
+    `add()` is incremental and thread-safe; `save()`/`load()` snapshot the
+    whole index to disk so a new worker starts warm.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = {}  # album_id -> posição
+        self._docs = []  # posição -> [album_id, name, artists, image, total_tracks, reviews]
+        self._doc_tokens = []  # posição -> tupla de tokens indexados
+        self._doc_grams = []  # posição -> nº de trigramas (para a similaridade)
+        self._postings = {}  # trigrama -> set de posições
+        self._words = {}  # palavra -> set de posições
+        self._vocabulary = []  # palavras de _words, em ordem (busca por prefixo)
+        self._deletions = {}  # palavra sem uma letra -> set de palavras (erros de digitação)
+        # Reviews com created_at anterior a `reviews_cutoff` já estão em `reviews`; as mais novas
+        # já contadas ficam em `_counted_reviews` (review id -> created_at). None: nada contado ainda
+        self.reviews_cutoff = None
+        self._counted_reviews = {}
+        self.loaded = False
+        self.dirty = False
+
+    def __len__(self):
+        return len(self._docs)
+
+    def __contains__(self, album_id):
+        return album_id in self._ids
+
+    # --- Escrita ---
+
+    def add(self, album_id, name, artists='', image=None, total_tracks=None, reviews=0):
+        """Insert or update one album. Empty fields keep the value already indexed."""
+        if not album_id or not name:
+            return
+        with self._lock:
+            self._add(album_id, name, artists, image, total_tracks, reviews)
+
+    def add_album(self, album, reviews=0):
+        """Add a domain.Album (search results, album pages, new releases)."""
+        self.add(album.id, album.name, album.artist_names, album.image, album.total_tracks, reviews)
+
+    def count_reviews(self, album_id, name, reviews):
+        """Add `reviews` to an album's count; `name` (the review's album title) is only used
+        if the album is not indexed yet, so it never replaces the name that came from Spotify."""
+        with self._lock:
+            self._count(album_id, name, reviews)
+
+    def add_reviews(self, rows):
+        """Count the reviews in `rows` — `(id, album_id, album_title, created_at, updated_at)` of
+        every review with `updated_at >= reviews_cutoff` — that were not counted yet.
+
+        Edits of older reviews are skipped by `created_at`, reviews already seen by id; the
+        cutoff then moves to `REVIEWS_OVERLAP` before the newest `updated_at`, so a review
+        that commits late (out of id and time order) is still read by the next call.
+        Returns the number of reviews counted.
+        """
+        counted = 0
+        newest = None
+        with self._lock:
+            cutoff = self.reviews_cutoff
+            for review_id, album_id, title, created_at, updated_at in rows:
+                if updated_at is not None and (newest is None or updated_at > newest):
+                    newest = updated_at
+                if created_at is None or (cutoff is not None and created_at < cutoff):
+                    continue
+                if review_id in self._counted_reviews:
+                    continue
+                self._counted_reviews[review_id] = created_at
+                self._count(album_id, title, 1)
+                counted += 1
+            if newest is not None and (cutoff is None or newest - REVIEWS_OVERLAP > cutoff):
+                cutoff = self.reviews_cutoff = newest - REVIEWS_OVERLAP
+                self._counted_reviews = {review_id: created_at for review_id, created_at
+                                         in self._counted_reviews.items() if created_at >= cutoff}
+                self.dirty = True
+        return counted
+
+    def _count(self, album_id, name, reviews):
+        pos = self._ids.get(album_id)
+        if pos is None:
+            if album_id and name:
+                self._add(album_id, name, reviews=reviews)
+        elif reviews:
+            self._docs[pos][5] += reviews
+            self.dirty = True
+
+    def _add(self, album_id, name, artists='', image=None, total_tracks=None, reviews=0):
+        pos = self._ids.get(album_id)
+        if pos is None:
+            pos = len(self._docs)
+            self._ids[album_id] = pos
+            self._docs.append([album_id, name, artists or '', image, total_tracks, reviews])
+            self._doc_tokens.append(())
+            self._doc_grams.append(0)
+        else:
+            doc = self._docs[pos]
+            updated = [album_id, name, artists or doc[2], image or doc[3],
+                       total_tracks if total_tracks is not None else doc[4], doc[5] + reviews]
+            if updated == doc:
+                return
+            self._docs[pos] = updated
+        doc = self._docs[pos]
+        tokens = tuple(dict.fromkeys(normalize(f'{doc[1]} {doc[2]}').split()))
+        if tokens != self._doc_tokens[pos]:
+            self._reindex(pos, tokens)
+        self.dirty = True
+
+    def _reindex(self, pos, tokens):
+        old_tokens = self._doc_tokens[pos]
+        for gram in trigrams(old_tokens):
+            docs = self._postings[gram]
+            docs.discard(pos)
+            if not docs:
+                del self._postings[gram]
+        for token in old_tokens:
+            docs = self._words[token]
+            docs.discard(pos)
+            if not docs:
+                del self._words[token]
+                self._forget_word(token)
+        grams = trigrams(tokens)
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(pos)
+        for token in tokens:
+            docs = self._words.get(token)
+            if docs is None:
+                docs = self._words[token] = set()
+                self._learn_word(token)
+            docs.add(pos)
+        self._doc_tokens[pos] = tokens
+        self._doc_grams[pos] = len(grams)
+
+    def _learn_word(self, word):
+        bisect.insort(self._vocabulary, word)
+        if len(word) >= MIN_TYPO_LENGTH:
+            for variant in _deletions(word):
+                self._deletions.setdefault(variant, set()).add(word)
+
+    def _forget_word(self, word):
+        del self._vocabulary[bisect.bisect_left(self._vocabulary, word)]
+        if len(word) >= MIN_TYPO_LENGTH:
+            for variant in _deletions(word):
+                words = self._deletions[variant]
+                words.discard(word)
+                if not words:
+                    del self._deletions[variant]
+
+    # --- Busca ---
+
+    def search(self, query, limit=10):
+        """Return up to `limit` `(score, summary)` pairs, best first.
+
+        `summary` has the same keys as `domain.Album.summary()`.
+        """
+        tokens = normalize(query).split()
+        if not tokens:
+            return []
+        grams = trigrams(tokens)
+        *complete, last = tokens
+        with self._lock:
+            sources = [self._matching(token) for token in complete] + [self._matching(last, prefix=True)]
+            candidates = self._candidates(sources, grams)
+            lists = [self._postings.get(gram, ()) for gram in grams]
+
+            scored = []
+            for pos in candidates:
+                count = sum(1 for docs in lists if pos in docs)
+                doc_tokens = self._doc_tokens[pos]
+                # Palavras completas casam inteiras; a última (ainda sendo digitada) por prefixo
+                prefix_hits = sum(1 for token in complete if token in doc_tokens)
+                prefix_hits += any(token.startswith(last) for token in doc_tokens)
+                recall = count / len(grams)
+                dice = 2 * count / (len(grams) + self._doc_grams[pos])
+                score = 0.5 * recall + 0.2 * dice + 0.3 * prefix_hits / len(tokens)
+                if score >= MIN_SCORE:
+                    scored.append((score + 0.01 * math.log1p(self._docs[pos][5]), pos))
+            scored.sort(reverse=True)
+            return [(round(score, 3), self._summary(self._docs[pos])) for score, pos in scored[:limit]]
+
+    def _matching(self, token, prefix=False):
+        """Sets of positions of the albums that may match one query word (empty list: none)."""
+        if prefix:
+            if len(token) <= 2:
+                # "  a" / " ab" já é a lista exata dos álbuns com uma palavra começando assim
+                docs = self._postings.get(f'  {token}'[-3:])
+                if docs:
+                    return [docs]
+            words = self._prefixed(token)
+            if words:
+                return [self._words[word] for word in words]
+        elif token in self._words:
+            return [self._words[token]]
+        return [self._words[word] for word in self._similar(token)]
+
+    def _prefixed(self, prefix):
+        """The most common MAX_PREFIX_WORDS words starting with `prefix`."""
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        words = []
+        for word in islice(self._vocabulary, start, None):
+            if not word.startswith(prefix):
+                break
+            words.append(word)
+        if len(words) > MAX_PREFIX_WORDS:
+            words = heapq.nlargest(MAX_PREFIX_WORDS, words, key=lambda word: len(self._words[word]))
+        return words
+
+    def _similar(self, token):
+        """The most common MAX_SIMILAR_WORDS words with one letter missing, extra or changed."""
+        if len(token) < MIN_TYPO_LENGTH - 1:
+            return []
+        found = set(self._deletions.get(token, ()))  # falta uma letra na busca
+        for variant in _deletions(token):
+            if variant in self._words:  # sobra uma letra
+                found.add(variant)
+            found.update(self._deletions.get(variant, ()))  # letra trocada
+        return heapq.nlargest(MAX_SIMILAR_WORDS, found, key=lambda word: len(self._words[word]))
+
+    def _candidates(self, sources, grams):
+        """Positions to score: albums matching every query word, or else the ones matching most."""
+        if all(sources):
+            # Parte da palavra com menos álbuns e filtra pelas outras: `seed & docs` custa o
+            # tamanho de `seed`, nunca o das listas grandes
+            sources = sorted(sources, key=lambda sets: sum(map(len, sets)))
+            seed = set()
+            for docs in sources[0]:
+                seed.update(islice(docs, MAX_SCAN - len(seed)))
+                if len(seed) >= MAX_SCAN:
+                    break
+            for sets in sources[1:]:
+                seed = seed.intersection(sets[0]) if len(sets) == 1 else set().union(*(seed & docs for docs in sets))
+                if not seed:
+                    break
+            if len(seed) > MAX_CANDIDATES:
+                # Entre os que casam com tudo, os títulos mais curtos casam melhor
+                return heapq.nsmallest(MAX_CANDIDATES, seed, key=self._doc_grams.__getitem__)
+            if seed:
+                return seed
+        # Sem álbum com todas as palavras: os que aparecem em mais listas (das palavras ou,
+        # sem nenhuma palavra conhecida, dos trigramas mais raros), com MAX_SCAN dividido entre elas
+        sources = [sets for sets in sources if sets]
+        if not sources:
+            sources = [sorted((self._postings.get(gram, ()) for gram in grams), key=len)]
+        shared = Counter()
+        for sets in sources:
+            budget = MAX_SCAN // len(sources)
+            for docs in sets:
+                shared.update(islice(docs, budget))
+                budget -= len(docs)
+                if budget <= 0:
+                    break
+        return [pos for pos, _ in shared.most_common(MAX_CANDIDATES)]
+
+    @staticmethod
+    def _summary(doc):
+        album_id, name, artists, image, total_tracks, _ = doc
+        return {'id': album_id, 'name': name, 'artists': artists, 'image': image, 'total_tracks': total_tracks}
+
+    # --- Snapshot ---
+
+    def save(self, path):
+        """Write the index to `path` atomically (temp file + rename)."""
+        with self._lock:
+            state = {
+                'version': SNAPSHOT_VERSION, 'docs': self._docs, 'doc_tokens': self._doc_tokens,
+                'doc_grams': self._doc_grams, 'postings': self._postings, 'words': self._words,
+                'vocabulary': self._vocabulary, 'deletions': self._deletions,
+                'reviews_cutoff': self.reviews_cutoff, 'counted_reviews': self._counted_reviews,
+            }
+            data = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+            self.dirty = False
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.album-index-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return len(data)
+
+    def load(self, path):
+        """Merge the snapshot at `path` into the index. Returns False if there is no usable snapshot.
+
+        Albums added before the load (album pages, search results) are kept;
+        review counts and the review watermark come from the snapshot.
+        """
+        try:
+            with open(path, 'rb') as f:
+                state = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return False
+        if not isinstance(state, dict) or state.get('version') != SNAPSHOT_VERSION:
+            return False
+        with self._lock:
+            added = self._docs
+            self._docs = state['docs']
+            self._ids = {doc[0]: pos for pos, doc in enumerate(self._docs)}
+            self._doc_tokens = state['doc_tokens']
+            self._doc_grams = state['doc_grams']
+            self._postings = state['postings']
+            self._words = state['words']
+            self._vocabulary = state['vocabulary']
+            self._deletions = state['deletions']
+            self.reviews_cutoff = state['reviews_cutoff']
+            self._counted_reviews = state['counted_reviews']
+            self.dirty = False
+        for album_id, name, artists, image, total_tracks, _ in added:
+            self.add(album_id, name, artists, image, total_tracks)
+        return True
+
+
+def _try_lock(path):
+    """Take an exclusive lock on `path` without waiting; returns the open file (keep it) or None.
+
+    The lock lasts until the process exits, so exactly one process at a time is the snapshot writer.
+    """
+    if fcntl is None:
+        return True
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    f = open(path, 'a')
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+def start_periodic_snapshot(app, index, path, interval, sync=None):
+    """Every `interval` seconds, call `sync()` (e.g. count new reviews) and, in one process only, save `index`.
+
+    Each worker keeps its own index, but only the process holding the lock
+    file next to `path` writes the snapshot; if it dies, another takes over.
+    """
+    lock = None
+
+    def loop():
+        nonlocal lock
+        while True:
+            time.sleep(interval)
+            try:
+                if sync is not None:
+                    with app.app_context():
+                        sync()
+                lock = lock or _try_lock(path + '.lock')
+                if lock and index.dirty:
+                    index.save(path)
+            except Exception as e:
+                app.logger.warning(f"Falha ao atualizar/salvar o índice de busca: {e}")
+
+    thread = threading.Thread(target=loop, name='album-index-snapshot', daemon=True)
+    thread.start()
+    return thread
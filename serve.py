@@ -0,0 +1,109 @@
+import os
+import multiprocessing
+
+import click
+
+# Hooks executed once in every worker process, right after fork and before the
+# worker starts accepting connections (warm Spotify token, caches, etc.).
+_worker_start_hooks = []
+
+
+def on_worker_start(func):
+    """Register `func` to run inside an app context when a worker boots."""
+    _worker_start_hooks.append(func)
+    return func
+
+
+def run_worker_start_hooks(app):
+    with app.app_context():
+        for hook in _worker_start_hooks:
+            try:
+                hook()
+            except Exception as e:
+                # Um hook que falha (ex.: Spotify fora do ar) não deve impedir o worker de subir
+                app.logger.warning(f"Worker start hook {hook.__name__} falhou: {e}")
+
+
+def _setting(app, name, default, cast=str):
+    """Read a server setting from app.config, then the environment, then `default`."""
+    value = app.config.get(name)
+    if value is None:
+        value = os.environ.get(name)
+    if value is None or value == '':
+        return default
+    return cast(value)
+
+
+def server_options(app, **overrides):
+    """Build the gunicorn settings for `app`.
+
+    Defaults favour our I/O-bound Spotify traffic: a few processes (one per
+    core) each running a pool of threads, so a worker blocked on the Spotify
+    API does not hold up the other requests it is serving.
+    """
+    cpus = multiprocessing.cpu_count()
+    options = {
+        'bind': _setting(app, 'SERVE_BIND', '0.0.0.0:8000'),
+        'workers': _setting(app, 'SERVE_WORKERS', cpus + 1, int),
+        'worker_class': 'gthread',
+        'threads': _setting(app, 'SERVE_THREADS', 8, int),
+        # Carrega a app no processo master: os workers herdam o código já importado (copy-on-write)
+        'preload_app': True,
+        'timeout': _setting(app, 'SERVE_TIMEOUT', 30, int),
+        'graceful_timeout': _setting(app, 'SERVE_GRACEFUL_TIMEOUT', 30, int),
+        'keepalive': _setting(app, 'SERVE_KEEPALIVE', 5, int),
+        # Recicla workers periodicamente para conter vazamentos de memória
+        'max_requests': _setting(app, 'SERVE_MAX_REQUESTS', 2000, int),
+        'max_requests_jitter': _setting(app, 'SERVE_MAX_REQUESTS_JITTER', 200, int),
+        # Limites de requisição (linha, quantidade e tamanho dos headers)
+        'limit_request_line': _setting(app, 'SERVE_LIMIT_REQUEST_LINE', 4094, int),
+        'limit_request_fields': _setting(app, 'SERVE_LIMIT_REQUEST_FIELDS', 100, int),
+        'limit_request_field_size': _setting(app, 'SERVE_LIMIT_REQUEST_FIELD_SIZE', 8190, int),
+        'accesslog': _setting(app, 'SERVE_ACCESS_LOG', '-'),
+        'errorlog': '-',
+    }
+    options.update({k: v for k, v in overrides.items() if v is not None})
+    return options
+
+
+def run(app, **overrides):
+    """Run `app` under gunicorn with the options from `server_options`.
+
+    The app is preloaded in the master, so SIGHUP only restarts the workers
+    from the app already in memory (new config from the environment, same
+    code): to deploy new code, restart the master process. With `reload=True`
+    (development) the app is not preloaded, since code reloading happens
+    inside the workers.
+    """
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise click.ClickException('gunicorn não está instalado: pip install gunicorn (não suportado no Windows)')
+
+    if overrides.get('reload'):
+        overrides.setdefault('preload_app', False)
+    options = server_options(app, **overrides)
+
+    def post_fork(server, worker):
+        run_worker_start_hooks(app)
+
+    class _Server(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                if key in self.cfg.settings:
+                    self.cfg.set(key, value)
+            self.cfg.set('post_fork', post_fork)
+
+        def load(self):
+            return app
+
+    _Server().run()
+
+
+if __name__ == '__main__':
+    # Rodando como script este arquivo é o módulo __main__, não o `serve` importado
+    # pelo app.py: os hooks de worker ficam registrados no `serve`, então usa o run() dele.
+    import serve
+    from app import app, init_db
+    init_db()
+    serve.run(app)
@@ -0,0 +1,67 @@
+import hashlib
+import os
+
+from flask import current_app
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+
+from json_provider import dumps_bytes
+
+
+class FragmentCacheExtension(Extension):
+    """`{% cache key, ttl %}...{% endcache %}`: cache the rendered HTML of a block.
+
+    `key` is any expression, usually a list such as
+    `['review', review.id, review.updated_at]`; include in it everything the
+    fragment depends on, so a change produces a new key instead of needing an
+    invalidation. `ttl` (seconds) is optional. The key is prefixed with the
+    template name, so the same key in two templates does not collide.
+
+    Fragments are stored in `environment.fragment_cache` (a `cache.TTLCache`);
+    with no cache configured, or in debug mode, blocks render normally. Never
+    put per-user content (current_user, flashes, CSRF tokens) in a cached block.
+    """
+
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [nodes.Const(parser.name), parser.parse_expression()]
+        if parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        else:
+            args.append(nodes.Const(None))
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', args), [], [], body).set_lineno(lineno)
+
+    def _render(self, template_name, key, ttl, caller):
+        cache = self.environment.fragment_cache
+        if cache is None or current_app.debug:
+            return caller()
+        parts = key if isinstance(key, (list, tuple)) else (key,)
+        cache_key = f"{template_name}:" + ':'.join(str(p) for p in parts)
+        html = cache.get(cache_key)
+        if html is None:
+            html = caller()
+            cache.set(cache_key, html, ttl)
+        return html
+
+
+def fingerprint(obj):
+    """Short content hash of `obj` (dicts, lists, objects with to_dict) for fragment cache keys."""
+    return hashlib.sha1(dumps_bytes(obj, sort_keys=True)).hexdigest()[:16]
+
+
+def init_app(app, fragment_cache, bytecode_dir=None):
+    """Install the `{% cache %}` tag backed by `fragment_cache`, the `fingerprint` filter and,
+    if `bytecode_dir` is given, a filesystem bytecode cache shared by all workers and restarts."""
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.fragment_cache = fragment_cache
+    app.jinja_env.filters['fingerprint'] = fingerprint
+    if bytecode_dir:
+        os.makedirs(bytecode_dir, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(bytecode_dir)
@@ -0,0 +1,88 @@
+import gzip
+import json
+
+import pytest
+from flask import Flask, jsonify, stream_with_context
+
+import assets
+from json_provider import stream_json_array
+
+ITEMS = [{'id': i, 'name': f'Álbum {i}', 'artists': 'Banda'} for i in range(3000)]
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    assets.init_app(app, compress_min_size=1024)
+    closed = []
+
+    @app.route('/stream')
+    def stream():
+        response = stream_json_array(ITEMS, envelope={'ok': True})
+        response.call_on_close(lambda: closed.append(True))
+        return response
+
+    @app.route('/small')
+    def small():
+        return jsonify(ok=True)
+
+    @app.route('/text')
+    def text():
+        return app.response_class(stream_with_context(iter(['a' * 10, 'b' * 10])), mimetype='text/plain')
+
+    client = app.test_client()
+    client.closed = closed
+    return client
+
+
+def _decode(response):
+    data = response.get_data()
+    if response.headers.get('Content-Encoding') == 'gzip':
+        return gzip.decompress(data)
+    if response.headers.get('Content-Encoding') == 'br':
+        return assets.brotli.decompress(data)
+    return data
+
+
+@pytest.mark.parametrize('encoding', ['gzip', 'br'])
+def test_streamed_json_is_compressed(client, encoding):
+    if encoding == 'br' and assets.brotli is None:
+        pytest.skip('brotli não instalado')
+    response = client.get('/stream', headers={'Accept-Encoding': encoding})
+    assert response.is_streamed
+    assert response.headers['Content-Encoding'] == encoding
+    assert 'Content-Length' not in response.headers
+    assert 'Accept-Encoding' in response.vary
+    assert json.loads(_decode(response)) == {'ok': True, 'items': ITEMS}
+    assert len(response.get_data()) < len(_decode(response)) / 3
+    response.close()
+    assert client.closed == [True]
+
+
+def test_streamed_chunks_arrive_as_they_are_produced(client):
+    response = client.get('/stream', headers={'Accept-Encoding': 'gzip'})
+    chunks = list(response.response)
+    response.close()
+    assert len(chunks) > 2
+    # Cada pedaço comprimido já pode ser descomprimido sem esperar o fim do corpo
+    assert gzip.zlib.decompressobj(16 + gzip.zlib.MAX_WBITS).decompress(chunks[0]).startswith(b'{"ok":true')
+
+
+def _get(client, path, **headers):
+    response = client.get(path, headers=headers)
+    body = _decode(response)
+    response.close()
+    return response, body
+
+
+def test_range_and_uncompressed_requests_are_left_alone(client):
+    response, body = _get(client, '/stream', **{'Accept-Encoding': 'gzip', 'Range': 'bytes=0-99'})
+    assert 'Content-Encoding' not in response.headers
+    assert json.loads(body)['items'] == ITEMS
+    response, body = _get(client, '/stream')
+    assert 'Content-Encoding' not in response.headers
+    response, body = _get(client, '/small', **{'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    response, body = _get(client, '/text', **{'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert body == b'a' * 10 + b'b' * 10
@@ -0,0 +1,34 @@
+from domain import Album, AlbumDetails, pick_image
+
+PAYLOAD = {
+    'id': 'al1', 'name': 'Disco', 'artists': [{'id': 'ar1', 'name': 'Banda'}], 'total_tracks': 2,
+    'images': [{'url': 'big', 'width': 640, 'height': 640}, {'url': 'mid', 'width': 300, 'height': 300},
+               {'url': 'small', 'width': 64, 'height': 64}],
+    'release_date': '2024-05-17', 'label': 'Selo', 'external_urls': {'spotify': 'https://open.spotify.com/album/al1'},
+    'tracks': {'items': [{'id': 't1', 'name': 'Um', 'artists': [{'name': 'Banda'}], 'track_number': 1}]},
+}
+
+
+def test_pick_image():
+    assert pick_image(PAYLOAD['images']) == 'mid'
+    assert pick_image(PAYLOAD['images'][2:]) == 'small'
+    assert pick_image([{'url': 'a'}, {'url': 'b'}]) == 'a'
+    assert pick_image([{'url': None, 'width': 300}]) is None
+    assert pick_image(None) is None
+
+
+def test_list_album_keeps_only_the_card():
+    album = Album.from_spotify(PAYLOAD)
+    assert (album.id, album.name, album.artist_names, album.image, album.total_tracks) == ('al1', 'Disco', 'Banda', 'mid', 2)
+    assert not hasattr(album, 'images') and not hasattr(album, 'tracks')
+    assert Album.from_dict(album.to_dict()).to_dict() == album.to_dict()
+
+
+def test_details_round_trip():
+    album = AlbumDetails.from_spotify(PAYLOAD)
+    assert [i.url for i in album.images] == ['big', 'mid', 'small']
+    assert [t.name for t in album.tracks] == ['Um'] and album.tracks[0].album_id == 'al1'
+    assert (album.label, album.release_date, album.spotify_url) == ('Selo', '2024-05-17', 'https://open.spotify.com/album/al1')
+    assert AlbumDetails.from_dict(album.to_dict()).to_dict() == album.to_dict()
+    # Resposta da página salva no banco também serve para um card
+    assert Album.from_dict(album.to_dict()).to_dict() == Album.from_spotify(PAYLOAD).to_dict()
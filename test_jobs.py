@@ -0,0 +1,146 @@
+import time
+
+import pytest
+
+from jobs import FAILED, QUEUED, RUNNING, JobQueue, Task
+
+
+@pytest.fixture
+def queue(app_module):
+    m = app_module
+    q = JobQueue(m.db, m.Job, m.JobStat, m.JobWorker)
+    q.calls = []
+    q.failures = {}
+
+    @q.task('test.echo', max_attempts=3, backoff=10.0)
+    def echo(value):
+        q.calls.append(value)
+        if q.failures.get(value, 0) > 0:
+            q.failures[value] -= 1
+            raise RuntimeError(f'falha em {value}')
+
+    @q.task('test.periodic', every=60)
+    def periodic():
+        q.calls.append('periodic')
+
+    with m.app.app_context():
+        yield q
+
+
+def _jobs(m):
+    with m.app.app_context():
+        return {j.id: j for j in m.Job.query.all()}
+
+
+def _make_due(m, job_id):
+    with m.app.app_context():
+        m.db.session.get(m.Job, job_id).run_at = time.time() - 1
+        m.db.session.commit()
+
+
+def test_enqueue_dedup_until_done(app_module, queue, counter):
+    m = app_module
+    assert queue.enqueue('test.echo', {'value': 'a'}, dedup_key='k')
+    assert not queue.enqueue('test.echo', {'value': 'b'}, dedup_key='k')
+    assert queue.enqueue_many('test.echo', [({'value': 'c'}, 'k'), ({'value': 'd'}, 'k2'),
+                                            ({'value': 'e'}, 'k2'), ({'value': 'f'}, None)]) == 2
+    assert counter('jobs_deduplicated', task='test.echo') == 3
+
+    queue.work(m.app, threads=2, burst=True, heartbeat=False)
+    assert sorted(queue.calls) == ['a', 'd', 'f', 'periodic']
+    assert [j.name for j in _jobs(m).values()] == ['test.periodic']
+    # Terminado o job, a chave fica livre de novo
+    assert queue.enqueue('test.echo', {'value': 'g'}, dedup_key='k')
+
+
+def test_retry_with_backoff_then_success(app_module, queue):
+    m = app_module
+    queue.failures['a'] = 2
+    queue.enqueue('test.echo', {'value': 'a'}, dedup_key='k')
+
+    for attempt, (low, high) in enumerate([(5.0, 10.0), (10.0, 20.0)], start=1):
+        before = time.time()
+        [job] = queue.claim(1)
+        assert job['attempts'] == attempt
+        queue.run(m.app, job)
+        row = _jobs(m)[job['id']]
+        assert row.status == QUEUED and row.attempts == attempt
+        assert low - 1 <= row.run_at - before <= high + 1
+        assert 'falha em a' in row.last_error
+        assert queue.claim(1) == []  # ainda no backoff
+        assert not queue.enqueue('test.echo', {'value': 'a'}, dedup_key='k')
+        _make_due(m, job['id'])
+
+    [job] = queue.claim(1)
+    queue.run(m.app, job)
+    assert queue.calls == ['a', 'a', 'a']
+    assert _jobs(m) == {}
+
+
+def test_gives_up_after_max_attempts(app_module, queue):
+    m = app_module
+    queue.failures['a'] = 10
+    queue.enqueue('test.echo', {'value': 'a'}, dedup_key='k')
+    for _ in range(3):
+        [job] = queue.claim(1)
+        queue.run(m.app, job)
+        _make_due(m, job['id'])
+    row = _jobs(m)[job['id']]
+    assert row.status == FAILED and row.dedup_key is None
+    assert queue.claim(1) == []
+    assert queue.enqueue('test.echo', {'value': 'a'}, dedup_key='k')  # chave liberada
+
+    with m.app.app_context():
+        assert queue.retry_failed('test.echo') == 1
+    assert _jobs(m)[job['id']].status == QUEUED
+
+
+def test_expired_claim_is_taken_by_another_worker(app_module, queue):
+    m = app_module
+    queue.enqueue('test.echo', {'value': 'a'})
+    [first] = queue.claim(1)
+    assert queue.claim(1) == []
+    with m.app.app_context():
+        m.db.session.get(m.Job, first['id']).locked_until = time.time() - 1
+        m.db.session.commit()
+    [second] = queue.claim(1)
+    assert second['id'] == first['id'] and second['attempts'] == 2
+    assert _jobs(m)[first['id']].status == RUNNING
+
+    queue.run(m.app, first)  # o primeiro worker perdeu a posse: o resultado dele é descartado
+    assert first['id'] in _jobs(m)
+    queue.run(m.app, second)
+    assert _jobs(m) == {}
+
+
+def test_periodic_task_is_rescheduled(app_module, queue):
+    m = app_module
+    queue.work(m.app, threads=1, burst=True, heartbeat=False)
+    assert queue.calls == ['periodic']
+    [row] = _jobs(m).values()
+    assert row.status == QUEUED and row.run_at > time.time() + 50
+    queue.schedule_periodic()
+    assert len(_jobs(m)) == 1
+
+
+def test_retry_delay_is_exponential_with_jitter():
+    task = Task('t', None, max_attempts=5, timeout=1, priority=0, backoff=10.0, max_backoff=35.0, every=None)
+    for attempts, full in ((1, 10.0), (2, 20.0), (3, 35.0), (6, 35.0)):
+        for _ in range(20):
+            assert full / 2 <= task.retry_delay(attempts) <= full
+
+
+def test_fallback_runs_jobs_only_without_worker(app_module, queue):
+    m = app_module
+    queue.enqueue('test.echo', {'value': 'a'})
+    queue._beat('outro-host:1')
+    with m.app.app_context():
+        assert queue.workers_alive() == 1
+    assert not queue.run_if_no_worker(m.app)
+    assert queue.calls == []
+
+    queue._beat('outro-host:1', stopping=True)
+    assert queue.run_if_no_worker(m.app)
+    assert 'a' in queue.calls
+    with m.app.app_context():
+        assert queue.workers_alive() == 0  # o fallback não conta como worker
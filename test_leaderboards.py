@@ -0,0 +1,91 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import database
+
+
+def _review(album_id, rating, title=None, user_id=1):
+    return {'album_id': album_id, 'album_title': title or f'Álbum {album_id}', 'rating': rating,
+            'text': '', 'user_id': user_id}
+
+
+def _stats(m):
+    return {s.album_id: (s.album_title, s.review_count, s.rating_sum, round(s.score, 6))
+            for s in m.AlbumStat.query.all()}
+
+
+def _trends(m):
+    return {(t.period, t.album_id): t.review_count for t in m.AlbumTrend.query.all()}
+
+
+@pytest.fixture(params=['on_conflict', 'portable'])
+def upsert_path(request, monkeypatch):
+    """Roda o teste com o upsert nativo (SQLite) e com o caminho de bancos sem ON CONFLICT."""
+    if request.param == 'portable':
+        monkeypatch.setattr(database, '_on_conflict_insert', lambda conn: None)
+    return request.param
+
+
+def test_record_matches_rebuild(app_module, upsert_path):
+    m = app_module
+    with m.app.app_context():
+        m._save_reviews([_review('a', 5), _review('b', 2), _review('a', 4)])
+        m._save_reviews([_review('a', 3, title='Álbum A (remaster)')])
+        m._save_reviews([_review('c', 1)])
+        recorded_counts = {k: v[1:3] for k, v in _stats(m).items()}
+        recorded_trends = _trends(m)
+
+        m.leaderboards.rebuild()
+        assert {k: v[1:3] for k, v in _stats(m).items()} == recorded_counts == {
+            'a': (3, 12), 'b': (1, 2), 'c': (1, 1)}
+        assert _trends(m) == recorded_trends
+        assert recorded_trends[('7d', 'a')] == 3
+
+        mean = m.leaderboards.global_mean()
+        assert mean == pytest.approx(15 / 5)
+        c = m.leaderboards.prior_weight
+        for album_id, (_, count, total, score) in _stats(m).items():
+            assert score == pytest.approx((c * mean + total) / (c + count))
+
+
+def test_record_uses_current_prior(app_module, upsert_path):
+    m = app_module
+    with m.app.app_context():
+        m._save_reviews([_review('a', 5), _review('a', 5)])
+        m.leaderboards.rebuild()
+        mean = m.leaderboards.global_mean()
+        m._save_reviews([_review('b', 1)])
+        c = m.leaderboards.prior_weight
+        assert _stats(m)['b'][3] == pytest.approx((c * mean + 1) / (c + 1))
+
+
+def test_rebuild_ages_out_trending(app_module):
+    m = app_module
+    with m.app.app_context():
+        old = datetime.utcnow() - timedelta(days=2)
+        m._save_reviews([dict(_review('a', 4), created_at=old), _review('b', 3)])
+        assert _trends(m)[('24h', 'a')] == 1  # record() conta a review na hora em que ela chega
+        m.leaderboards.rebuild()
+        trends = _trends(m)
+        assert ('24h', 'a') not in trends
+        assert trends[('7d', 'a')] == 1
+        assert trends[('24h', 'b')] == 1
+
+
+def test_global_mean_follows_rebuild_in_other_process(app_module, other_process, monkeypatch):
+    m = app_module
+    monkeypatch.setattr(m.leaderboards, 'mean_ttl', 3600)
+    with m.app.app_context():
+        assert m.leaderboards.global_mean() == 3.0
+    other_process('''
+with m.app.app_context():
+    m._save_reviews([{'album_id': 'a', 'album_title': 'A', 'rating': 5, 'text': '', 'user_id': 1}])
+    m.leaderboards.rebuild()
+''')
+    with m.app.app_context():
+        assert m.leaderboards.global_mean() == 3.0  # ainda dentro do TTL
+        cached_mean, read_at = m.leaderboards._global_mean
+        m.leaderboards._global_mean = (cached_mean, time.monotonic() - 3601)
+        assert m.leaderboards.global_mean() == 5.0
@@ -0,0 +1,31 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import passwords
+from conftest import ROOT
+
+
+@pytest.mark.parametrize('method', ['pbkdf2', 'pbkdf2:sha256:1000', 'scrypt:16384:8:1'])
+def test_valid_methods(method):
+    assert passwords.validate_method(method) == method
+    stored = passwords.hash_password('segredo', method)
+    assert passwords.verify_password(stored, 'segredo')
+    assert not passwords.needs_rehash(stored, method)
+    assert passwords.needs_rehash(stored, 'pbkdf2:sha256:2000')
+
+
+@pytest.mark.parametrize('method', ['foo', 'scrypt:abc', 'pbkdf2:md9:10', None])
+def test_invalid_methods(method):
+    with pytest.raises(ValueError, match='PASSWORD_HASH_METHOD'):
+        passwords.validate_method(method)
+
+
+def test_app_refuses_to_start_with_invalid_method():
+    env = dict(os.environ, PASSWORD_HASH_METHOD='sha256')
+    result = subprocess.run([sys.executable, '-c', 'import app'], cwd=ROOT, env=env, capture_output=True,
+                            text=True, timeout=60)
+    assert result.returncode != 0
+    assert "PASSWORD_HASH_METHOD inválido: 'sha256'" in result.stderr
@@ -0,0 +1,107 @@
+import pytest
+import requests
+
+from cache import TTLCache
+from prefetch import Prefetcher
+from upstream import CircuitOpen
+
+OPEN_ALBUM_BREAKER = '''
+import requests
+
+def down():
+    raise requests.ConnectionError('Spotify fora do ar')
+
+with m.app.app_context():
+    for _ in range(m.upstream.failure_threshold):
+        try:
+            m.upstream.call('album', down, cache=False)
+        except requests.ConnectionError:
+            pass
+'''
+
+
+def _prefetcher(m, fetched):
+    def fetch(key):
+        fetched.append(key)
+        return {'id': key}
+    return Prefetcher(m.app, fetch, TTLCache(ttl=60), workers=1, rate=0,
+                      allow=lambda: m.upstream.is_closed('album'))
+
+
+def test_prefetch_runs_while_breaker_closed(app_module, counter):
+    fetched = []
+    prefetcher = _prefetcher(app_module, fetched)
+    assert prefetcher.schedule(['a1', 'a2', 'a1']) == 2
+    prefetcher._queue.join()
+    assert fetched == ['a1', 'a2']
+    assert prefetcher.cache.get('a1') == {'id': 'a1'}
+    assert counter('prefetch_fetched') == 2
+
+
+def test_prefetch_skips_when_another_process_opened_breaker(app_module, counter, other_process):
+    other_process(OPEN_ALBUM_BREAKER)
+    fetched = []
+    prefetcher = _prefetcher(app_module, fetched)
+    assert prefetcher.schedule(['a1']) == 1
+    prefetcher._queue.join()
+    assert fetched == []
+    assert 'a1' not in prefetcher.cache
+    assert counter('prefetch_skipped', reason='upstream') == 1
+
+
+def test_breaker_opened_by_another_process_is_seen_here(app_module, other_process):
+    other_process(OPEN_ALBUM_BREAKER)
+    with app_module.app.app_context():
+        assert not app_module.upstream.is_closed('album')
+        with pytest.raises(CircuitOpen):
+            app_module.upstream.call('album', requests.get, 'http://example.invalid', cache=False)
+
+
+PREFETCH_IN_OTHER_PROCESS = '''
+m.get_album = lambda album_id: {
+    'id': album_id, 'name': 'Album ' + album_id, 'artists': [{'id': 'ar1', 'name': 'Artista'}],
+    'images': [{'url': 'https://img/' + album_id, 'width': 640, 'height': 640}],
+    'tracks': {'items': [{'id': 't1', 'name': 'Faixa', 'track_number': 1, 'duration_ms': 61000}]},
+}
+with m.app.app_context():
+    assert m._fetch_album('x1') is not None
+'''
+
+
+def test_prefetch_from_other_process_counts_as_used_once(app_module, counter, other_process):
+    m = app_module
+    other_process(PREFETCH_IN_OTHER_PROCESS)
+    m.album_cache.clear()
+    client = m.app.test_client()
+
+    response = client.get('/album/x1')
+    assert response.status_code == 200
+    assert b'Album x1' in response.data
+    assert counter('album_cache', result='shared') == 1
+    assert counter('prefetch_used') == 1
+
+    # Outro worker abre o mesmo álbum depois: a marca já foi tirada
+    m.album_cache.clear()
+    assert client.get('/album/x1').status_code == 200
+    assert counter('album_cache', result='shared') == 2
+    assert counter('prefetch_used') == 1
+
+
+def test_prefetcher_loads_shared_item_without_fetching(app_module, counter, other_process):
+    m = app_module
+    other_process(PREFETCH_IN_OTHER_PROCESS)
+    fetched = []
+    prefetcher = _prefetcher(m, fetched)
+    prefetcher.shared = m._shared_album
+    prefetcher.claim = m._claim_prefetched_album
+    prefetcher.schedule(['x1'])
+    prefetcher._queue.join()
+    assert fetched == []
+    assert prefetcher.cache.get('x1').name == 'Album x1'
+    assert counter('prefetch_shared') == 1
+    assert counter('prefetch_fetched') == 0
+
+    with m.app.app_context():
+        prefetcher.mark_used('x1')
+        prefetcher.mark_used('x1')
+    assert counter('prefetch_used') == 1
@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from search_index import REVIEWS_OVERLAP, AlbumIndex
+
+
+def _ids(index, query):
+    return [hit['id'] for _, hit in index.search(query)]
+
+
+@pytest.fixture
+def index():
+    index = AlbumIndex()
+    index.add('a1', 'Midnight Dreams', 'Banda Azul')
+    index.add('a2', 'Coração de Estrela', 'Trio Noite')
+    index.add('a3', 'Midnight City', 'The Neon')
+    return index
+
+
+def test_prefix_and_typo(index):
+    assert set(_ids(index, 'mid')[:2]) == {'a1', 'a3'}
+    assert _ids(index, 'midnight dr')[0] == 'a1'
+    assert _ids(index, 'coracao estrla')[0] == 'a2'  # letra a menos
+    assert _ids(index, 'midnigth cityy')[0] == 'a3'  # letras trocadas e a mais
+    assert _ids(index, 'xyzw') == []
+
+
+def test_update_reindexes_words(index):
+    index.add('a1', 'Velvet Road', 'Banda Azul')
+    assert 'a1' not in _ids(index, 'dreams')
+    assert _ids(index, 'velvet')[0] == 'a1'
+    assert 'dreams' not in index._words and 'dreams' not in index._vocabulary
+    assert not any('dreams' in words for words in index._deletions.values())
+
+
+def test_count_reviews_keeps_indexed_name(index):
+    index.count_reviews('a1', 'midnight dreams (deluxe)', 2)
+    index.count_reviews('a9', 'Só Nas Reviews', 1)
+    docs = {hit['id']: hit['name'] for _, hit in index.search('midnight dreams')}
+    assert docs['a1'] == 'Midnight Dreams'
+    assert index._docs[index._ids['a1']][5] == 2
+    assert _ids(index, 'so nas reviews') == ['a9']
+
+
+def test_add_reviews_watermark():
+    index = AlbumIndex()
+    t0 = datetime(2024, 1, 1, 12, 0)
+    index.reviews_cutoff = t0
+    old = (1, 'a', 'A', t0 - timedelta(days=1), t0 + timedelta(seconds=5))  # edição de review já contada
+    first = (2, 'a', 'A', t0 + timedelta(seconds=10), t0 + timedelta(seconds=10))
+    assert index.add_reviews([old, first]) == 1
+    # Review gravada antes de `first`, mas que só ficou visível depois (commit fora de ordem)
+    late = (3, 'b', 'B', t0 + timedelta(seconds=8), t0 + timedelta(seconds=8))
+    later = (4, 'a', 'A', t0 + timedelta(minutes=20), t0 + timedelta(minutes=20))
+    assert index.add_reviews([first, late, later]) == 2
+    assert index.reviews_cutoff == later[4] - REVIEWS_OVERLAP
+    assert index.add_reviews([later, (4, 'a', 'A', later[3], later[4] + timedelta(seconds=1))]) == 0
+    assert index._docs[index._ids['a']][5] == 2
+    assert index._docs[index._ids['b']][5] == 1
+    assert set(index._counted_reviews) == {4}
+
+
+def test_snapshot_merges_added_albums(index, tmp_path):
+    path = str(tmp_path / 'index.pickle')
+    index.reviews_cutoff = datetime(2024, 1, 1)
+    index.save(path)
+
+    fresh = AlbumIndex()
+    fresh.add('b1', 'Blue Horizon', 'DJ Mar')
+    assert fresh.load(path)
+    assert len(fresh) == 4
+    assert fresh.reviews_cutoff == datetime(2024, 1, 1)
+    assert _ids(fresh, 'blue horizn')[0] == 'b1'
+    assert _ids(fresh, 'midnight cit')[0] == 'a3'
+
+
+def test_index_reviews_incremental(app_module, monkeypatch):
+    m = app_module
+    monkeypatch.setattr(m, 'album_index', AlbumIndex())
+    now = datetime.utcnow()
+    with m.app.app_context():
+        m.album_index.add('sp1', 'Nome do Spotify', 'Artista')
+        m.db.session.add_all([
+            m.Review(album_id='sp1', album_title='título digitado', rating=5, user_id=1,
+                     created_at=now - timedelta(days=3), updated_at=now - timedelta(days=3)),
+            m.Review(album_id='sp2', album_title='Outro Álbum', rating=4, user_id=1,
+                     created_at=now - timedelta(seconds=30), updated_at=now - timedelta(seconds=30)),
+            m.Review(album_id='sp2', album_title='Outro Álbum', rating=2, user_id=2, created_at=None, updated_at=None),
+        ])
+        m.db.session.commit()
+        m._load_album_index()
+        reviews = {hit['id']: (hit['name'], m.album_index._docs[m.album_index._ids[hit['id']]][5])
+                   for query in ('nome spotify', 'outro album') for _, hit in m.album_index.search(query)}
+        assert reviews == {'sp1': ('Nome do Spotify', 1), 'sp2': ('Outro Álbum', 2)}
+
+        # Sincronizar de novo (ou depois de editar uma review) não conta nada duas vezes
+        review = m.Review.query.filter_by(album_id='sp1').one()
+        review.text = 'editada'
+        m.db.session.commit()
+        assert m._sync_album_index() == 0
+
+        m._save_reviews([{'album_id': 'sp1', 'album_title': 'x', 'rating': 3, 'text': '', 'user_id': 3}])
+        assert m.album_index._docs[m.album_index._ids['sp1']][5] == 2
@@ -0,0 +1,42 @@
+from datetime import date
+
+import pytest
+
+import Top5
+
+
+@pytest.fixture
+def top5(app_module, monkeypatch):
+    calls = []
+
+    def top(kind):
+        def fetch(access, limit, time_range):
+            calls.append((access, kind, time_range))
+            return [] if access == 'empty' else [{'id': f'{kind}-{time_range}', 'name': 'Item'}]
+        return fetch
+
+    monkeypatch.setattr(Top5, 'get_user_top_artists', top('artists'))
+    monkeypatch.setattr(Top5, 'get_user_top_tracks', top('tracks'))
+    m = app_module
+    with m.app.app_context():
+        for user_id, access in ((1, 'full'), (2, 'empty')):
+            m.db.session.add(m.User(id=user_id, username=f'u{user_id}', email=f'u{user_id}@example.com',
+                                    password_hash='x', spotify_access_token=access, spotify_refresh_token='r',
+                                    spotify_token_expires=2 ** 31 - 1))
+        m.db.session.commit()
+    return calls
+
+
+def test_users_with_empty_top_lists_are_not_refetched(app_module, top5):
+    m = app_module
+    today = date(2024, 5, 17)
+    limiter = Top5.RateLimiter(1000)
+    with m.app.app_context():
+        assert Top5.pending_user_ids(today) == [1, 2]
+        assert Top5.snapshot_user(1, today, limiter, 5) == 6
+        assert Top5.snapshot_user(2, today, limiter, 5) == 0
+        assert Top5.pending_user_ids(today) == []
+        assert len(top5) == 12
+        # O marcador não aparece como top artista
+        assert m._snapshot_top_artist_ids(2) == []
+        assert m._snapshot_top_artist_ids(1) == ['artists-medium_term']
@@ -0,0 +1,148 @@
+import time
+
+import pytest
+import requests
+
+from domain import Album
+from upstream import CLOSED, HALF_OPEN, OPEN, CircuitOpen
+
+
+def down(*args, **kwargs):
+    raise requests.ConnectionError('fora do ar')
+
+
+def not_found(*args, **kwargs):
+    response = requests.Response()
+    response.status_code = 404
+    raise requests.HTTPError('404', response=response)
+
+
+def album(album_id):
+    return {'id': album_id, 'name': f'Album {album_id}', 'artists': [{'id': 'ar1', 'name': 'Banda'}]}
+
+
+@pytest.fixture
+def upstream(app_module, monkeypatch):
+    """O Upstream do app relendo o estado do banco a cada chamada (sem o cache de sync_interval)."""
+    u = app_module.upstream
+    monkeypatch.setattr(u, 'sync_interval', 0.0)
+    with app_module.app.app_context():
+        yield u
+
+
+def _row(u, endpoint):
+    return {s['endpoint']: s for s in u.states()}.get(endpoint)
+
+
+def _fail(u, endpoint, times):
+    for _ in range(times):
+        with pytest.raises(requests.ConnectionError):
+            u.call(endpoint, down, cache=False)
+
+
+def test_opens_after_consecutive_failures(upstream, counter):
+    u = upstream
+    _fail(u, 'album', u.failure_threshold - 1)
+    assert u.is_closed('album')
+    assert _row(u, 'album')['failures'] == u.failure_threshold - 1
+
+    # Uma resposta boa interrompe a sequência
+    assert u.call('album', lambda: 'ok', cache=False) == ('ok', False)
+    assert _row(u, 'album')['failures'] == 0
+    _fail(u, 'album', u.failure_threshold)
+    assert _row(u, 'album')['state'] == OPEN
+    assert counter('breaker_transitions', from_state=CLOSED, to_state=OPEN) == 1
+
+    calls = []
+    with pytest.raises(CircuitOpen):
+        u.call('album', lambda: calls.append(1), cache=False)
+    assert calls == []
+    assert counter('upstream_calls', endpoint='album', result='short_circuit') == 1
+    # Os outros endpoints têm o próprio disjuntor
+    assert u.call('search', lambda: 'ok', cache=False) == ('ok', False)
+
+
+def test_client_errors_do_not_count(upstream):
+    u = upstream
+    for _ in range(u.failure_threshold + 1):
+        with pytest.raises(requests.HTTPError):
+            u.call('album', not_found, cache=False)
+    assert u.is_closed('album')
+    assert _row(u, 'album') is None
+
+
+@pytest.mark.parametrize('trial, final', [(lambda: 'ok', CLOSED), (down, OPEN)])
+def test_half_open_trial(upstream, monkeypatch, counter, trial, final):
+    u = upstream
+    _fail(u, 'album', u.failure_threshold)
+    monkeypatch.setattr(u, 'reset_timeout', 0.0)
+    try:
+        u.call('album', trial, cache=False)
+    except requests.ConnectionError:
+        pass
+    assert _row(u, 'album')['state'] == final
+    assert counter('breaker_transitions', from_state=OPEN, to_state=HALF_OPEN) == 1
+    assert counter('breaker_transitions', from_state=HALF_OPEN, to_state=final) == 1
+
+
+def test_only_one_trial_call(upstream, monkeypatch):
+    u = upstream
+    _fail(u, 'album', u.failure_threshold)
+    monkeypatch.setattr(u, 'reset_timeout', 0.0)
+    inside = []
+
+    def trial():
+        # Durante a chamada de teste, os outros (com o timeout ainda valendo) não passam
+        monkeypatch.setattr(u, 'reset_timeout', 60.0)
+        assert _row(u, 'album')['state'] == HALF_OPEN
+        with pytest.raises(CircuitOpen):
+            u.call('album', lambda: inside.append(1), cache=False)
+        return 'ok'
+
+    assert u.call('album', trial, cache=False) == ('ok', False)
+    assert inside == []
+    assert u.is_closed('album')
+
+
+def test_stale_fallback(upstream, counter):
+    u = upstream
+    assert u.call('album', album, 'x1', model=Album)[0].name == 'Album x1'
+    value, stale = u.call('album', down, 'x1', model=Album)
+    assert stale and value.name == 'Album x1' and value.artist_names == 'Banda'
+    with pytest.raises(requests.ConnectionError):
+        u.call('album', down, 'x2', model=Album)
+    assert counter('upstream_fallbacks', endpoint='album', result='miss') == 1
+
+    _fail(u, 'album', u.failure_threshold - 2)  # as duas falhas acima também contam
+    assert not u.is_closed('album')
+    value, stale = u.call('album', down, 'x1', model=Album)
+    assert stale and value.id == 'x1'
+    with pytest.raises(CircuitOpen):
+        u.call('album', album, 'x2', model=Album)
+    assert counter('upstream_fallbacks', endpoint='album', result='stale') == 2
+
+
+def test_fresh_and_claim(upstream):
+    u = upstream
+    u.call('album', album, 'x1', source='prefetch')
+    assert u.fresh('album', 'x1', max_age=60)['name'] == 'Album x1'
+    assert u.fresh('album', 'x1', max_age=-1) is None
+    # Uma gravação sem marca (outro worker abrindo a página) não apaga a do prefetch
+    u._recent_writes.clear()
+    u.call('album', album, 'x1')
+    assert u.claim('album', 'x1', source='prefetch')
+    assert not u.claim('album', 'x1', source='prefetch')
+    assert not u.claim('album', 'x2', source='prefetch')
+
+
+def test_purge(upstream, app_module):
+    u = upstream
+    for i in range(5):
+        u.call('album', album, f'x{i}')
+    table = app_module.UpstreamCache.__table__
+    with app_module.db.engine.begin() as conn:
+        conn.execute(table.update().where(table.c.key == u._cache_key('album', ('x0',), {}))
+                     .values(fetched_at=time.time() - 3600))
+    assert u.purge(600) == 1
+    assert u.purge(600, max_rows=2) == 2
+    assert [u.fresh('album', f'x{i}', max_age=60) is not None for i in range(5)] == [False, False, False, True, True]
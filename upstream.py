@@ -0,0 +1,334 @@
+import hashlib
+import json
+import threading
+import time
+
+import requests
+from sqlalchemy import delete, or_, select, update
+
+import metrics
+from cache import TTLCache
+from database import insert_ignore
+from json_provider import dumps_bytes
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Versão do formato salvo no cache: entra na chave, então respostas num formato antigo são ignoradas
+# (e apagadas por `purge`)
+CACHE_FORMAT = 2
+
+
+class CircuitOpen(Exception):
+    """The endpoint's breaker is open and there is no cached response to fall back to."""
+
+    def __init__(self, endpoint):
+        super().__init__(f'Circuito aberto para {endpoint}')
+        self.endpoint = endpoint
+
+
+def _parse(value, parse):
+    """Apply `parse` to a payload, or to each item when the payload is a list."""
+    if isinstance(value, list):
+        return [parse(item) for item in value if item]
+    return parse(value) if value else value
+
+
+def is_upstream_failure(exc):
+    """Errors that say the upstream is unhealthy: timeouts, connection errors, 429 and 5xx.
+
+    Other 4xx and configuration errors are the caller's problem and do not
+    count against the breaker.
+    """
+    if isinstance(exc, requests.HTTPError):
+        resp = exc.response
+        return resp is None or resp.status_code == 429 or resp.status_code >= 500
+    return isinstance(exc, (requests.ConnectionError, requests.Timeout))
+
+
+class Upstream:
+    """Circuit breakers per upstream endpoint, plus a last-known-good response cache.
+
+    Breaker state lives in `state_model`'s table, so every worker sees the
+    same closed/open/half-open state (each process re-reads it at most every
+    `sync_interval` seconds). After `failure_threshold` consecutive failures the
+    breaker opens and calls fail fast for `reset_timeout` seconds; then one
+    worker wins a conditional UPDATE and makes a trial call (half-open) that
+    closes or re-opens it.
+
+    Successful responses are saved in `cache_model`'s table (at most once per
+    `cache_write_interval` per key and process). While the breaker is open, or
+    when the call fails, `call()` returns that saved response marked as stale.
+    With a `model` (domain.Album, domain.Track) only the compact `to_dict()`
+    form is saved, and `purge()` keeps the table bounded. A response saved
+    with a `source` (e.g. by a prefetch) keeps that mark until `claim()`.
+
+    Breaker bookkeeping uses its own connection, never the caller's session,
+    and a database error there never fails the upstream call.
+    """
+
+    def __init__(self, db, state_model, cache_model, failure_threshold=5, reset_timeout=30.0,
+                 sync_interval=1.0, cache_write_interval=60.0, logger=None):
+        self.db = db
+        self.State = state_model
+        self.Cache = cache_model
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.sync_interval = sync_interval
+        self.logger = logger
+        # endpoint -> (state, failures, opened_at, lido em monotonic)
+        self._states = {}
+        self._lock = threading.Lock()
+        self._recent_writes = TTLCache(ttl=cache_write_interval, maxsize=4096)
+        # Respostas salvas já lidas do banco durante uma falha (evita reler a cada requisição)
+        self._stale = TTLCache(ttl=reset_timeout, maxsize=256)
+
+    # --- Chamada protegida ---
+
+    def call(self, endpoint, func, *args, cache=True, model=None, source=None, **kwargs):
+        """Call `func(*args, **kwargs)` through the `endpoint` breaker.
+
+        Returns `(value, stale)`. With `cache=False` (e.g. calls carrying a
+        user token) nothing is saved and an open breaker raises `CircuitOpen`.
+        With `model`, the payload (or each item of a list payload) is parsed
+        with `model.from_spotify`, and saved responses are rebuilt with
+        `model.from_dict`. `source` (e.g. 'prefetch') marks the saved
+        response until someone `claim()`s it.
+        """
+        key = self._cache_key(endpoint, args, kwargs) if cache else None
+        state, opened_at = self._state(endpoint)
+        if state != CLOSED and not self._try_half_open(endpoint, state, opened_at):
+            metrics.incr('upstream_calls', endpoint=endpoint, result='short_circuit')
+            return self._fallback(endpoint, key, None, model)
+
+        started = time.monotonic()
+        try:
+            value = func(*args, **kwargs)
+        except Exception as e:
+            metrics.observe('upstream_latency_seconds', time.monotonic() - started, endpoint=endpoint)
+            if not is_upstream_failure(e):
+                raise
+            metrics.incr('upstream_calls', endpoint=endpoint, result='failure')
+            self._record_failure(endpoint)
+            return self._fallback(endpoint, key, e, model)
+
+        metrics.observe('upstream_latency_seconds', time.monotonic() - started, endpoint=endpoint)
+        metrics.incr('upstream_calls', endpoint=endpoint, result='success')
+        self._record_success(endpoint)
+        if model is not None:
+            value = _parse(value, model.from_spotify)
+        if key is not None:
+            self._save(endpoint, key, value, source)
+        return value, False
+
+    def fresh(self, endpoint, *args, max_age, model=None, **kwargs):
+        """The saved response of `endpoint(*args, **kwargs)` if it is at most `max_age` seconds old, else None.
+
+        The table is shared by every worker, so a response fetched by one of
+        them (e.g. a prefetch) saves the others a call to the upstream.
+        """
+        key = self._cache_key(endpoint, args, kwargs)
+        table = self.Cache.__table__
+        try:
+            with self.db.engine.connect() as conn:
+                payload = conn.execute(select(table.c.payload).where(
+                    table.c.key == key, table.c.fetched_at >= time.time() - max_age)).scalar()
+        except Exception as e:
+            self._log(f'Falha ao ler resposta salva de {endpoint}: {e}')
+            return None
+        if payload is None:
+            return None
+        value = json.loads(payload)
+        return _parse(value, model.from_dict) if model is not None else value
+
+    def claim(self, endpoint, *args, source, **kwargs):
+        """Clear the `source` mark of the saved response of `endpoint(*args, **kwargs)`.
+
+        Returns True only for the one caller, across workers, that found the
+        mark and cleared it (e.g. to count a prefetched item as used once).
+        """
+        key = self._cache_key(endpoint, args, kwargs)
+        table = self.Cache.__table__
+        try:
+            with self.db.engine.begin() as conn:
+                return conn.execute(update(table).where(table.c.key == key, table.c.source == source)
+                                    .values(source=None)).rowcount == 1
+        except Exception as e:
+            self._log(f'Falha ao marcar resposta salva de {endpoint} como usada: {e}')
+            return False
+
+    def purge(self, max_age, max_rows=None):
+        """Delete saved responses older than `max_age` seconds and, with `max_rows`, all but the newest ones."""
+        table = self.Cache.__table__
+        with self.db.engine.begin() as conn:
+            deleted = conn.execute(delete(table).where(table.c.fetched_at < time.time() - max_age)).rowcount
+            if max_rows:
+                cutoff = conn.execute(select(table.c.fetched_at).order_by(table.c.fetched_at.desc())
+                                      .offset(max_rows).limit(1)).scalar()
+                if cutoff is not None:
+                    deleted += conn.execute(delete(table).where(table.c.fetched_at <= cutoff)).rowcount
+        metrics.incr('upstream_cache_purged', deleted)
+        return deleted
+
+    def is_closed(self, endpoint):
+        """True while `endpoint` is healthy; optional work (prefetch) should wait otherwise."""
+        return self._state(endpoint)[0] == CLOSED
+
+    def states(self):
+        """Current state of every breaker, read from the database."""
+        rows = self.db.session.execute(select(self.State.__table__)).all()
+        now = time.time()
+        return [{
+            'endpoint': r.endpoint, 'state': r.state, 'failures': r.failures,
+            'open_for': round(now - r.opened_at, 1) if r.state != CLOSED and r.opened_at else None,
+        } for r in rows]
+
+    # --- Estado do disjuntor ---
+
+    def _state(self, endpoint):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._states.get(endpoint)
+        if cached and now - cached[3] < self.sync_interval:
+            return cached[0], cached[2]
+        try:
+            table = self.State.__table__
+            with self.db.engine.connect() as conn:
+                row = conn.execute(select(table).where(table.c.endpoint == endpoint)).first()
+            state = (row.state, row.failures, row.opened_at) if row else (CLOSED, 0, None)
+        except Exception as e:
+            self._log(f'Falha ao ler o estado do disjuntor {endpoint}: {e}')
+            state = cached[:3] if cached else (CLOSED, 0, None)
+        self._remember(endpoint, *state)
+        return state[0], state[2]
+
+    def _remember(self, endpoint, state, failures, opened_at):
+        with self._lock:
+            self._states[endpoint] = (state, failures, opened_at, time.monotonic())
+
+    def _try_half_open(self, endpoint, state, opened_at):
+        """Let exactly one caller (across workers) make the trial call once the timeout has passed."""
+        now = time.time()
+        if opened_at is not None and now - opened_at < self.reset_timeout:
+            return False
+        table = self.State.__table__
+        try:
+            with self.db.engine.begin() as conn:
+                # Meio-aberto há mais de reset_timeout: a chamada de teste travou ou o worker morreu
+                result = conn.execute(update(table).where(
+                    table.c.endpoint == endpoint, table.c.state == state,
+                    table.c.opened_at == opened_at,
+                ).values(state=HALF_OPEN, opened_at=now, updated_at=now))
+        except Exception as e:
+            self._log(f'Falha ao atualizar o disjuntor {endpoint}: {e}')
+            return False
+        if result.rowcount != 1:
+            # Outro worker ganhou: relê o estado na próxima chamada
+            with self._lock:
+                self._states.pop(endpoint, None)
+            return False
+        self._transition(endpoint, state, HALF_OPEN)
+        self._remember(endpoint, HALF_OPEN, 0, now)
+        return True
+
+    def _record_success(self, endpoint):
+        # Decide pela linha compartilhada, não pelo estado em memória: outro worker pode ter
+        # somado falhas desde a última leitura, e esta resposta boa interrompe a sequência
+        table = self.State.__table__
+        try:
+            with self.db.engine.connect() as conn:
+                row = conn.execute(select(table.c.state, table.c.failures).where(table.c.endpoint == endpoint)).first()
+            if row is None or (row.state == CLOSED and row.failures == 0):
+                self._remember(endpoint, CLOSED, 0, None)
+                return
+            with self.db.engine.begin() as conn:
+                previous = conn.execute(select(table.c.state).where(table.c.endpoint == endpoint)).scalar()
+                conn.execute(update(table).where(
+                    table.c.endpoint == endpoint, or_(table.c.state != CLOSED, table.c.failures != 0),
+                ).values(state=CLOSED, failures=0, opened_at=None, updated_at=time.time()))
+        except Exception as e:
+            self._log(f'Falha ao fechar o disjuntor {endpoint}: {e}')
+            return
+        if previous and previous != CLOSED:
+            self._transition(endpoint, previous, CLOSED)
+        self._remember(endpoint, CLOSED, 0, None)
+
+    def _record_failure(self, endpoint):
+        table = self.State.__table__
+        now = time.time()
+        try:
+            with self.db.engine.begin() as conn:
+                result = conn.execute(update(table).where(table.c.endpoint == endpoint).values(
+                    failures=table.c.failures + 1, updated_at=now))
+                if result.rowcount == 0:
+                    insert_ignore(conn, table, {'endpoint': endpoint, 'state': CLOSED, 'failures': 0, 'updated_at': now})
+                    conn.execute(update(table).where(table.c.endpoint == endpoint).values(
+                        failures=table.c.failures + 1, updated_at=now))
+                row = conn.execute(select(table).where(table.c.endpoint == endpoint)).one()
+                opened = False
+                if row.state == HALF_OPEN or (row.state == CLOSED and row.failures >= self.failure_threshold):
+                    opened = conn.execute(update(table).where(
+                        table.c.endpoint == endpoint, table.c.state == row.state,
+                    ).values(state=OPEN, opened_at=now)).rowcount == 1
+        except Exception as e:
+            self._log(f'Falha ao registrar erro no disjuntor {endpoint}: {e}')
+            return
+        if opened:
+            self._transition(endpoint, row.state, OPEN)
+            self._remember(endpoint, OPEN, row.failures, now)
+        else:
+            self._remember(endpoint, row.state, row.failures, row.opened_at)
+
+    def _transition(self, endpoint, old, new):
+        metrics.incr('breaker_transitions', endpoint=endpoint, from_state=old, to_state=new)
+        self._log(f'Disjuntor {endpoint}: {old} -> {new}', level='warning')
+
+    # --- Última resposta boa ---
+
+    @staticmethod
+    def _cache_key(endpoint, args, kwargs):
+        raw = json.dumps([CACHE_FORMAT, endpoint, args, kwargs], sort_keys=True, default=str)
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def _save(self, endpoint, key, value, source=None):
+        # Uma resposta marcada (`source`) é sempre gravada; sem marca, a de outra origem é mantida
+        if source is None and key in self._recent_writes:
+            return
+        self._recent_writes.set(key, True)
+        table = self.Cache.__table__
+        row = {'key': key, 'endpoint': endpoint, 'payload': dumps_bytes(value).decode('utf-8'), 'fetched_at': time.time()}
+        if source is not None:
+            row['source'] = source
+        try:
+            with self.db.engine.begin() as conn:
+                if conn.execute(update(table).where(table.c.key == key).values(**row)).rowcount == 0:
+                    insert_ignore(conn, table, row)
+        except Exception as e:
+            self._log(f'Falha ao salvar resposta de {endpoint}: {e}')
+
+    def _fallback(self, endpoint, key, error, model=None):
+        value = self._stale.get(key) if key is not None else None
+        if value is None and key is not None:
+            try:
+                table = self.Cache.__table__
+                with self.db.engine.connect() as conn:
+                    payload = conn.execute(select(table.c.payload).where(table.c.key == key)).scalar()
+                if payload is not None:
+                    value = json.loads(payload)
+                    if model is not None:
+                        value = _parse(value, model.from_dict)
+                    self._stale.set(key, value)
+            except Exception as e:
+                self._log(f'Falha ao ler resposta salva de {endpoint}: {e}')
+        if value is None:
+            metrics.incr('upstream_fallbacks', endpoint=endpoint, result='miss')
+            if error is not None:
+                raise error
+            raise CircuitOpen(endpoint)
+        metrics.incr('upstream_fallbacks', endpoint=endpoint, result='stale')
+        return value, True
+
+    def _log(self, message, level='debug'):
+        if self.logger is not None:
+            getattr(self.logger, level)(message)